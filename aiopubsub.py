@@ -0,0 +1,176 @@
+"""
+asyncio flavour of the Twitch PubSub client (Python 3.5+ only).
+
+Connection, LISTEN, PING/PONG, message handling and shutdown all run as tasks
+of a single event loop: no thread is spawned, so many connections can share one
+process, and closing a client deterministically cancels everything it started.
+A lost connection (or a PONG which never came) is reconnected after a backoff delay,
+and LISTENs to the same topics again.
+"""
+import asyncio
+import json
+import logging
+
+import websockets
+
+from reconnect import backoff_delay
+
+try:
+    current_task = asyncio.current_task
+except AttributeError:
+    # Python < 3.7
+    current_task = asyncio.Task.current_task
+
+
+class AsyncPubSubClient(object):
+
+    def __init__(self, ws_host, topics, auth_token, on_message, ping_interval=30, log=None, on_ping=None,
+                 pong_pending=None, pong_timeout=10, backoff=1.0, backoff_max=120.0):
+        self.ws_host = ws_host
+        self.topics = topics
+        self.auth_token = auth_token
+        # Called as on_message(client, message), like WebSocketApp callbacks
+        self.on_message = on_message
+        # Called as on_ping(client) every time we send a PING,
+        # and pong_pending(client) tells if its PONG is still missing pong_timeout seconds later
+        self.on_ping = on_ping
+        self.pong_pending = pong_pending
+        self.pong_timeout = pong_timeout
+        self.ping_interval = ping_interval
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.log = log or logging.getLogger('twitch_bits_info')
+
+        self.ws = None
+        self._task = None
+        self._reconnect_requested = False
+        # How many times we connected
+        self.connections = 0
+
+    async def run(self):
+        """
+        Connect, subscribe to our topics, then handle messages,
+        and do it all over again each time the connection is lost,
+        until this task is cancelled by close().
+        """
+        self._task = current_task()
+        attempt = 0
+        try:
+            while True:
+                try:
+                    self.ws = await websockets.connect(self.ws_host)
+                except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+                    delay = backoff_delay(attempt, self.backoff, self.backoff_max)
+                    self.log.warning('Could not connect to PubSub ({}), retrying in {:.1f}s'.format(e, delay))
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+
+                attempt = 0
+                self.connections += 1
+                self._reconnect_requested = False
+                await self._serve()
+                if self._reconnect_requested:
+                    # PubSub asked for it, we already know where to go
+                    continue
+
+                delay = backoff_delay(attempt, self.backoff, self.backoff_max)
+                self.log.warning('PubSub connection lost, reconnecting in {:.1f}s'.format(delay))
+                attempt += 1
+                await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.log.info('Terminating...')
+
+    async def _serve(self):
+        """
+        Subscribe to our topics, then handle messages until the connection is closed.
+        """
+        keep_alive = None
+        try:
+            await self.sub_to_topics()
+            keep_alive = asyncio.ensure_future(self.keep_alive())
+            while True:
+                message = await self.ws.recv()
+                try:
+                    self.on_message(self, message)
+                except Exception:
+                    # Like WebSocketApp callbacks: one bad message must not stop the client
+                    self.log.exception('Error while handling a PubSub message')
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if keep_alive is not None:
+                keep_alive.cancel()
+            await self.ws.close()
+
+    def close(self):
+        """
+        Cancel the run() task. Must be called from the event loop thread,
+        use loop.call_soon_threadsafe(client.close) from any other thread.
+        """
+        if self._task is not None:
+            self._task.cancel()
+
+    def reconnect(self):
+        """
+        Drop the current connection, run() connects again right away.
+        Must be called from the event loop thread.
+        """
+        if self.ws is not None:
+            self._reconnect_requested = True
+            asyncio.ensure_future(self.ws.close())
+
+    async def keep_alive(self):
+        """
+        send the ping message,
+        then wait ping_interval seconds and ping again...
+        so socket isn't closed
+        """
+        while True:
+            await self.ping()
+            if self.pong_pending is None:
+                await asyncio.sleep(self.ping_interval)
+                continue
+
+            await asyncio.sleep(self.pong_timeout)
+            if self.pong_pending(self):
+                self.log.warning('No PONG from PubSub after {}s, reconnecting'.format(self.pong_timeout))
+                await self.ws.close()
+                return
+            await asyncio.sleep(max(0, self.ping_interval - self.pong_timeout))
+
+    async def send_data(self, data):
+        """
+        ws.send wants a json object, and not a Python obj, we take care of that.
+        """
+        await self.ws.send(json.dumps(data))
+
+    async def sub_to_topics(self):
+        data = {
+            "type": "LISTEN",
+            "data": {
+                "topics": self.topics,
+                "auth_token": self.auth_token,
+            }
+        }
+        await self.send_data(data)
+
+    async def ping(self):
+        if self.on_ping is not None:
+            self.on_ping(self)
+        await self.send_data({"type": "PING"})
+
+
+def run_clients(loop, clients):
+    """
+    Run every client on loop, until all of them are done.
+    """
+    async def run_all():
+        # A client which fails must not cancel the others
+        results = await asyncio.gather(*[client.run() for client in clients], return_exceptions=True)
+        for client, result in zip(clients, results):
+            if isinstance(result, Exception):
+                client.log.error('PubSub client stopped: {!r}'.format(result))
+
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(run_all())
@@ -1,16 +1,26 @@
+from collections import deque
 import logging
+import threading
 
 try:
+    import ConfigParser as configparser
     import thread
     import Tkinter as tk
     import ttk
     import ScrolledText as tkst
+    import tkFileDialog as filedialog
+    import tkMessageBox as messagebox
+    import tkSimpleDialog as simpledialog
 except ImportError:
+    import configparser
     import _thread as thread
     import tkinter as tk
     import tkinter.ttk as ttk
     import tkinter.scrolledtext as tkst
+    from tkinter import filedialog, messagebox, simpledialog
 
+from cmstorage import read_catalog
+import metrics
 from twitchbitsinfo import TwitchBitsInfo
 
 logger = logging.getLogger('twitch_bits_info')
@@ -37,13 +47,83 @@ class CMTk(tk.Tk):
                                         command=self.manual_update_json)
         self.update_button.pack(side=tk.TOP, padx=12, pady=12)
 
+        # Bulk catalog operations, next to the manual update
+        self.bulk_buttons = []
+        for text, command in (('Reset catalog', self.reset_catalog),
+                              ('Import catalog', self.import_catalog),
+                              ('Merge catalog', self.merge_catalog),
+                              ('Remove games', self.remove_games)):
+            button = ttk.Button(parent, text=text, state=tk.DISABLED, command=command)
+            button.pack(side=tk.TOP, padx=12, pady=4)
+            self.bulk_buttons.append(button)
+
+        self.metrics_button = ttk.Button(parent, text='Show metrics', state=tk.NORMAL,
+                                         command=self.show_metrics)
+        self.metrics_button.pack(side=tk.TOP, padx=12, pady=12)
+
+        self.profile_button = ttk.Button(parent, text='Profile', state=tk.DISABLED,
+                                         command=self.start_profiling)
+        self.profile_button.pack(side=tk.TOP, padx=12, pady=12)
+
+    def show_metrics(self):
+        for name, value in sorted(metrics.REGISTRY.snapshot().items()):
+            logger.info('{}: {}'.format(name, value))
+        for handler in logger.handlers:
+            if isinstance(handler, TextHandler):
+                logger.info('Log console: {} records dropped, {} coalesced'.format(
+                    handler.dropped, handler.coalesced))
+
+    def start_profiling(self):
+        self.bits.start_profiling()
+
     def manual_update_json(self):
-        self.bits.cm.update_trending_games()
+        for cm in self.bits.consoleminis.values():
+            cm.update_trending_games()
+
+    def reset_catalog(self):
+        if messagebox.askyesno('Reset catalog', 'Reset the bits and priority of every game?'):
+            self.run_bulk('reset_all')
+
+    def import_catalog(self):
+        filepath = filedialog.askopenfilename(title='Import catalog',
+                                              filetypes=[('Catalogs', '*.json *.csv'), ('All files', '*')])
+        if filepath and messagebox.askyesno('Import catalog', 'Replace every game with {}?'.format(filepath)):
+            self.run_bulk('import_catalog', read_catalog, filepath)
+
+    def merge_catalog(self):
+        filepath = filedialog.askopenfilename(title='Merge catalog',
+                                              filetypes=[('Catalogs', '*.json *.csv'), ('All files', '*')])
+        if filepath:
+            self.run_bulk('merge_catalog', read_catalog, filepath)
+
+    def remove_games(self):
+        game_ids = simpledialog.askstring('Remove games', 'Game ids to remove (e.g. CM12 CM13):')
+        if game_ids:
+            # Remember: game_ids in JSON are in UPPERCASE.
+            self.run_bulk('remove_games', lambda game_ids: game_ids.replace(',', ' ').upper().split(), game_ids)
+
+    def run_bulk(self, operation, read=None, source=None):
+        """
+        Apply a ConsoleMini bulk operation to every channel, out of the Tk thread:
+        read(source) gives its argument, when it takes one.
+        """
+        def run():
+            try:
+                operation_args = (read(source),) if read is not None else ()
+                for cm in self.bits.consoleminis.values():
+                    getattr(cm, operation)(*operation_args)
+            except Exception:
+                logger.exception('Could not {}'.format(operation))
+
+        thread.start_new_thread(run, ())
 
     def start_twitch_bits_info(self):
         self.start_button.config(state=tk.DISABLED)
         self.stop_button.config(state=tk.NORMAL)
         self.update_button.config(state=tk.NORMAL)
+        for button in self.bulk_buttons:
+            button.config(state=tk.NORMAL)
+        self.profile_button.config(state=tk.NORMAL)
         self.bits = TwitchBitsInfo()
 
         def run(*args):
@@ -59,32 +139,81 @@ class CMTk(tk.Tk):
         self.start_button.config(state=tk.NORMAL)
         self.stop_button.config(state=tk.DISABLED)
         self.update_button.config(state=tk.DISABLED)
+        for button in self.bulk_buttons:
+            button.config(state=tk.DISABLED)
+        self.profile_button.config(state=tk.DISABLED)
         self.bits.shutdown()
 
 
 class TextHandler(logging.StreamHandler):
     """
     This class allows you to log to a Tkinter Text or ScrolledText widget.
+
+    Records can come from any thread, they are buffered and inserted all at once
+    every flush_interval milliseconds, by the Tk thread itself.
+    Only the last max_lines lines are kept: older buffered records are dropped
+    before they even reach the widget.
     """
-    def __init__(self, text):
-        # run the regular StreamHandler __init__
+    def __init__(self, text, max_lines=1000, flush_interval=100):
         logging.StreamHandler.__init__(self)
         # Store a reference to the Text it will log to
         self.text = text
+        self.max_lines = max_lines
+        self.flush_interval = flush_interval
+
+        self._pending = deque()
+        self._pending_lock = threading.Lock()
+        # Records which never made it to the widget, and records which shared an insert with others
+        self.dropped = 0
+        self.coalesced = 0
+
+        # Must be created from the Tk thread, it's the only one touching the widget
+        self.text.after(self.flush_interval, self.flush_pending)
 
     def emit(self, record):
         msg = self.format(record)
 
-        def append():
+        with self._pending_lock:
+            self._pending.append(msg)
+            if len(self._pending) > self.max_lines:
+                self._pending.popleft()
+                self.dropped += 1
+
+    def flush_pending(self):
+        with self._pending_lock:
+            pending, self._pending = self._pending, deque()
+
+        if pending:
+            self.coalesced += len(pending) - 1
             self.text.configure(state=tk.NORMAL)
-            self.text.insert(tk.END, msg + '\n')
+            self.text.insert(tk.END, '\n'.join(pending) + '\n')
+
+            # The text always ends with an empty line
+            lines = int(self.text.index('end-1c').split('.')[0]) - 1
+            if lines > self.max_lines:
+                self.text.delete('1.0', '{}.0'.format(lines - self.max_lines + 1))
             self.text.configure(state=tk.DISABLED)
 
             # Autoscroll to the bottom
             self.text.yview(tk.END)
 
-        # This is necessary because we can't modify the Text from other threads
-        self.text.after(0, append)
+        self.text.after(self.flush_interval, self.flush_pending)
+
+
+def get_gui_options():
+    """
+    Optional log console settings, from the 'config' section of config.ini.
+    """
+    config = configparser.ConfigParser()
+    config.read('config.ini')
+    if not config.has_section('config'):
+        return {}
+    options = dict(config.items('config'))
+    return dict((option, int(options[config_option]))
+                for option, config_option in (('max_lines', 'gui_log_max_lines'),
+                                              ('flush_interval', 'gui_log_flush_interval'))
+                if config_option in options)
+
 
 if __name__ == "__main__":
     # Create Tk object instance
@@ -92,7 +221,7 @@ if __name__ == "__main__":
     app.title('ConsoleMini')
 
     # Create TextHandler
-    text_handler = TextHandler(app.log_text)
+    text_handler = TextHandler(app.log_text, **get_gui_options())
     logger.addHandler(text_handler)
     logger.setLevel(logging.INFO)
 
@@ -0,0 +1,76 @@
+"""
+Benchmark of ConsoleMini bulk catalog operations on a large catalog,
+against the same changes made one write_db call per game:
+    python benchmarks/bench_bulk.py --games 100000
+    python benchmarks/bench_bulk.py --games 100000 --db-storage sqlite
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from consolemini import ConsoleMini  # noqa: E402
+
+
+def make_catalog(count, offset=0):
+    return dict(('CM{}'.format(index), {'game_name': 'Game {}'.format(index),
+                                        'total_bits': index % 1000, 'priority': 10})
+                for index in range(offset, offset + count))
+
+
+def timed(name, count, function, *args):
+    start = time.time()
+    function(*args)
+    elapsed = time.time() - start
+    print('{:>24}: {:8.1f} ms ({:.2f} us/game)'.format(name, elapsed * 1000, elapsed / count * 1e6))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--db-storage', default='json', choices=['json', 'journal', 'sqlite'])
+    parser.add_argument('--write-db-calls', type=int, default=20,
+                        help='how many write_db calls to time, to extrapolate the one per game baseline')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_bulk_')
+    db_filepath = os.path.join(workdir, 'consolemini.json')
+    with open(db_filepath, 'w') as f:
+        json.dump(make_catalog(args.games), f)
+    log = logging.getLogger('bench_bulk')
+    log.setLevel(logging.WARNING)
+    cm = ConsoleMini(db_filepath=db_filepath, log=log, flush_interval=0, flush_every=0,
+                     db_storage=args.db_storage)
+
+    # A tenth of the catalog is new, the rest renames existing games
+    merged = make_catalog(args.games, offset=args.games - args.games // 10)
+    timed('reset_all', args.games, cm.reset_all)
+    timed('import_catalog', args.games, cm.import_catalog, make_catalog(args.games))
+    timed('merge_catalog', args.games, cm.merge_catalog, merged)
+    removed = ['CM{}'.format(index) for index in range(0, args.games, 10)]
+    timed('remove_games (10%)', len(removed), cm.remove_games, removed)
+
+    def write_db_per_game():
+        for game_id in sorted(cm.cm_data)[:args.write_db_calls]:
+            game = cm.read_db(game_id)
+            game['total_bits'] = 0
+            cm.write_db(game_id=game_id, current_game=game)
+
+    elapsed = timed('write_db per game', args.write_db_calls, write_db_per_game)
+    print('{:>24}: {:8.1f} s, extrapolated for a reset of {} games'.format(
+        'write_db per game', elapsed / args.write_db_calls * args.games, args.games))
+
+    cm.close()
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
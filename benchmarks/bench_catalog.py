@@ -0,0 +1,75 @@
+"""
+Memory and scan-time benchmark of the in-memory catalog: plain dicts, as loaded from
+consolemini.json, against the GameRecord ConsoleMini keeps:
+    python benchmarks/bench_catalog.py --games 100000
+"""
+import argparse
+import heapq
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from consolemini import GameRecord, game_records  # noqa: E402
+
+
+def make_catalog_text(count):
+    return json.dumps(dict(('CM{}'.format(index), {'game_name': 'Game {}'.format(index),
+                                                   'total_bits': index * 7 % 5000, 'priority': 10})
+                           for index in range(count)), indent=2, sort_keys=True)
+
+
+def catalog_size(build):
+    """
+    Bytes allocated by the catalog build() returns, once built.
+    """
+    tracemalloc.start()
+    catalog = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del catalog
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--games', type=int, default=100000)
+    args = parser.parse_args()
+
+    text = make_catalog_text(args.games)
+    dicts = json.loads(text)
+    records = game_records(dicts)
+
+    # Both share the same game_id and game_name strings, only the records differ
+    dict_size = catalog_size(lambda: dict((game_id, dict(game)) for game_id, game in dicts.items()))
+    record_size = catalog_size(lambda: game_records(dicts))
+    print('{:>8}: {:6.1f} MB ({} bytes/game)'.format('dicts', dict_size / 1e6, dict_size // args.games))
+    print('{:>8}: {:6.1f} MB ({} bytes/game)'.format('records', record_size / 1e6, record_size // args.games))
+
+    scans = (
+        ('dicts', 'ties', lambda: [game_id for game_id, game in dicts.items() if game['total_bits'] == 700]),
+        ('records', 'ties', lambda: [game_id for game_id, game in records.items() if game.total_bits == 700]),
+        ('dicts', 'top 10', lambda: heapq.nsmallest(10, dicts.items(), key=lambda item: (
+            -item[1]['total_bits'], item[1]['priority'], item[0]))),
+        ('records', 'top 10', lambda: heapq.nsmallest(10, records.items(), key=lambda item: (
+            -item[1].total_bits, item[1].priority, item[0]))),
+        ('dicts', 'reset', lambda: [game.update(total_bits=0, priority=10) for game in dicts.values()]),
+        ('records', 'reset', lambda: [(setattr(game, 'total_bits', 0), setattr(game, 'priority', 10))
+                                      for game in records.values()]),
+    )
+    for name, scan, function in scans:
+        elapsed = min(timeit.repeat(function, number=1, repeat=5))
+        print('{:>8}: {:>6} scan {:7.1f} ms'.format(name, scan, elapsed * 1000))
+
+    # What is written back is still consolemini.json
+    records = game_records(json.loads(text))
+    assert json.dumps(records, default=GameRecord.to_dict, indent=2, sort_keys=True) == text
+    print('round-trip to the same JSON: ok')
+
+
+if __name__ == '__main__':
+    main()
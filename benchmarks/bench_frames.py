@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of PubSub frames decoding and dispatch in TwitchBitsInfo.on_message,
+against the previous decoding code (eager debug formatting, nested message always decoded):
+    python benchmarks/bench_frames.py
+ConsoleMini is left out: cheers are handed to a null ConsoleMini.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import timeit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import twitchbitsinfo  # noqa: E402
+from twitchbitsinfo import TwitchBitsInfo  # noqa: E402
+
+
+class NullConsoleMini(object):
+
+    def update_trending_games(self, chat_message=None, bits_used=None, user_name=None):
+        return True
+
+
+def bits_frame(channel_id, index):
+    return json.dumps({
+        "type": "MESSAGE",
+        "data": {
+            "topic": "channel-bitsevents.{}".format(channel_id),
+            "message": json.dumps({
+                "user_name": "cheerer{}".format(index),
+                "channel_name": "twitch",
+                "user_id": str(index),
+                "channel_id": channel_id,
+                "time": "2015-12-19T16:39:57-08:00",
+                "chat_message": "Omg that baneling bust was Kreygasm CM16 cheer10 cheer10 cheer100",
+                "bits_used": 120,
+                "total_bits_used": 620,
+                "context": "cheer",
+            }),
+        }
+    })
+
+
+def frames_corpus(count):
+    rand = random.Random(42)
+    frames = [json.dumps({"type": "PONG"}),
+              json.dumps({"type": "RESPONSE", "nonce": "", "error": ""}),
+              bits_frame('2', 0)]
+    return [rand.choice(frames) if rand.random() < 0.5 else bits_frame('1', index) for index in range(count)]
+
+
+def previous_on_message(bits, ws, message):
+    """
+    on_message decoding, as it was before frames were dispatched by type.
+    """
+    message_dict = json.loads(message)
+    bits.log.debug('message_dict: {}'.format(str(message_dict)))
+
+    if (message_dict['type'] == 'MESSAGE' and
+       'channel-bitsevents' in message_dict['data']['topic']):
+        channel_id = message_dict['data']['topic'].rsplit('.', 1)[-1]
+        message_data = json.loads(message_dict['data']['message'])
+        bits.log.debug('message_data: {}'.format(str(message_data)))
+        bits.consoleminis[channel_id].update_trending_games(message_data['chat_message'],
+                                                            int(message_data['bits_used']))
+
+
+def main(count=50000):
+    bits = TwitchBitsInfo(config_dict={'twitch_client_id': 'bench', 'channel_name': 'bench',
+                                       'db_filepath': 'consolemini.json', 'verbose': '0'})
+    # INFO cheer logs cost the same before and after, leave them out
+    bits.log.setLevel(logging.WARNING)
+    bits.consoleminis = {'1': NullConsoleMini(), '2': NullConsoleMini()}
+    bits.batchers = {}
+    frames = frames_corpus(count)
+
+    runs = [('before', lambda: [previous_on_message(bits, None, frame) for frame in frames]),
+            ('after', lambda: [bits.on_message(None, frame) for frame in frames])]
+    print('JSON decoder: {}'.format(twitchbitsinfo.json_loads.__module__))
+    for name, run in runs:
+        elapsed = min(timeit.repeat(run, number=1, repeat=5))
+        print('{:>6}: {:.0f} frames/sec ({:.2f} us/frame)'.format(name, count / elapsed, elapsed / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Micro-benchmark of ConsoleMini chat message parsers, over a corpus of realistic chat lines:
+    python benchmarks/bench_parser.py
+'strict' pays for its word boundaries and catalog checks: it is slower than 'legacy',
+but finds more known game_ids ('legacy' returns CMON for "cmon let's go cm3"...).
+"""
+import logging
+import os
+import random
+import sys
+import timeit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from consolemini import ConsoleMini  # noqa: E402
+
+CHAT_LINES = [
+    "Omg that baneling bust was Kreygasm CM16 cheer10 cheer10 cheer100",
+    "cheer500 Wow! What a Save! Siiick! CM 22",
+    "cheer200 Sed ut error sit voluptatem cm10",
+    "cheer1400 You should read that linked article more closely, PogChamp cm 17",
+    "cheer100 welcome back to the stream everyone, cmon let's go cm3",
+    "cheer1 Kappa Kappa Kappa",
+    "cheer50 GG WP, that speedrun was insane, {}".format('PogChamp ' * 20),
+    "cheer100 cm8 or cm28, can't decide LUL",
+    "cheer1000 {} CM5".format('this is a very long message with lots of words in it ' * 5),
+]
+
+
+def main(count=100000):
+    db_filepath = os.path.join(ROOT_DIR, 'consolemini.json')
+    rand = random.Random(42)
+    corpus = [rand.choice(CHAT_LINES) for _ in range(count)]
+
+    for chat_parser in ('legacy', 'strict'):
+        cm = ConsoleMini(db_filepath=db_filepath, log=logging.getLogger(), flush_interval=0,
+                         chat_parser=chat_parser)
+        parse = cm.parse_chat_message
+        elapsed = min(timeit.repeat(lambda: [parse(line) for line in corpus], number=1, repeat=5))
+        # legacy also returns game_ids which are not in the catalog
+        known = sum(1 for line in corpus if parse(line) in cm.cm_data)
+        print('{:>6}: {:.0f} messages/sec ({:.2f} us/message), {} known game_ids found'.format(
+            chat_parser, count / elapsed, elapsed / count * 1e6, known))
+        cm.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""
+End-to-end throughput/latency benchmark of the bits events pipeline:
+fake PubSub server -> TwitchBitsInfo.on_message -> ConsoleMini -> trending games text files.
+
+Runs offline, without Twitch credentials (Python 3.5+, needs websockets and pytwitcherapi installed):
+    python benchmarks/bench_pipeline.py --count 5000 --rate 0
+    python benchmarks/bench_pipeline.py --count 5000 --rate 500 --batch-window 0.05
+It reports cheers/sec, and p50/p99 latency between a cheer being sent by the server
+and the trending games text files being written with it.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import pstats
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fakepubsub import FakePubSubServer, read_cheers, synthetic_cheers  # noqa: E402
+from twitchbitsinfo import TwitchBitsInfo  # noqa: E402
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+
+class IndexedMessage(str):
+    """
+    A chat message which remembers which sent cheer it comes from,
+    through TwitchBitsInfo, the cheer batcher and ConsoleMini.
+    """
+    bench_index = None
+
+
+def run_server(server, topic, cheers, rate, sent_at, ready, done):
+    """
+    Serve cheers from another thread, with its own event loop.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def serve():
+        await server.start()
+        ready.set()
+        await server.wait_for_listener(topic)
+        await server.replay(topic, cheers, rate=rate, on_sent=lambda index: sent_at.append(time.time()))
+        while not done.is_set():
+            await asyncio.sleep(0.05)
+        await server.stop()
+
+    loop.run_until_complete(serve())
+    loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=2000, help='how many cheers to send')
+    parser.add_argument('--rate', type=float, default=0, help='cheers per second, 0 means as fast as possible')
+    parser.add_argument('--replay', help='JSON lines file of recorded bits event messages to send')
+    parser.add_argument('--catalog', default=os.path.join(ROOT_DIR, 'consolemini.json'))
+    parser.add_argument('--batch-window', type=float, default=0)
+    parser.add_argument('--with-logs', action='store_true', help='keep INFO logs, as in production')
+    parser.add_argument('--trace', action='store_true', help='trace the pipeline stages, as with trace_filepath')
+    parser.add_argument('--profile-events', type=int, default=0,
+                        help='profile the first events, and print their top functions')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    db_filepath = os.path.join(workdir, 'consolemini.json')
+    shutil.copyfile(args.catalog, db_filepath)
+
+    if args.replay:
+        cheers = list(read_cheers(args.replay))
+    else:
+        with open(db_filepath) as f:
+            cheers = list(synthetic_cheers(sorted(json.load(f)), args.count, seed=42))
+    # sent_at[bench_index] is when that cheer was sent: recorded ones may not all be applied,
+    # so the Nth cheer applied is not always the Nth one sent
+    cheers = [dict(cheer, bench_index=index) for index, cheer in enumerate(cheers)]
+
+    server = FakePubSubServer()
+    sent_at, ready, done = [], threading.Event(), threading.Event()
+    topic = 'channel-bitsevents.1'
+    server_thread = threading.Thread(target=run_server, args=(server, topic, cheers, args.rate, sent_at, ready, done))
+    server_thread.start()
+    ready.wait()
+
+    # TwitchBitsInfo writes its log file in the current directory
+    os.chdir(workdir)
+    bits = TwitchBitsInfo(config_dict={
+        'twitch_client_id': 'bench',
+        'channel_name': 'bench',
+        'channel_id': '1',
+        'db_filepath': db_filepath,
+        'ws_host': server.url,
+        'pubsub_client': 'asyncio',
+        'batch_window': str(args.batch_window),
+        'verbose': '0',
+        'trace_filepath': os.path.join(workdir, 'trace.txt') if args.trace else '',
+        'profile_on_start': '1' if args.profile_events else '0',
+        'profile_events': str(args.profile_events),
+        'profile_seconds': '0',
+        'profile_dir': workdir,
+    })
+    bits.access_token = 'bench'
+    if not args.with_logs:
+        bits.log.setLevel(logging.WARNING)
+
+    # Every time trending files are written, cheers applied so far are done
+    latencies = []
+    applied = []
+    parsing = [None]
+    finished_at = []
+    get_event_id = bits.get_event_id
+
+    def indexing_get_event_id(message_data):
+        # Called for each bits event, before its chat message goes to the batcher or ConsoleMini
+        chat_message = message_data['chat_message'] = IndexedMessage(message_data['chat_message'])
+        chat_message.bench_index = message_data['bench_index']
+        return get_event_id(message_data)
+
+    def instrument_consolemini():
+        cm = bits.consoleminis['1']
+        parse_chat_message, cheer, write_trending_files = cm.parse_chat_message, cm._cheer, cm.write_trending_files
+
+        # A cheer is applied right after its chat message was parsed, batched or not
+        def indexing_parse_chat_message(chat_message):
+            parsing[0] = chat_message.bench_index
+            return parse_chat_message(chat_message)
+
+        def counting_cheer(*args):
+            flush_now = cheer(*args)
+            applied.append(parsing[0])
+            return flush_now
+
+        def timed_write_trending_files(trending_games):
+            write_trending_files(trending_games)
+            now = time.time()
+            for index in applied[len(latencies):]:
+                latencies.append(now - sent_at[index])
+            finished_at[:] = [now]
+
+        cm.parse_chat_message = indexing_parse_chat_message
+        cm._cheer = counting_cheer
+        cm.write_trending_files = timed_write_trending_files
+
+    setup_channels = bits._setup_channels
+
+    def _setup_channels():
+        setup_channels()
+        instrument_consolemini()
+
+    def watchdog():
+        """
+        Shutdown once every cheer made it to the files, or when nothing moved for a second
+        after the last one was sent (some recorded cheers may not cheer for a known game).
+        """
+        last_progress = (len(latencies), time.time())
+        while len(latencies) < len(cheers):
+            time.sleep(0.05)
+            if len(latencies) != last_progress[0] or len(sent_at) < len(cheers):
+                last_progress = (len(latencies), time.time())
+            elif time.time() - last_progress[1] > 1:
+                break
+        bits.shutdown()
+
+    bits.get_event_id = indexing_get_event_id
+    bits._setup_channels = _setup_channels
+    threading.Thread(target=watchdog).start()
+    bits.connect()
+    done.set()
+    server_thread.join()
+
+    # Every cheer was sent, but some may not have a game_id ConsoleMini knows
+    elapsed = finished_at[0] - sent_at[0]
+    print('cheers sent: {}, applied: {}'.format(len(sent_at), len(latencies)))
+    print('throughput: {:.0f} cheers/sec'.format(len(latencies) / elapsed))
+    print('latency p50: {:.2f} ms, p99: {:.2f} ms'.format(percentile(latencies, 50) * 1000,
+                                                          percentile(latencies, 99) * 1000))
+    if args.trace:
+        with open(os.path.join(workdir, 'trace.txt')) as f:
+            print('stage timings traced: {}'.format(sum(1 for _ in f)))
+    for name in os.listdir(workdir):
+        if name.endswith('.prof'):
+            pstats.Stats(os.path.join(workdir, name)).sort_stats('cumulative').print_stats(15)
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""
+Time-to-recover benchmark of the PubSub reconnection, against the fake PubSub server:
+how long it takes to LISTEN again after a RECONNECT frame, and after a dropped connection.
+Then cheers are replayed twice, the second time must not count.
+
+Runs offline, without Twitch credentials (Python 3.5+, needs websockets and pytwitcherapi installed,
+and websocket-client with --pubsub-client thread):
+    python benchmarks/bench_reconnect.py --rounds 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from fakepubsub import FakePubSubServer, synthetic_cheers  # noqa: E402
+from twitchbitsinfo import TwitchBitsInfo  # noqa: E402
+
+
+async def recover_time(server, topic, disconnect):
+    """
+    Seconds between disconnect() and the client listening to topic again.
+    """
+    previous_listeners = set(server.get_listeners(topic))
+    start = time.time()
+    # A dropped connection's close handshake can last close_timeout (the thread client never answers it),
+    # and the new connection may LISTEN before the server noticed the previous one is gone
+    closing = asyncio.ensure_future(disconnect())
+    while not set(server.get_listeners(topic)) - previous_listeners:
+        await asyncio.sleep(0.001)
+    elapsed = time.time() - start
+    await closing
+    return elapsed
+
+
+def run_server(server, topic, cheers, rounds, results, ready, done):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    async def serve():
+        await server.start()
+        ready.set()
+        await server.wait_for_listener(topic)
+        for _ in range(rounds):
+            results['reconnect'].append(await recover_time(server, topic, server.send_reconnect))
+            results['drop'].append(await recover_time(server, topic, server.drop_connections))
+
+        # Every cheer twice, as a server replaying its last events after a reconnection would
+        await server.replay(topic, cheers)
+        await server.replay(topic, cheers)
+        while not done.is_set():
+            await asyncio.sleep(0.05)
+        await server.stop()
+
+    loop.run_until_complete(serve())
+    loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--count', type=int, default=200, help='how many cheers to replay twice')
+    parser.add_argument('--backoff', type=float, default=1.0, help='reconnect_backoff, in seconds')
+    parser.add_argument('--pubsub-client', default='asyncio', choices=['asyncio', 'thread'])
+    parser.add_argument('--catalog', default=os.path.join(ROOT_DIR, 'consolemini.json'))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_reconnect_')
+    db_filepath = os.path.join(workdir, 'consolemini.json')
+    shutil.copyfile(args.catalog, db_filepath)
+    with open(db_filepath) as f:
+        cheers = list(synthetic_cheers(sorted(json.load(f)), args.count, seed=42))
+
+    server = FakePubSubServer()
+    results = {'reconnect': [], 'drop': []}
+    ready, done = threading.Event(), threading.Event()
+    topic = 'channel-bitsevents.1'
+    server_thread = threading.Thread(target=run_server,
+                                     args=(server, topic, cheers, args.rounds, results, ready, done))
+    server_thread.start()
+    ready.wait()
+
+    # TwitchBitsInfo writes its log file in the current directory
+    os.chdir(workdir)
+    bits = TwitchBitsInfo(config_dict={
+        'twitch_client_id': 'bench',
+        'channel_name': 'bench',
+        'channel_id': '1',
+        'db_filepath': db_filepath,
+        'ws_host': server.url,
+        'pubsub_client': args.pubsub_client,
+        'batch_window': '0',
+        'reconnect_backoff': str(args.backoff),
+        'verbose': '0',
+    })
+    bits.access_token = 'bench'
+    # No Twitch login: the thread client only needs somewhere to keep its first connection
+    bits.twitch = argparse.Namespace()
+    bits.log.setLevel(logging.ERROR)
+
+    def watchdog():
+        while bits.recent_events.duplicates < len(cheers) and server_thread.is_alive():
+            time.sleep(0.05)
+        bits.shutdown()
+
+    threading.Thread(target=watchdog).start()
+    bits.connect()
+    done.set()
+    server_thread.join()
+
+    for cause in ('reconnect', 'drop'):
+        times = sorted(results[cause])
+        print('time to recover after a {}: min {:.1f} ms, median {:.1f} ms, max {:.1f} ms'.format(
+            'RECONNECT' if cause == 'reconnect' else 'dropped connection',
+            times[0] * 1000, times[len(times) // 2] * 1000, times[-1] * 1000))
+    print('cheers sent twice: {}, duplicates ignored: {}'.format(len(cheers), bits.recent_events.duplicates))
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
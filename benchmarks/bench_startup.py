@@ -0,0 +1,136 @@
+"""
+Startup time benchmark: from TwitchBitsInfo.start() until the websocket is about to connect.
+
+Twitch login is replaced by a stubbed auth server, which hands a token out login_delay seconds
+after the browser reached it (the time a user takes to click "Authorize").
+Cold starts go through that login flow, warm starts reuse the cached token.
+Runs offline (needs pytwitcherapi installed, as twitchbitsinfo imports it):
+    python benchmarks/bench_startup.py --login-delay 0.5
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urllib2 import urlopen
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from urllib.request import urlopen
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+import twitchbitsinfo  # noqa: E402
+
+
+class StubTwitchSession(object):
+    """
+    Just enough of pytwitcherapi.TwitchSession, with a local auth server.
+    """
+    login_delay = 0.5
+
+    def __init__(self):
+        self._token = None
+        self.current_user = None
+        self.server = None
+
+    @property
+    def token(self):
+        return self._token
+
+    @token.setter
+    def token(self, token):
+        self._token = token
+        self.current_user = 'bench' if token else None
+
+    @property
+    def authorized(self):
+        return bool(self._token)
+
+    def start_login_server(self):
+        session = self
+
+        class AuthHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                time.sleep(session.login_delay)
+                session.token = {'access_token': 'bench', 'token_type': 'bearer', 'expires_in': 3600}
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), AuthHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def get_auth_url(self):
+        return 'http://127.0.0.1:{}/authorize'.format(self.server.server_address[1])
+
+    def shutdown_login_server(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def open_browser(url):
+    # The "user" follows the auth URL in the background, like a browser would
+    thread = threading.Thread(target=lambda: urlopen(url).read())
+    thread.daemon = True
+    thread.start()
+
+
+def time_startup(token_cache_filepath):
+    bits = twitchbitsinfo.TwitchBitsInfo(config_dict={
+        'twitch_client_id': 'bench',
+        'channel_name': 'bench',
+        'channel_id': '1',
+        'db_filepath': 'consolemini.json',
+        'token_cache_filepath': token_cache_filepath,
+        'verbose': '0',
+    })
+    bits.log.setLevel(logging.WARNING)
+    connected_at = []
+    bits.connect = lambda: connected_at.append(time.time())
+
+    start = time.time()
+    bits.start()
+    return connected_at[0] - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--login-delay', type=float, default=0.5, help='seconds the stubbed user takes to log in')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    StubTwitchSession.login_delay = args.login_delay
+    twitchbitsinfo.pytwitcherapi.TwitchSession = StubTwitchSession
+    twitchbitsinfo.webbrowser.open = open_browser
+
+    # TwitchBitsInfo writes its log file in the current directory
+    workdir = tempfile.mkdtemp(prefix='bench_startup_')
+    os.chdir(workdir)
+    token_cache_filepath = os.path.join(workdir, 'twitch_token.json')
+
+    cold, warm = [], []
+    for _ in range(args.repeat):
+        if os.path.exists(token_cache_filepath):
+            os.remove(token_cache_filepath)
+        cold.append(time_startup(token_cache_filepath))
+        warm.append(time_startup(token_cache_filepath))
+
+    print('before: 5 s fixed sleep (45 s on first run), whatever the login took')
+    print('cold start (login {:.2f} s): {:.3f} s'.format(args.login_delay, min(cold)))
+    print('warm start (cached token): {:.3f} s'.format(min(warm)))
+    shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import logging
+import threading
+import time
+
+
+class CheerBatcher(object):
+    """
+    Accumulate cheers during bursts (hype trains, bits rains...),
+    and hand them to sink all at once.
+
+    A batch is sent batch_window seconds after its first cheer arrived,
+    or as soon as it holds batch_max_size cheers, whichever comes first:
+    batch_window is the upper bound of the latency added to a cheer.
+    """
+
+    def __init__(self, sink, batch_window=0.25, batch_max_size=50, log=None):
+        self.sink = sink
+        self.batch_window = batch_window
+        self.batch_max_size = batch_max_size
+        self.log = log or logging.getLogger('twitch_bits_info')
+
+        self._cheers = []
+        self._deadline = None
+        self._closed = False
+        self._cond = threading.Condition()
+
+        self._thread = threading.Thread(target=self._run, name='cheer-batcher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def add(self, cheer):
+        with self._cond:
+            if not self._cheers:
+                self._deadline = time.time() + self.batch_window
+                self._cond.notify()
+            self._cheers.append(cheer)
+            if len(self._cheers) >= self.batch_max_size:
+                self._cond.notify()
+
+    def close(self):
+        """
+        Send the pending cheers, and stop the batcher thread.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._cheers and not self._closed:
+                self._cond.wait()
+
+            while len(self._cheers) < self.batch_max_size and not self._closed:
+                remaining = self._deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            # Cheers left over from a full batch keep their deadline, they go out next
+            batch = self._cheers[:self.batch_max_size]
+            del self._cheers[:self.batch_max_size]
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                try:
+                    self.sink(batch)
+                except Exception:
+                    self.log.exception('Could not apply a batch of {} cheers'.format(len(batch)))
+            elif self._closed:
+                return
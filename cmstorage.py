@@ -0,0 +1,291 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+
+try:
+    replace_file = os.replace
+except AttributeError:
+    # Python 2: os.rename is atomic on POSIX, but won't overwrite on Windows
+    def replace_file(src, dst):
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def atomic_write(filepath, text, fsync=True):
+    """
+    Write text to filepath through a temporary file and a rename,
+    so readers never see a partially written file.
+    Without fsync, the file is still atomically replaced, but may not survive a power loss.
+    """
+    if not isinstance(text, bytes):
+        text = text.encode('utf-8')
+
+    tmp_filepath = '{}.tmp'.format(filepath)
+    with open(tmp_filepath, 'wb') as f:
+        f.write(text)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    replace_file(tmp_filepath, filepath)
+
+
+class JsonStorage(object):
+    """
+    Persist the ConsoleMini catalog as a whole JSON file, rewritten on every flush.
+    It is snapshot-only: wants_snapshot() is always True, so it never has records to append.
+    """
+
+    def __init__(self, db_filepath, log):
+        self.db_filepath = db_filepath
+        self.log = log
+
+    def load(self):
+        """
+        Returns the catalog, and the cheer records to replay on top of it (none here).
+        """
+        with open(self.db_filepath, 'r') as f:
+            return json.load(f), []
+
+    def wants_snapshot(self, pending_records):
+        """
+        Whether the next flush must write a whole snapshot, instead of appending
+        its pending_records: storages which can append implement append(records).
+        """
+        return True
+
+    def write_snapshot(self, text):
+        atomic_write(self.db_filepath, text)
+
+    def close(self):
+        pass
+
+
+class JournalStorage(JsonStorage):
+    """
+    Persist the ConsoleMini catalog as a JSON snapshot (the usual consolemini.json),
+    plus an append-only journal of the cheers applied since that snapshot.
+
+    Journal first line is a header holding the sha1 of the snapshot it applies to,
+    every other line is a compact cheer record: ["CM16", 120, -1]
+    (game_id, bits delta, priority delta).
+    When the snapshot doesn't match the header (the journal was already compacted
+    into it, or consolemini.json was edited by hand), the journal is discarded.
+    """
+
+    def __init__(self, db_filepath, log, snapshot_every=1000):
+        super(JournalStorage, self).__init__(db_filepath, log)
+        self.journal_filepath = '{}.journal'.format(db_filepath)
+        self.snapshot_every = snapshot_every
+        self.journal_length = 0
+
+    def load(self):
+        with open(self.db_filepath, 'rb') as f:
+            snapshot = f.read()
+        cm_data = json.loads(snapshot.decode('utf-8'))
+        digest = hashlib.sha1(snapshot).hexdigest()
+
+        records = []
+        torn = False
+        try:
+            with open(self.journal_filepath, 'r') as f:
+                header = json.loads(f.readline() or '{}')
+                if header.get('snapshot') == digest:
+                    for line in f:
+                        try:
+                            records.append(json.loads(line))
+                        except ValueError:
+                            # A torn last line, from a crash in the middle of an append
+                            self.log.warning('Ignoring a corrupted ConsoleMini journal record: {}'.format(line))
+                            torn = True
+                            break
+                else:
+                    self.log.warning('ConsoleMini journal does not match {}, discarding it'.format(
+                        self.db_filepath))
+        except (IOError, OSError, ValueError):
+            pass
+
+        if torn or not records:
+            # Start over from a clean journal, so next appends don't follow garbage
+            self._reset_journal(digest)
+            self.append(records)
+        else:
+            self.journal_length = len(records)
+
+        return cm_data, records
+
+    def wants_snapshot(self, pending_records):
+        return self.journal_length + pending_records >= self.snapshot_every
+
+    def write_snapshot(self, text):
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        atomic_write(self.db_filepath, text)
+        self._reset_journal(hashlib.sha1(text).hexdigest())
+
+    def append(self, records):
+        if not records:
+            return
+        with open(self.journal_filepath, 'a') as f:
+            f.write(''.join('{}\n'.format(json.dumps(record, separators=(',', ':')))
+                            for record in records))
+        self.journal_length += len(records)
+
+    def _reset_journal(self, digest):
+        atomic_write(self.journal_filepath, '{}\n'.format(json.dumps({'snapshot': digest})))
+        self.journal_length = 0
+
+
+class SqliteStorage(object):
+    """
+    Persist the ConsoleMini catalog in a SQLite database (consolemini.sqlite next to
+    consolemini.json), one row per game: a cheer only updates the rows it changes,
+    in its own transaction, and the trending games are a single indexed query.
+
+    The database is imported from consolemini.json when it is still empty,
+    and consolemini.json is exported back on close() for the tools reading it:
+    once imported, the database is the one which is authoritative.
+    """
+
+    def __init__(self, db_filepath, log, sqlite_filepath=None):
+        self.db_filepath = db_filepath
+        self.log = log
+        self.sqlite_filepath = sqlite_filepath or '{}.sqlite'.format(os.path.splitext(db_filepath)[0])
+
+        self._lock = threading.Lock()
+        # ConsoleMini flushes from its own thread, our lock serializes every access
+        self.conn = sqlite3.connect(self.sqlite_filepath, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # Still crash safe in WAL mode, only the last transactions may be lost on a power loss
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS games ('
+                              'game_id TEXT PRIMARY KEY, '
+                              'game_name TEXT NOT NULL, '
+                              'total_bits INTEGER NOT NULL, '
+                              'priority INTEGER NOT NULL)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS games_trending '
+                              'ON games (total_bits DESC, priority ASC)')
+
+    def load(self):
+        with self._lock:
+            empty = self.conn.execute('SELECT COUNT(*) FROM games').fetchone()[0] == 0
+        if empty:
+            self.import_json(self.db_filepath)
+
+        with self._lock:
+            rows = self.conn.execute('SELECT game_id, game_name, total_bits, priority FROM games').fetchall()
+        cm_data = dict((game_id, {'game_name': game_name, 'total_bits': total_bits, 'priority': priority})
+                       for game_id, game_name, total_bits, priority in rows)
+        return cm_data, []
+
+    def wants_snapshot(self, pending_records):
+        return False
+
+    def write_snapshot(self, text):
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        self._replace_all(json.loads(text))
+
+    def append(self, records):
+        """
+        Apply every cheer record in its own transaction, the same way ConsoleMini does:
+        add the bits and the priority delta to the game, then reset the priority
+        of the games now tied with it.
+        """
+        with self._lock:
+            for game_id, bits, priority in records:
+                with self.conn:
+                    self.conn.execute('UPDATE games SET total_bits = total_bits + ?, priority = priority + ? '
+                                      'WHERE game_id = ?', (bits, priority, game_id))
+                    self.conn.execute('UPDATE games SET priority = 10 '
+                                      'WHERE total_bits = (SELECT total_bits FROM games WHERE game_id = ?) '
+                                      'AND game_id != ?', (game_id, game_id))
+
+    def top(self, count):
+        """
+        Returns the count first trending games, sorted by total_bits DESC, then priority ASC.
+        """
+        with self._lock:
+            rows = self.conn.execute('SELECT game_name, total_bits, priority FROM games '
+                                     'ORDER BY total_bits DESC, priority ASC, game_id ASC LIMIT ?',
+                                     (count,)).fetchall()
+        return [{'game_name': game_name, 'total_bits': total_bits, 'priority': priority}
+                for game_name, total_bits, priority in rows]
+
+    def import_json(self, json_filepath):
+        """
+        Replace the whole database with a consolemini.json file.
+        """
+        with open(json_filepath, 'r') as f:
+            cm_data = json.load(f)
+        self._replace_all(cm_data)
+        self.log.info('Imported {} ConsoleMini games from {}'.format(len(cm_data), json_filepath))
+
+    def export_json(self, json_filepath=None):
+        """
+        Write the whole database as a consolemini.json file (db_filepath by default).
+        """
+        cm_data, _ = self.load()
+        atomic_write(json_filepath or self.db_filepath, json.dumps(cm_data, indent=2, sort_keys=True))
+
+    def close(self):
+        if self.conn is None:
+            return
+        self.export_json()
+        with self._lock:
+            self.conn.close()
+            self.conn = None
+
+    def _replace_all(self, cm_data):
+        with self._lock:
+            with self.conn:
+                self.conn.execute('DELETE FROM games')
+                self.conn.executemany('INSERT INTO games (game_id, game_name, total_bits, priority) '
+                                      'VALUES (?, ?, ?, ?)',
+                                      [(game_id, game['game_name'], game['total_bits'], game['priority'])
+                                       for game_id, game in cm_data.items()])
+
+
+def read_catalog(filepath):
+    """
+    Read a catalog to import or merge into ConsoleMini, from a JSON file shaped like
+    consolemini.json, or a CSV file with a game_id,game_name,total_bits,priority header.
+    Only game_id is required: entries only hold the fields the file gives.
+    """
+    if filepath.lower().endswith('.csv'):
+        with io.open(filepath, newline='', encoding='utf-8-sig') as f:
+            rows = list(csv.DictReader(f))
+        if rows and 'game_id' not in rows[0]:
+            raise ValueError('{} has no game_id column'.format(filepath))
+    else:
+        with io.open(filepath, encoding='utf-8') as f:
+            cm_data = json.load(f)
+        if not isinstance(cm_data, dict):
+            raise ValueError('{} is not a ConsoleMini catalog'.format(filepath))
+        rows = [dict(game, game_id=game_id) for game_id, game in cm_data.items()]
+
+    catalog = {}
+    for row in rows:
+        game = {}
+        for field in ('game_name', 'total_bits', 'priority'):
+            value = row.get(field)
+            if value is None or value == '':
+                continue
+            game[field] = value if field == 'game_name' else int(value)
+        catalog[row['game_id']] = game
+    return catalog
+
+
+def get_storage(db_storage, db_filepath, log, **kwargs):
+    if db_storage == 'json':
+        return JsonStorage(db_filepath, log)
+    if db_storage == 'journal':
+        return JournalStorage(db_filepath, log, **kwargs)
+    if db_storage == 'sqlite':
+        return SqliteStorage(db_filepath, log, **kwargs)
+    raise ValueError('Unknown ConsoleMini storage: {}'.format(db_storage))
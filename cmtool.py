@@ -0,0 +1,252 @@
+"""
+ConsoleMini catalog maintenance, from the command line.
+
+replay: rebuild a catalog from the dated .log files TwitchBitsInfo writes,
+e.g. when consolemini.json is lost, or to recount it with other chat_parser rules:
+    python cmtool.py replay --db consolemini.json 2017-12-01.log 2017-12-02.log
+    python cmtool.py replay --db consolemini.json --chat-parser strict logs/
+    python cmtool.py replay --db channel1.json --channel 1234 logs/
+Log files are streamed line by line, cheers are applied to the in-memory catalog
+by batches, and the catalog is written once, at the end.
+Logs of several channels are only replayed one channel at a time, with --channel <channel_id>.
+
+reset, import, merge, remove: bulk catalog operations, each one written once,
+while TwitchBitsInfo is not running (use the Tk app buttons otherwise):
+    python cmtool.py reset --db consolemini.json
+    python cmtool.py import --db consolemini.json games.csv
+    python cmtool.py merge --db consolemini.json new_games.json
+    python cmtool.py remove --db consolemini.json CM12 CM13
+CSV files have a game_id,game_name,total_bits,priority header, only game_id is required.
+"""
+from __future__ import print_function
+
+import argparse
+import gzip
+import io
+import logging
+import os
+import re
+import sys
+import time
+
+from cmstorage import read_catalog
+from consolemini import Cheer, ConsoleMini
+
+# '%(asctime)s - %(levelname)s - %(message)s', as formatted by TwitchBitsInfo._setup_log
+LOG_RECORD_RE = re.compile(r'^\d{4}-\d{2}-\d{2} [\d:,]+ - [A-Z]+ - (.*)$')
+# 'New cheer from <user_name> in channel <channel_id> !', older logs don't have the channel
+NEW_CHEER_RE = re.compile(r'^New cheer from (\S+)(?: in channel (\S+))? !')
+
+MESSAGE_PREFIX = 'Message: '
+BITS_PREFIX = 'Bits cheered: '
+
+
+def log_filepaths(paths):
+    """
+    Yields the log files of paths, directories standing for the .log files they hold, oldest first.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(('.log', '.log.gz')):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def read_lines(filepaths):
+    for filepath in filepaths:
+        if filepath.endswith('.gz'):
+            f = io.TextIOWrapper(gzip.open(filepath), encoding='utf-8', errors='replace')
+        else:
+            f = io.open(filepath, encoding='utf-8', errors='replace')
+        with f:
+            for line in f:
+                yield line.rstrip('\r\n')
+
+
+def log_messages(lines):
+    """
+    Yields the message of each log record: lines which don't start a record
+    are the next lines of the previous message (a chat message with a line break...).
+    """
+    message = None
+    for line in lines:
+        match = LOG_RECORD_RE.match(line)
+        if match is None:
+            if message is not None:
+                message += '\n' + line
+            continue
+        if message is not None:
+            yield message
+        message = match.group(1)
+    if message is not None:
+        yield message
+
+
+class MixedChannelsError(ValueError):
+    pass
+
+
+def cheer_events(messages, stats=None, channel_id=None):
+    """
+    Yields a Cheer for each 'New cheer from', 'Message:', 'Bits cheered:' sequence of messages.
+    Sequences cut by another cheer are dropped, and counted in stats['incomplete'].
+    With a channel_id, only its cheers are yielded (the others are counted in stats['skipped']),
+    without one, cheers of a second channel raise MixedChannelsError.
+    Cheers logged without their channel belong to any channel.
+    """
+    if stats is None:
+        stats = {}
+    stats.setdefault('incomplete', 0)
+    stats.setdefault('skipped', 0)
+
+    first_channel_id = None
+    user_name = chat_message = None
+    for message in messages:
+        match = NEW_CHEER_RE.match(message)
+        if match is not None:
+            if user_name is not None:
+                stats['incomplete'] += 1
+            user_name, chat_message = match.group(1), None
+            cheer_channel_id = match.group(2)
+            if cheer_channel_id is None:
+                continue
+
+            if channel_id is not None:
+                if cheer_channel_id != channel_id:
+                    stats['skipped'] += 1
+                    user_name = None
+            elif first_channel_id is None:
+                first_channel_id = cheer_channel_id
+            elif cheer_channel_id != first_channel_id:
+                raise MixedChannelsError('Logs hold cheers of channels {} and {}, replay them one at a time '
+                                         'with --channel'.format(first_channel_id, cheer_channel_id))
+        elif user_name is None:
+            continue
+        elif message.startswith(MESSAGE_PREFIX) and chat_message is None:
+            chat_message = message[len(MESSAGE_PREFIX):]
+        elif message.startswith(BITS_PREFIX) and chat_message is not None:
+            try:
+                bits_used = int(message[len(BITS_PREFIX):])
+            except ValueError:
+                stats['incomplete'] += 1
+            else:
+                yield Cheer(user_name, chat_message, bits_used)
+            user_name = chat_message = None
+
+
+def batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def replay(cm, filepaths, batch_size=1000, channel_id=None):
+    """
+    Apply the cheers of the log files filepaths (of channel_id only, if given) to cm, then write it once.
+    Returns stats: how many cheers were read, applied, incomplete, skipped, and how long it took.
+    """
+    stats = {'cheers': 0, 'applied': 0}
+    start = time.time()
+    events = cheer_events(log_messages(read_lines(filepaths)), stats, channel_id=channel_id)
+    for batch in batches(events, batch_size):
+        stats['cheers'] += len(batch)
+        stats['applied'] += cm.apply_cheers(batch)
+    cm.flush()
+    stats['seconds'] = time.time() - start
+    return stats
+
+
+def command_replay(args, log):
+    cm = ConsoleMini(db_filepath=os.path.abspath(args.db), log=log, flush_interval=0, flush_every=0,
+                     db_storage=args.db_storage, chat_parser=args.chat_parser, multi_cm=args.multi_cm,
+                     trending_files=False, record_cheers=False)
+    try:
+        if not args.keep_bits:
+            # Written along with the replayed cheers
+            cm.reset_all(flush=False)
+        stats = replay(cm, list(log_filepaths(args.logs)), batch_size=args.batch_size, channel_id=args.channel)
+        cm.write_trending_files(cm.get_trending_games())
+    except MixedChannelsError as e:
+        # Leave the catalog as it was, rather than mixing several channels into it
+        cm.load_db()
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        cm.close()
+
+    skipped = ', {} of other channels'.format(stats['skipped']) if args.channel else ''
+    print('{} cheers replayed ({} applied, {} incomplete{}) in {:.2f}s: {:.0f} cheers/s'.format(
+        stats['cheers'], stats['applied'], stats['incomplete'], skipped, stats['seconds'],
+        stats['cheers'] / max(stats['seconds'], 1e-9)))
+    return 0
+
+
+def command_bulk(args, log):
+    cm = ConsoleMini(db_filepath=os.path.abspath(args.db), log=log, flush_interval=0, flush_every=0,
+                     db_storage=args.db_storage)
+    try:
+        if args.command == 'reset':
+            count = cm.reset_all()
+        elif args.command == 'import':
+            count = cm.import_catalog(read_catalog(args.catalog))
+        elif args.command == 'merge':
+            count = cm.merge_catalog(read_catalog(args.catalog))
+        else:
+            count = cm.remove_games(args.game_ids)
+    finally:
+        cm.close()
+
+    print('{}: {} games'.format(args.command, count))
+    return 0
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    replay_parser = subparsers.add_parser('replay', help='rebuild a catalog from log files')
+    replay_parser.add_argument('logs', nargs='+', help='log files, or directories of log files')
+    replay_parser.add_argument('--db', default='consolemini.json', help='the catalog to rebuild')
+    replay_parser.add_argument('--db-storage', default='json', choices=['json', 'journal', 'sqlite'])
+    replay_parser.add_argument('--chat-parser', default='legacy', choices=['legacy', 'strict'])
+    replay_parser.add_argument('--multi-cm', default='first', choices=['first', 'last', 'ignore'])
+    replay_parser.add_argument('--channel', help='the channel_id whose cheers are replayed, with several channels')
+    replay_parser.add_argument('--keep-bits', action='store_true',
+                               help='add the cheers to the current bits, instead of starting over from 0')
+    replay_parser.add_argument('--batch-size', type=int, default=1000)
+    replay_parser.set_defaults(func=command_replay)
+
+    for command, help in (('reset', 'reset the bits and priority of every game'),
+                          ('import', 'replace the catalog with a CSV or JSON one'),
+                          ('merge', 'add new games, and update the others, from a CSV or JSON catalog'),
+                          ('remove', 'remove games')):
+        bulk_parser = subparsers.add_parser(command, help=help)
+        bulk_parser.add_argument('--db', default='consolemini.json', help='the catalog to change')
+        bulk_parser.add_argument('--db-storage', default='json', choices=['json', 'journal', 'sqlite'])
+        if command in ('import', 'merge'):
+            bulk_parser.add_argument('catalog', help='a .csv or .json catalog file')
+        elif command == 'remove':
+            bulk_parser.add_argument('game_ids', nargs='+')
+        bulk_parser.set_defaults(func=command_bulk)
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s')
+    # Per-cheer logs would cost more than replaying them
+    log = logging.getLogger('cmtool')
+    log.setLevel(logging.WARNING)
+    return args.func(args, log)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
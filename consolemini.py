@@ -1,5 +1,14 @@
+from collections import namedtuple
 import json
 import os
+import re
+import threading
+
+from cmstorage import atomic_write, get_storage
+from leaderboard import get_leaderboard
+import metrics
+from profiling import profiled
+from trending import TrendingIndex, get_trending
 
 
 class BadArgsException(Exception):
@@ -9,35 +18,406 @@ class BadArgsException(Exception):
         super(BadArgsException, self).__init__(message)
 
 
+# A bits event, as received by TwitchBitsInfo.on_message
+Cheer = namedtuple('Cheer', ['user_name', 'chat_message', 'bits_used'])
+
+
+class GameRecord(object):
+    """
+    A game of the in-memory catalog: three slots instead of a dict per game, a fraction
+    of the memory with large catalogs. The catalog code uses its attributes, but it still
+    reads and writes like the consolemini.json dicts it comes from: game['total_bits'] += 100
+    """
+    FIELDS = ('game_name', 'total_bits', 'priority')
+    __slots__ = FIELDS
+
+    def __init__(self, game_name, total_bits=0, priority=10):
+        self.game_name = game_name
+        self.total_bits = total_bits
+        self.priority = priority
+
+    @classmethod
+    def from_dict(cls, game):
+        return cls(game['game_name'], game['total_bits'], game['priority'])
+
+    def to_dict(self):
+        return {'game_name': self.game_name, 'total_bits': self.total_bits, 'priority': self.priority}
+
+    def keys(self):
+        return list(self.FIELDS)
+
+    def update(self, game):
+        for key, value in game.items():
+            self[key] = value
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __eq__(self, other):
+        if isinstance(other, GameRecord):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'GameRecord({!r}, {!r}, {!r})'.format(self.game_name, self.total_bits, self.priority)
+
+
+def game_records(cm_data):
+    """
+    The in-memory catalog of cm_data, a consolemini.json like dict of dicts.
+    """
+    return dict((game_id, GameRecord.from_dict(game)) for game_id, game in cm_data.items())
+
+
+# A CM token: "CM16", "cm 16"... matched where a 'cm', in any case, starts a word
+CM_TOKEN_RE = re.compile(r'\bcm\s*([0-9]+)(?![a-z0-9])', re.IGNORECASE)
+
+
 class ConsoleMini(object):
 
     def __init__(self, **kwargs):
+        # Write-behind persistence: the JSON file is written every flush_interval seconds,
+        # or as soon as flush_every changes are pending (0 disables either trigger).
+        self.flush_interval = 5
+        self.flush_every = 100
+        # 'json' rewrites the whole file on flush, 'journal' appends each cheer to
+        # consolemini.json.journal, and compacts it every snapshot_every cheers,
+        # 'sqlite' updates the rows of consolemini.sqlite each cheer changed.
+        self.db_storage = 'json'
+        self.snapshot_every = 1000
+        # How many trending games (and consolemini.N.txt files) we keep track of
+        self.trending_count = 3
+        # 'total' ranks games by their total_bits, 'window' by the bits they got in the last
+        # trending_window seconds (trending_buckets steps), 'decay' by their bits halved every
+        # trending_half_life seconds. Window and decay scores only live in memory.
+        self.trending_mode = 'total'
+        self.trending_window = 600
+        self.trending_buckets = 60
+        self.trending_half_life = 300
+        # 'legacy' (the default, and the fastest) finds the first 'cm' anywhere in the message,
+        # 'strict' only matches CM tokens of game_ids we know, following the multi_cm policy
+        # when a message has several of them: 'first', 'last', or 'ignore' the whole cheer.
+        self.chat_parser = 'legacy'
+        self.multi_cm = 'first'
+        # How many top cheerers (and cheerers.N.txt files) we keep track of (0 disables it),
+        # counting 'exact'ly every cheerer, or 'approximate'ly with cheerers_capacity of them at most
+        self.cheerers_count = 0
+        self.cheerers_mode = 'approximate'
+        self.cheerers_capacity = 1000
+        # Called with the new trending games each time they are updated (e.g. by the overlay server),
+        # and whether they are still written to the consolemini.N.txt files
+        self.on_trending = None
+        self.trending_files = True
+        # Whether each cheer is kept until the next flush (journal and sqlite storages only append them),
+        # or the next flush writes the whole catalog instead
+        self.record_cheers = True
         # Setup this class attributes, logs, etc...
         self.__dict__.update(kwargs)
         self.db_dirname = os.path.dirname(self.db_filepath)
 
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._flush_wanted = threading.Event()
+        self._closed = threading.Event()
+        self._flusher = None
+
+        # Last text written in each consolemini.N.txt file, and how many writes it saved us.
+        # The cheer, flusher and Tk bulk threads all update the text files: one at a time,
+        # as they share their temporary files. Taken before self._lock, never while holding it.
+        self._files_lock = threading.Lock()
+        self._trending_texts = {}
+        self.trending_files_written = 0
+        self.trending_files_skipped = 0
+
+        self._trending = self._new_trending()
+
+        if self.db_storage == 'journal':
+            self.storage = get_storage(self.db_storage, self.db_filepath, self.log,
+                                       snapshot_every=self.snapshot_every)
+        else:
+            self.storage = get_storage(self.db_storage, self.db_filepath, self.log)
+
+        self.leaderboard = None
+        if self.cheerers_count:
+            self.leaderboard = get_leaderboard(self.cheerers_mode, self.cheerers_capacity)
+
+        # cm_data is the live, authoritative ConsoleMini catalog, of GameRecord.
+        self.load_db()
+
+        if self.flush_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name='consolemini-flusher')
+            self._flusher.daemon = True
+            self._flusher.start()
+
+    def load_db(self):
+        """
+        (Re)load the ConsoleMini catalog into memory, discarding pending changes.
+        With a journal, cheers recorded since the last snapshot are replayed.
+        """
+        with self._lock:
+            cm_data, records = self.storage.load()
+            self.cm_data = game_records(cm_data)
+            self._index = TrendingIndex(self.cm_data)
+            for game_id, bits, priority in records:
+                self._apply_cheer(game_id, bits, priority)
+
+            self.dirty = 0
+            # Cheer records waiting to be appended to the journal,
+            # and whether the next flush must write a whole snapshot instead
+            self._records = []
+            self._needs_snapshot = False
+
+        return self.cm_data
+
     def write_db(self, game_id=None, current_game=None, new_data=None):
         if not game_id and not current_game and not new_data:
             raise BadArgsException(['game_id', 'current_game', 'new_data'])
 
-        if game_id and current_game and not new_data:
-            new_data = self.read_db()
-            new_data[game_id] = current_game
+        with self._lock:
+            if game_id and current_game and not new_data:
+                current_game = self.cm_data[game_id] = GameRecord.from_dict(current_game)
+                self._index.update(game_id, current_game.total_bits, current_game.priority)
+            else:
+                self.cm_data = game_records(new_data)
+                self._index.rebuild(self.cm_data)
+            # write_db can change anything, so only a full snapshot can persist it
+            self._needs_snapshot = True
+            self.dirty += 1
 
-        with open(self.db_filepath, 'w') as f:
-            json.dump(new_data, f, indent=2, sort_keys=True)
+        # An explicit write_db is persisted right away
+        self.flush()
 
         return self.read_db()
 
-    def read_db(self, game_id=None):
-        with open(self.db_filepath, 'r') as f:
-            cm_data = json.load(f)
+    def reset_all(self, flush=True):
+        """
+        Start a new session: every game goes back to 0 bits and the default priority (10),
+        and the window or decay trending scores are forgotten.
+        Like every bulk operation, it is persisted by a single flush (unless flush is False),
+        and returns how many games it changed.
+        """
+        with self._lock:
+            for game in self.cm_data.values():
+                game.total_bits = 0
+                game.priority = 10
+            self._trending = self._new_trending()
+            count = len(self.cm_data)
+            self._bulk_changed()
+
+        self.log.info('Reset {} ConsoleMini games'.format(count))
+        self._bulk_done(flush)
+        return count
+
+    def import_catalog(self, catalog, flush=True):
+        """
+        Replace the whole catalog, e.g. with a new game list read by cmstorage.read_catalog().
+        Games without total_bits or priority start at 0 bits and priority 10.
+        """
+        cm_data = dict((game_id, self._new_game(game_id, game)) for game_id, game in catalog.items())
+        with self._lock:
+            self.cm_data = cm_data
+            self._bulk_changed()
+
+        self.log.info('Imported {} ConsoleMini games'.format(len(cm_data)))
+        self._bulk_done(flush)
+        return len(cm_data)
+
+    def merge_catalog(self, catalog, flush=True):
+        """
+        Add the new games of catalog, and update the fields catalog gives for the others:
+        an entry holding only a game_name renames its game, and keeps its bits.
+        Every entry is checked first: a bad one raises ValueError before any game changes.
+        """
+        with self._lock:
+            new_games = {}
+            updates = {}
+            for game_id, game in catalog.items():
+                if game_id in self.cm_data:
+                    updates[game_id] = self._check_game(game_id, game, partial=True)
+                else:
+                    new_games[game_id] = self._new_game(game_id, game)
+
+            for game_id, game in updates.items():
+                self.cm_data[game_id].update(game)
+            self.cm_data.update(new_games)
+            self._bulk_changed()
 
-        # This allow us to query the ConsoleMini JSON file,
+        self.log.info('Merged {} ConsoleMini games ({} new)'.format(len(catalog), len(new_games)))
+        self._bulk_done(flush)
+        return len(catalog)
+
+    def remove_games(self, game_ids, flush=True):
+        with self._lock:
+            removed = [game_id for game_id in set(game_ids) if self.cm_data.pop(game_id, None) is not None]
+            self._bulk_changed()
+
+        self.log.info('Removed {} ConsoleMini games'.format(len(removed)))
+        not_found = sorted(set(game_ids) - set(removed))
+        if not_found:
+            self.log.warning('No such ConsoleMini games: {}'.format(', '.join(not_found)))
+        self._bulk_done(flush)
+        return len(removed)
+
+    def _bulk_changed(self):
+        """
+        After a bulk change to cm_data: only a full snapshot can persist it.
+        Must be called with self._lock held.
+        """
+        self._index.rebuild(self.cm_data)
+        self._records = []
+        self._needs_snapshot = True
+        self.dirty += 1
+
+    def _bulk_done(self, flush):
+        if flush:
+            self.flush()
+        self._update_trending_files()
+
+    @classmethod
+    def _new_game(cls, game_id, game):
+        game = cls._check_game(game_id, game)
+        return GameRecord(game['game_name'], game.get('total_bits', 0), game.get('priority', 10))
+
+    @staticmethod
+    def _check_game(game_id, game, partial=False):
+        """
+        Returns a copy of a catalog entry with int total_bits and priority,
+        or raises ValueError. Only a partial entry, updating an existing game, may have no game_name.
+        """
+        unknown = sorted(set(game) - set(GameRecord.FIELDS))
+        if unknown:
+            raise ValueError('ConsoleMini game {} has unknown fields: {}'.format(game_id, ', '.join(unknown)))
+        if not game.get('game_name') and (not partial or 'game_name' in game):
+            raise ValueError('ConsoleMini game {} has no game_name'.format(game_id))
+
+        game = dict(game)
+        for key in ('total_bits', 'priority'):
+            if key in game:
+                try:
+                    game[key] = int(game[key])
+                except (TypeError, ValueError):
+                    raise ValueError('ConsoleMini game {} has an invalid {}: {!r}'.format(game_id, key, game[key]))
+        return game
+
+    def _new_trending(self):
+        if self.trending_mode == 'window':
+            return get_trending('window', window=self.trending_window, bucket_count=self.trending_buckets)
+        if self.trending_mode == 'decay':
+            return get_trending('decay', half_life=self.trending_half_life)
+        return None
+
+    def read_db(self, game_id=None):
+        # This allow us to query the ConsoleMini catalog,
         # and in the case we didn't asked for a specific game_id:
-        # We just read the whole ConsoleMini JSON file
-        return cm_data[game_id] if game_id else cm_data
+        # We just get a copy of the whole ConsoleMini catalog
+        with self._lock:
+            if game_id:
+                return self.cm_data[game_id].to_dict()
+            return dict((key, game.to_dict()) for key, game in self.cm_data.items())
+
+    def flush(self):
+        """
+        Persist the in-memory catalog changes, if any.
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self.dirty:
+                    return False
+
+                # Serializing the snapshot is part of persisting it
+                start = metrics.timer()
+                records, self._records = self._records, []
+                snapshot = None
+                if self._needs_snapshot or self.storage.wants_snapshot(len(records)):
+                    snapshot = json.dumps(self.cm_data, default=GameRecord.to_dict, indent=2, sort_keys=True)
+                self._needs_snapshot = False
+                dirty, self.dirty = self.dirty, 0
+
+            try:
+                if snapshot is not None:
+                    self.storage.write_snapshot(snapshot)
+                else:
+                    self.storage.append(records)
+            except Exception:
+                with self._lock:
+                    # Keep the changes pending, so the next flush retries them: as a whole snapshot,
+                    # since some records may have been appended already
+                    self._records = records + self._records
+                    self._needs_snapshot = True
+                    self.dirty += dirty
+                raise
+            metrics.FLUSH_SECONDS.observe(metrics.timer() - start)
+
+        return True
+
+    def close(self):
+        """
+        Stop the background flusher and persist any pending change.
+        """
+        self._closed.set()
+        self._flush_wanted.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        self.storage.close()
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._flush_wanted.wait(self.flush_interval)
+            self._flush_wanted.clear()
+            try:
+                self.flush()
+            except Exception:
+                # Don't let a full disk or a locked file stop the flusher for good
+                self.log.exception('Could not persist the ConsoleMini catalog, retrying in {}s'.format(
+                    self.flush_interval))
+
+    def _apply_cheer(self, game_id, bits, priority=-1):
+        """
+        Apply a cheer to the in-memory catalog: add its bits to the game,
+        bump its priority, and reset the priority of games now tied with it.
+        Must be called with self._lock held.
+        """
+        current_game = self.cm_data[game_id]
+        current_game.total_bits += bits
+        current_game.priority += priority
+
+        # To set our current game its new priority,
+        # we need to detect every game (including our current game)
+        # which already has the same amount of bits,
+        # and reset their priority to the default (which is 10).
+        self.reset_priority(self.cm_data, current_game.total_bits, game_id)
+        self._index.update(game_id, current_game.total_bits, current_game.priority)
+        return current_game
+
+    def _mark_dirty(self):
+        """
+        Count a pending change. Returns True when the caller must flush(),
+        once it released self._lock: flush() takes self._flush_lock first.
+        """
+        self.dirty += 1
+        if self.flush_every and self.dirty >= self.flush_every:
+            if self._flusher is not None:
+                # Let the flusher thread do the I/O, not the cheer handler
+                self._flush_wanted.set()
+            else:
+                return True
+        return False
 
+    @metrics.timed(metrics.PARSE_CHAT_MESSAGE_SECONDS)
     def parse_chat_message(self, chat_message):
         """
         Parse bits/chat message to detect which game_id was cheered
@@ -53,6 +433,9 @@ class ConsoleMini(object):
         ['cm', '10']
         In this case game_id will be 'CM10'.
         """
+        if self.chat_parser == 'strict':
+            return self._parse_chat_message_strict(chat_message)
+
         cm_index = chat_message.lower().find('cm')
 
         if cm_index == -1:
@@ -70,17 +453,88 @@ class ConsoleMini(object):
         # Remember: game_ids in JSON are in UPPERCASE.
         return game_id.upper()
 
+    def _parse_chat_message_strict(self, chat_message):
+        """
+        Parse bits/chat message with the precompiled CM_TOKEN_RE, only where 'cm' starts a word,
+        and only return a game_id which exists in our catalog.
+        >>> chat_message = "Welcome back! cmon CM 16 cheer100"
+        'CM16', 'welcome' and 'cmon' are not CM tokens.
+
+        >>> chat_message = "cheer100 cm99 cm16 cm3"
+        'CM16' with the 'first' policy (CM99 is not in our catalog), 'CM3' with 'last',
+        and None with 'ignore', as CM16 and CM3 were both cheered.
+        """
+        # The message is never copied: str.find skips to its first 'cm', whatever its case,
+        # and the matcher only runs from there
+        find = chat_message.find
+        starts = [index for index in (find('cm'), find('CM'), find('Cm'), find('cM')) if index != -1]
+        if not starts:
+            return None
+
+        game_id = None
+        cm_data = self.cm_data
+        for match in CM_TOKEN_RE.finditer(chat_message, min(starts)):
+            # Remember: game_ids in JSON are in UPPERCASE.
+            candidate = 'CM' + match.group(1)
+            if candidate not in cm_data or candidate == game_id:
+                continue
+
+            if game_id is None:
+                game_id = candidate
+                if self.multi_cm == 'first':
+                    break
+            elif self.multi_cm == 'ignore':
+                return None
+            else:
+                game_id = candidate
+
+        return game_id
+
+    @metrics.timed(metrics.WRITE_TRENDING_FILES_SECONDS)
     def write_trending_files(self, trending_games):
         """
-        Finally update ConsoleMini trending games (3) text files:
+        Finally update ConsoleMini trending games (trending_count) text files:
         Example trending_games:
         [{'total_bits': 300, 'game_name': 'Kid Chameleon', 'priority': 9},
          {'total_bits': 300, 'game_name': 'Rocket Knight Adventures', 'priority': 10},
          {'total_bits': 100, 'game_name': 'Ecco', 'priority': 10}]
         """
         for index, game in enumerate(trending_games):
-            with open(os.path.join(self.db_dirname, 'consolemini.{}.txt'.format(index + 1)), 'w') as f:
-                f.write('{} : {} bits'.format(game['game_name'], game['total_bits']))
+            # With a window or decay trending_mode, the bits which made the game trend
+            text = '{} : {} bits'.format(game['game_name'], game.get('trending_bits', game['total_bits']))
+            self._write_text_file('consolemini.{}.txt'.format(index + 1), text)
+
+        # A catalog smaller than trending_count (after remove_games...) leaves no stale game behind
+        for index in range(len(trending_games), self.trending_count):
+            self._write_text_file('consolemini.{}.txt'.format(index + 1), '')
+
+    def write_cheerer_files(self, top_cheerers):
+        """
+        Update the top cheerers (cheerers_count) text files, next to the trending games ones:
+        Example top_cheerers:
+        [('dallasnchains', 1200), ('floweb', 300)]
+        """
+        for index, (user_name, bits) in enumerate(top_cheerers):
+            self._write_text_file('cheerers.{}.txt'.format(index + 1), '{} : {} bits'.format(user_name, bits))
+
+    def _write_text_file(self, filename, text):
+        filepath = os.path.join(self.db_dirname, filename)
+
+        # Most cheers don't change the top games, don't touch their files then
+        if self._trending_texts.get(filepath) == text and os.path.exists(filepath):
+            self.trending_files_skipped += 1
+            return
+
+        try:
+            # OBS never reads a half written file this way
+            atomic_write(filepath, text, fsync=False)
+        except OSError:
+            # On Windows, replacing a file which is open elsewhere can fail
+            with open(filepath, 'w') as f:
+                f.write(text)
+        self._trending_texts[filepath] = text
+        self.trending_files_written += 1
+        metrics.TRENDING_FILE_WRITES.inc()
 
     def reset_priority(self, cm_data, total_bits, current_game_id=None):
         """
@@ -89,6 +543,14 @@ class ConsoleMini(object):
         which already has the same amount of bits,
         and reset their priority to the default (which is 10).
         """
+        if cm_data is self.cm_data:
+            # Our own catalog: the trending index already knows which games are tied
+            for game_id in self._index.games_with(total_bits):
+                if game_id != current_game_id:
+                    cm_data[game_id].priority = 10
+                    self._index.update(game_id, total_bits, 10)
+            return cm_data
+
         games_to_reset = [game_id
                           for game_id in cm_data
                           if cm_data[game_id]['total_bits'] == total_bits and
@@ -97,55 +559,159 @@ class ConsoleMini(object):
         for game_id in games_to_reset:
             cm_data[game_id]['priority'] = 10
 
-        return self.write_db(new_data=cm_data) if games_to_reset else cm_data
+        return cm_data
 
-    def update_trending_games(self, chat_message=None, bits_used=None):
+    def get_trending_games(self, count=None):
+        """
+        Returns (a copy of) the count first trending games, trending_count by default.
+        Games are kept sorted by the trending index, no need to sort the whole catalog.
+        With a window or decay trending_mode, games are ranked by their trending_bits instead,
+        and the games which didn't get any lately fill the remaining slots by total_bits.
+        """
+        count = count or self.trending_count
+        with self._lock:
+            if self._trending is None:
+                return [self.cm_data[game_id].to_dict() for game_id in self._index.top(count)]
+
+            # Only the games cheered for lately have a score, there are not many of them
+            scores = dict((game_id, score) for game_id, score in self._trending.scores().items()
+                          if game_id in self.cm_data)
+            game_ids = sorted(scores, key=lambda game_id: (-scores[game_id], self.cm_data[game_id].priority,
+                                                           game_id))[:count]
+            if len(game_ids) < count:
+                game_ids.extend([game_id for game_id in self._index.top(count + len(game_ids))
+                                 if game_id not in scores][:count - len(game_ids)])
+
+            trending_games = []
+            for game_id in game_ids:
+                game = self.cm_data[game_id].to_dict()
+                game['trending_bits'] = int(round(scores.get(game_id, 0)))
+                trending_games.append(game)
+            return trending_games
+
+    @profiled
+    @metrics.timed(metrics.UPDATE_TRENDING_GAMES_SECONDS)
+    def update_trending_games(self, chat_message=None, bits_used=None, user_name=None):
         """
         Main function for ConsoleMini.
         """
+        if user_name and bits_used:
+            # Every cheer counts for its cheerer, whatever the game
+            self.add_cheerers([(user_name, int(bits_used))])
+
         if chat_message and bits_used:
             # Parse bits/chat message to detect which game_id was cheered
             game_id = self.parse_chat_message(chat_message)
             if game_id is None:
+                metrics.UNPARSEABLE_MESSAGES.inc()
                 return False
 
-            # Update ConsoleMini JSON file accordingly
-            cm_data = self.read_db()
-            current_game = cm_data[game_id]
-            current_game['total_bits'] += int(bits_used)
-            current_game['priority'] -= 1
+            # Update the in-memory ConsoleMini catalog accordingly,
+            # it will be persisted later by flush()
+            with self._lock:
+                if game_id not in self.cm_data:
+                    # Counted like apply_cheers does, with or without batching
+                    self.log.warning('Unknown ConsoleMini game: {}'.format(game_id))
+                    metrics.UNPARSEABLE_MESSAGES.inc()
+                    return False
+                flush_now = self._cheer(game_id, int(bits_used))
+            if flush_now:
+                self.flush()
+
+        elif chat_message is not None or bits_used is not None:
+            return False
+
+        self._update_trending_files()
+        return True
+
+    @profiled
+    @metrics.timed(metrics.UPDATE_TRENDING_GAMES_SECONDS)
+    def apply_cheers(self, cheers):
+        """
+        Apply a batch of Cheer in one pass,
+        then update the trending games text files only once.
+        Returns how many cheers were applied.
+        """
+        self.add_cheerers([(cheer.user_name, int(cheer.bits_used))
+                           for cheer in cheers if cheer.user_name and cheer.bits_used])
 
-            # To set our current game its new priority,
-            # we need to detect every game (including our current game)
-            # which already has the same amount of bits,
-            # and reset their priority to the default (which is 10).
-            cm_data = self.reset_priority(cm_data, current_game['total_bits'], game_id)
+        applied = 0
+        flush_now = False
+        with self._lock:
+            for cheer in cheers:
+                if not cheer.chat_message or not cheer.bits_used:
+                    continue
 
-            cm_data[game_id] = current_game
+                game_id = self.parse_chat_message(cheer.chat_message)
+                if game_id is None:
+                    metrics.UNPARSEABLE_MESSAGES.inc()
+                    continue
+                if game_id not in self.cm_data:
+                    # Don't lose the whole batch because of a single unknown game
+                    self.log.warning('Unknown ConsoleMini game: {}'.format(game_id))
+                    metrics.UNPARSEABLE_MESSAGES.inc()
+                    continue
 
-            self.log.info('{} has now {} bits, and its priority is {} !'.format(
-                current_game['game_name'], current_game['total_bits'], current_game['priority']))
-            updated_data = self.write_db(new_data=cm_data)
+                flush_now = self._cheer(game_id, int(cheer.bits_used)) or flush_now
+                applied += 1
+
+        if flush_now:
+            self.flush()
+        if applied:
+            self._update_trending_files()
+        return applied
+
+    def add_cheerers(self, cheerers):
+        """
+        Count the bits of each (user_name, bits) for the top cheerers,
+        then update the top cheerers text files only once.
+        """
+        if self.leaderboard is None or not cheerers:
+            return
 
-        elif chat_message is None and bits_used is None:
-            updated_data = self.read_db()
+        with self._files_lock:
+            with self._lock:
+                for user_name, bits in cheerers:
+                    self.leaderboard.add(user_name, bits)
+                top_cheerers = self.leaderboard.top(self.cheerers_count)
+            self.write_cheerer_files(top_cheerers)
+
+    def _cheer(self, game_id, bits_used):
+        """
+        Apply a cheer, and record it for the next flush.
+        Must be called with self._lock held, returns whether to flush() once it is released.
+        """
+        current_game = self._apply_cheer(game_id, bits_used)
+        if self._trending is not None:
+            self._trending.add(game_id, bits_used)
+        if self.record_cheers:
+            self._records.append([game_id, bits_used, -1])
         else:
-            return False
+            self._needs_snapshot = True
+        flush_now = self._mark_dirty()
+        metrics.CHEERS_APPLIED.inc()
 
-        # updated_data is the now updated ConsoleMini JSON file.
-        # We need to parse it and build a list following this model:
-        # Firstly we sort by total_bits DESC, and then by priority ASC.
+        self.log.info('{} has now {} bits, and its priority is {} !'.format(
+            current_game.game_name, current_game.total_bits, current_game.priority))
+        return flush_now
+
+    def _update_trending_files(self):
+        # cm_data is the now updated ConsoleMini catalog.
+        # The trending index gives us a list following this model:
+        # Firstly sorted by total_bits DESC, and then by priority ASC.
         # [{'total_bits': 300, 'game_name': 'Kid Chameleon', 'priority': 9},
         #  {'total_bits': 300, 'game_name': 'Rocket Knight Adventures', 'priority': 10},
         #  {'total_bits': 100, 'game_name': 'Ecco', 'priority': 10}]
+        # Under self._files_lock, the last trending games read are the last ones written
+        with self._files_lock:
+            trending_games = self.get_trending_games()
 
-        trending_games = sorted([updated_data[game]
-                                 for game in updated_data],
-                                key=lambda k: (-k['total_bits'], k['priority']))[:3]
-
-        self.log.info('Here is the new 3 trending games : {}'.format(trending_games))
+            self.log.info('Here is the new {} trending games : {}'.format(len(trending_games), trending_games))
 
-        # Finally update ConsoleMini trending games text files
-        self.write_trending_files(trending_games)
+            # Push them first, overlays don't have to wait for the disk
+            if self.on_trending is not None:
+                self.on_trending(trending_games)
 
-        return True
+            # Finally update ConsoleMini trending games text files
+            if self.trending_files:
+                self.write_trending_files(trending_games)
@@ -0,0 +1,203 @@
+"""
+A local, fake Twitch PubSub server (Python 3.5+ only, needs websockets).
+
+It speaks just enough of the PubSub protocol for TwitchBitsInfo:
+LISTEN gets a RESPONSE, PING gets a PONG, and bits events are pushed as MESSAGE
+frames to the connections listening to their topic.
+Cheers are either synthetic, or replayed from a JSON lines file holding one bits
+event message per line ({"user_name": ..., "chat_message": ..., "bits_used": ...}).
+
+Serve 1000 synthetic cheers at 200 cheers/sec, once a client listens to channel 1:
+    python fakepubsub.py --port 8080 --channel-id 1 --count 1000 --rate 200
+Then point ws_host = ws://127.0.0.1:8080 in config.ini.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+
+import websockets
+
+
+class FakePubSubServer(object):
+
+    def __init__(self, host='127.0.0.1', port=0, log=None):
+        self.host = host
+        self.port = port
+        self.log = log or logging.getLogger('fake_pubsub')
+
+        self.server = None
+        # Every connection, and the topics it listens to
+        self.listeners = {}
+        self._listening = None
+
+    async def start(self):
+        self._listening = asyncio.Condition()
+        self.server = await websockets.serve(self._handler, self.host, self.port)
+        # With port=0, the OS picked a free port for us
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    @property
+    def url(self):
+        return 'ws://{}:{}'.format(self.host, self.port)
+
+    async def wait_for_listener(self, topic):
+        """
+        Wait until at least one connection listens to topic.
+        """
+        async with self._listening:
+            while not self.get_listeners(topic):
+                await self._listening.wait()
+
+    def get_listeners(self, topic):
+        return [ws for ws, topics in self.listeners.items() if topic in topics]
+
+    async def publish(self, topic, message_data):
+        frame = json.dumps({
+            "type": "MESSAGE",
+            "data": {
+                "topic": topic,
+                # Like Twitch does, the message itself is a JSON string
+                "message": json.dumps(message_data),
+            }
+        })
+        for ws in self.get_listeners(topic):
+            try:
+                await ws.send(frame)
+            except websockets.ConnectionClosed:
+                pass
+
+    async def send_reconnect(self):
+        """
+        Ask every client to reconnect, like Twitch does before a server maintenance.
+        """
+        for ws in list(self.listeners):
+            try:
+                await ws.send(json.dumps({"type": "RECONNECT"}))
+            except websockets.ConnectionClosed:
+                pass
+
+    async def drop_connections(self):
+        """
+        Close every client connection, like a network failure would.
+        """
+        for ws in list(self.listeners):
+            await ws.close()
+
+    async def replay(self, topic, cheers, rate=0, on_sent=None):
+        """
+        Publish every cheer on topic, at rate cheers per second (0 means as fast as possible).
+        on_sent(index) is called right before each cheer is sent.
+        """
+        start = time.time()
+        sent = 0
+        for cheer in cheers:
+            if rate:
+                delay = start + sent / float(rate) - time.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if on_sent is not None:
+                on_sent(sent)
+            await self.publish(topic, cheer)
+            sent += 1
+        return sent
+
+    async def _handler(self, ws, path=None):
+        self.listeners[ws] = set()
+        try:
+            while True:
+                frame = json.loads(await ws.recv())
+                if frame['type'] == 'PING':
+                    await ws.send(json.dumps({"type": "PONG"}))
+                elif frame['type'] == 'LISTEN':
+                    self.listeners[ws].update(frame['data']['topics'])
+                    await ws.send(json.dumps({"type": "RESPONSE", "nonce": frame.get('nonce', ''), "error": ""}))
+                    async with self._listening:
+                        self._listening.notify_all()
+                elif frame['type'] == 'UNLISTEN':
+                    self.listeners[ws].difference_update(frame['data']['topics'])
+                    await ws.send(json.dumps({"type": "RESPONSE", "nonce": frame.get('nonce', ''), "error": ""}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            del self.listeners[ws]
+
+
+def synthetic_cheers(game_ids, count, seed=None):
+    """
+    Yield count random bits event messages, cheering for one of game_ids.
+    """
+    rand = random.Random(seed)
+    for index in range(count):
+        bits_used = rand.choice([1, 10, 50, 100, 100, 500, 1000])
+        yield {
+            "message_id": "{:032x}".format(rand.getrandbits(128)),
+            "user_name": "cheerer{}".format(rand.randrange(count // 10 + 1)),
+            "channel_name": "fakepubsub",
+            "chat_message": "cheer{} {} PogChamp".format(bits_used, rand.choice(game_ids).lower()),
+            "bits_used": bits_used,
+            "total_bits_used": bits_used,
+            "context": "cheer",
+        }
+
+
+def read_cheers(filepath):
+    """
+    Yield the bits event messages of a JSON lines file.
+    """
+    with open(filepath) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Twitch PubSub server, replaying bits events.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--channel-id', default='1')
+    parser.add_argument('--catalog', default='consolemini.json',
+                        help='ConsoleMini JSON file the synthetic cheers pick their game_ids from')
+    parser.add_argument('--count', type=int, default=1000, help='how many synthetic cheers to send')
+    parser.add_argument('--replay', help='JSON lines file of recorded bits event messages to send instead')
+    parser.add_argument('--rate', type=float, default=0, help='cheers per second, 0 means as fast as possible')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    log = logging.getLogger('fake_pubsub')
+
+    if args.replay:
+        cheers = list(read_cheers(args.replay))
+    else:
+        with open(args.catalog) as f:
+            cheers = list(synthetic_cheers(sorted(json.load(f)), args.count))
+
+    async def serve():
+        server = await FakePubSubServer(args.host, args.port, log=log).start()
+        topic = 'channel-bitsevents.{}'.format(args.channel_id)
+        log.info('Listening on {}, waiting for a client to LISTEN to {}'.format(server.url, topic))
+        await server.wait_for_listener(topic)
+
+        start = time.time()
+        sent = await server.replay(topic, cheers, rate=args.rate)
+        log.info('Sent {} cheers in {:.2f}s'.format(sent, time.time() - start))
+        # Keep answering PINGs until we're killed
+        await asyncio.Event().wait()
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        loop.run_until_complete(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Top cheerers of a stream, by bits cheered.
+
+ExactLeaderboard counts every cheerer, which is fine for small channels.
+SpaceSavingLeaderboard only keeps capacity cheerers, whatever the number of distinct
+cheerers: when a new one shows up and we're full, it takes the place (and the bits)
+of the smallest one. Any cheerer with more than 1 / capacity of all the bits is
+guaranteed to be kept, and a count is never more than error bits too high.
+"""
+import heapq
+
+
+class ExactLeaderboard(object):
+
+    def __init__(self):
+        self.bits = {}
+
+    def add(self, user_name, bits):
+        self.bits[user_name] = self.bits.get(user_name, 0) + bits
+
+    def top(self, count):
+        """
+        Returns the count first (user_name, bits), most bits first.
+        """
+        return heapq.nsmallest(count, self.bits.items(), key=lambda item: (-item[1], item[0]))
+
+    def __len__(self):
+        return len(self.bits)
+
+
+class SpaceSavingLeaderboard(ExactLeaderboard):
+
+    def __init__(self, capacity=1000):
+        super(SpaceSavingLeaderboard, self).__init__()
+        self.capacity = capacity
+        # How many bits a cheerer may have inherited from the ones it replaced
+        self.errors = {}
+        # (bits, user_name) of every cheerer, plus outdated ones, skipped when found on top
+        self._heap = []
+
+    def add(self, user_name, bits):
+        if user_name not in self.bits and len(self.bits) >= self.capacity:
+            # Replace the cheerer with the least bits, we inherit its bits
+            smallest_bits, smallest_user_name = self._pop_smallest()
+            del self.bits[smallest_user_name]
+            self.errors.pop(smallest_user_name, None)
+            self.bits[user_name] = smallest_bits
+            self.errors[user_name] = smallest_bits
+
+        super(SpaceSavingLeaderboard, self).add(user_name, bits)
+        heapq.heappush(self._heap, (self.bits[user_name], user_name))
+        if len(self._heap) > 4 * self.capacity:
+            # Too many outdated entries, start over from the live counts
+            self._heap = [(count, name) for name, count in self.bits.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_smallest(self):
+        while True:
+            bits, user_name = heapq.heappop(self._heap)
+            if self.bits.get(user_name) == bits:
+                return bits, user_name
+
+
+def get_leaderboard(cheerers_mode, capacity=1000):
+    if cheerers_mode == 'exact':
+        return ExactLeaderboard()
+    if cheerers_mode == 'approximate':
+        return SpaceSavingLeaderboard(capacity)
+    raise ValueError('Unknown cheerers mode: {}'.format(cheerers_mode))
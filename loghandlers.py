@@ -0,0 +1,72 @@
+"""
+Logging off the message-handling thread.
+
+The twitch_bits_info logger only gets a QueueHandler: logging a record costs an enqueue,
+and a QueueListener thread does the console and file I/O, flushing the log file once
+per batch of records instead of once per record.
+QueueHandler and QueueListener need Python 3.2+, Python 2 keeps logging synchronously.
+"""
+import logging
+
+try:
+    from logging.handlers import QueueHandler, QueueListener
+except ImportError:
+    QueueHandler = QueueListener = None
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+class BatchedFileHandler(logging.FileHandler):
+    """
+    A FileHandler which doesn't flush after every record: its listener does, once it caught up.
+    """
+
+    def emit(self, record):
+        try:
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write('{}\n'.format(self.format(record)))
+            if BatchingQueueListener is None:
+                # Python 2: there is no listener to flush us
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+
+if QueueListener is not None:
+    class BatchingQueueListener(QueueListener):
+        """
+        A QueueListener flushing its handlers when the queue runs empty,
+        so bursts of records are written in batches.
+        """
+
+        def dequeue(self, block):
+            try:
+                return self.queue.get_nowait()
+            except queue.Empty:
+                for handler in self.handlers:
+                    handler.flush()
+                return self.queue.get(block)
+else:
+    BatchingQueueListener = None
+
+
+def start_queue_logging(log, handlers):
+    """
+    Route log records to handlers through a queue and a listener thread.
+    Returns the started listener (stop() it to flush everything), or None on Python 2,
+    where handlers are attached to log as usual.
+    """
+    if BatchingQueueListener is None:
+        for handler in handlers:
+            log.addHandler(handler)
+        return None
+
+    records = queue.Queue()
+    log.addHandler(QueueHandler(records))
+    listener = BatchingQueueListener(records, *handlers)
+    listener.start()
+    return listener
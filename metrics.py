@@ -0,0 +1,187 @@
+"""
+Built-in metrics of the bits events pipeline.
+
+Counters and histograms live in REGISTRY, and can be read in-process with
+REGISTRY.snapshot() (that's what the Tk app shows), or scraped in the Prometheus
+text format from a local HTTP endpoint started with start_http_server().
+"""
+from contextlib import contextmanager
+import functools
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+
+# Monotonic when available, we only measure durations
+timer = getattr(time, 'perf_counter', time.time)
+
+# Seconds, from 100us to 10s: the hot path should stay in the first buckets
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+
+
+class Counter(object):
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+    def render(self):
+        return ['# HELP {} {}'.format(self.name, self.documentation),
+                '# TYPE {} counter'.format(self.name),
+                '{} {}'.format(self.name, self.value)]
+
+
+class Histogram(object):
+
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+        # Also called with each value, by a profiling.StageTracer
+        self.trace = None
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for index, bucket in enumerate(self.buckets):
+                if value <= bucket:
+                    self.counts[index] += 1
+                    break
+        if self.trace is not None:
+            self.trace(value)
+
+    @contextmanager
+    def time(self):
+        start = timer()
+        try:
+            yield
+        finally:
+            self.observe(timer() - start)
+
+    def snapshot(self):
+        with self._lock:
+            return {'count': self.count, 'sum': self.sum,
+                    'avg': self.sum / self.count if self.count else 0.0}
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.documentation),
+                 '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            cumulative = 0
+            for bucket, count in zip(self.buckets, self.counts):
+                cumulative += count
+                lines.append('{}_bucket{{le="{}"}} {}'.format(self.name, bucket, cumulative))
+            lines.append('{}_bucket{{le="+Inf"}} {}'.format(self.name, self.count))
+            lines.append('{}_sum {}'.format(self.name, self.sum))
+            lines.append('{}_count {}'.format(self.name, self.count))
+        return lines
+
+
+def timed(histogram):
+    """
+    Decorator observing how long each call of the decorated function takes.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class Registry(object):
+
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation):
+        return self._register(Counter(name, documentation))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, buckets))
+
+    def snapshot(self):
+        return dict((metric.name, metric.snapshot()) for metric in self.metrics)
+
+    def render(self):
+        """
+        All our metrics, in the Prometheus text exposition format.
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+
+REGISTRY = Registry()
+
+FRAMES_RECEIVED = REGISTRY.counter('twitch_bits_info_frames_received_total', 'PubSub frames received.')
+FRAME_DECODE_SECONDS = REGISTRY.histogram('twitch_bits_info_frame_decode_seconds',
+                                          'Time spent decoding a PubSub frame.')
+PING_RTT_SECONDS = REGISTRY.histogram('twitch_bits_info_ping_rtt_seconds', 'PubSub PING to PONG round-trip time.')
+CHEERS_APPLIED = REGISTRY.counter('consolemini_cheers_applied_total', 'Cheers applied to a ConsoleMini catalog.')
+UNPARSEABLE_MESSAGES = REGISTRY.counter('consolemini_unparseable_messages_total',
+                                        'Cheers without a game_id ConsoleMini could use.')
+TRENDING_FILE_WRITES = REGISTRY.counter('consolemini_trending_file_writes_total', 'Trending games files written.')
+PARSE_CHAT_MESSAGE_SECONDS = REGISTRY.histogram('consolemini_parse_chat_message_seconds',
+                                                'Time spent parsing a cheer chat message.')
+FLUSH_SECONDS = REGISTRY.histogram('consolemini_flush_seconds', 'Time spent persisting a ConsoleMini catalog.')
+UPDATE_TRENDING_GAMES_SECONDS = REGISTRY.histogram('consolemini_update_trending_games_seconds',
+                                                   'Time spent in update_trending_games (or apply_cheers).')
+WRITE_TRENDING_FILES_SECONDS = REGISTRY.histogram('consolemini_write_trending_files_seconds',
+                                                  'Time spent in write_trending_files.')
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes would flood our logs otherwise
+        pass
+
+
+def start_http_server(port, host='127.0.0.1'):
+    """
+    Serve REGISTRY on http://host:port/metrics from a daemon thread.
+    Returns the HTTPServer, call its shutdown() to stop it.
+    """
+    server = HTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http')
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,256 @@
+"""
+Local HTTP server pushing the trending games to OBS browser sources.
+
+Instead of polling the consolemini.N.txt files, an overlay opens
+http://host:port/events/<channel_id> (Server-Sent Events): it first gets a 'snapshot'
+event of the trending games, then a 'diff' event with only the ranks which changed,
+each time ConsoleMini updates them. GET /trending/<channel_id> returns the current
+snapshot, straight from memory, and / is a ready to use overlay page.
+The channel_id may be left out, for the first channel served.
+
+Each overlay client has its own thread and queue: publishing never waits for a client,
+and a client too slow to keep up is disconnected, its browser reconnects by itself
+and starts over from a new snapshot.
+"""
+import json
+import logging
+import threading
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from Queue import Empty, Full, Queue
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from queue import Empty, Full, Queue
+    from socketserver import ThreadingMixIn
+
+# Seconds between SSE comments sent to idle clients, so dead ones are noticed
+KEEP_ALIVE_INTERVAL = 15
+
+OVERLAY_PAGE = u"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<style>body { color: white; font: bold 32px sans-serif; text-shadow: 2px 2px 2px black; }</style>
+</head>
+<body>
+<div id="games"></div>
+<script>
+var games = [];
+function render() {
+    document.getElementById('games').innerHTML = games.map(function (game) {
+        var line = document.createElement('div');
+        line.textContent = game.game_name + ' : ' + game.bits + ' bits';
+        return line.outerHTML;
+    }).join('');
+}
+var events = new EventSource('/events/' + location.hash.slice(1));
+events.addEventListener('snapshot', function (event) {
+    games = JSON.parse(event.data).games;
+    render();
+});
+events.addEventListener('diff', function (event) {
+    var diff = JSON.parse(event.data);
+    diff.changed.forEach(function (game) { games[game.rank - 1] = game; });
+    games.length = diff.size;
+    render();
+});
+</script>
+</body>
+</html>
+"""
+
+
+def overlay_games(trending_games):
+    """
+    What overlays get of each trending game: its rank, name,
+    and bits as written in the trending text files.
+    """
+    return [{'rank': index + 1,
+             'game_name': game['game_name'],
+             'bits': game.get('trending_bits', game['total_bits']),
+             'total_bits': game['total_bits']}
+            for index, game in enumerate(trending_games)]
+
+
+def trending_diff(old_games, new_games):
+    """
+    Returns the games of new_games whose rank changed content since old_games,
+    and how many games there are now, or None when nothing changed.
+    """
+    changed = [game for index, game in enumerate(new_games)
+               if index >= len(old_games) or old_games[index] != game]
+    if not changed and len(old_games) == len(new_games):
+        return None
+    return {'changed': changed, 'size': len(new_games)}
+
+
+class OverlayHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        parts = self.path.split('?')[0].strip('/').split('/')
+        channel_id = self.server.get_channel_id(parts[1] if len(parts) > 1 else None)
+
+        if parts[0] == '':
+            self.send_body(OVERLAY_PAGE, 'text/html; charset=utf-8')
+        elif parts[0] == 'trending' and channel_id is not None:
+            self.send_body(json.dumps(self.server.snapshot(channel_id)), 'application/json')
+        elif parts[0] == 'events' and channel_id is not None:
+            self.send_events(channel_id)
+        else:
+            self.send_error(404)
+
+    def send_body(self, body, content_type):
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_events(self, channel_id):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+
+        queue, snapshot = self.server.subscribe(channel_id)
+        try:
+            self.send_event('snapshot', json.dumps(snapshot))
+            while True:
+                try:
+                    data = queue.get(timeout=KEEP_ALIVE_INTERVAL)
+                except Empty:
+                    self.wfile.write(b': keep-alive\n\n')
+                    self.wfile.flush()
+                    continue
+                if data is None:
+                    break
+                self.send_event('diff', data)
+        except (IOError, OSError):
+            # The overlay went away
+            pass
+        finally:
+            self.server.unsubscribe(channel_id, queue)
+
+    def send_event(self, event, data):
+        self.wfile.write('event: {}\ndata: {}\n\n'.format(event, data).encode('utf-8'))
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        # Overlays reconnecting would flood our logs otherwise
+        pass
+
+
+class OverlayServer(ThreadingMixIn, HTTPServer):
+    """
+    Keeps the latest trending games of each channel, and pushes their diffs
+    to the overlays listening to it. Call publish() with each new trending games.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, log=None, max_pending=100):
+        HTTPServer.__init__(self, address, OverlayHandler)
+        self.log = log or logging.getLogger('twitch_bits_info')
+        # How many diffs a client may be late by, before it is disconnected
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._clients = {}
+        self._default_channel_id = None
+
+    def publish(self, channel_id, trending_games):
+        """
+        Make trending_games the current snapshot of channel_id,
+        and queue what changed for each of its overlays.
+        """
+        games = overlay_games(trending_games)
+        with self._lock:
+            channel = self._channels.get(channel_id)
+            if channel is None:
+                channel = self._channels[channel_id] = {'version': 0, 'games': []}
+                if self._default_channel_id is None:
+                    self._default_channel_id = channel_id
+
+            diff = trending_diff(channel['games'], games)
+            if diff is None:
+                return
+            channel['version'] += 1
+            channel['games'] = games
+            diff['version'] = channel['version']
+            data = json.dumps(diff)
+
+            for queue in list(self._clients.get(channel_id, ())):
+                try:
+                    queue.put_nowait(data)
+                except Full:
+                    self.log.warning('Overlay client too slow, disconnecting it')
+                    self._clients[channel_id].discard(queue)
+                    self._close_queue(queue)
+
+    def snapshot(self, channel_id):
+        with self._lock:
+            channel = self._channels.get(channel_id, {'version': 0, 'games': []})
+            return {'version': channel['version'], 'games': list(channel['games'])}
+
+    def subscribe(self, channel_id):
+        """
+        Returns a new client queue of channel_id diffs, and the snapshot they apply to.
+        """
+        queue = Queue(self.max_pending)
+        with self._lock:
+            self._clients.setdefault(channel_id, set()).add(queue)
+            channel = self._channels.get(channel_id, {'version': 0, 'games': []})
+            return queue, {'version': channel['version'], 'games': list(channel['games'])}
+
+    def unsubscribe(self, channel_id, queue):
+        with self._lock:
+            self._clients.get(channel_id, set()).discard(queue)
+
+    def get_channel_id(self, channel_id=None):
+        with self._lock:
+            if channel_id:
+                return channel_id if channel_id in self._channels else None
+            return self._default_channel_id
+
+    def client_count(self):
+        with self._lock:
+            return sum(len(clients) for clients in self._clients.values())
+
+    def close(self):
+        """
+        Disconnect every overlay, and stop serving.
+        """
+        with self._lock:
+            for clients in self._clients.values():
+                for queue in clients:
+                    self._close_queue(queue)
+            self._clients = {}
+        self.shutdown()
+        self.server_close()
+
+    @staticmethod
+    def _close_queue(queue):
+        # Make room for the None which stops the client
+        while True:
+            try:
+                queue.get_nowait()
+            except Empty:
+                break
+        queue.put_nowait(None)
+
+
+def start_overlay_server(port, host='127.0.0.1', log=None):
+    """
+    Serve overlays on http://host:port/ from a daemon thread.
+    Returns the OverlayServer, call its close() to stop it.
+    """
+    server = OverlayServer((host, port), log=log)
+    thread = threading.Thread(target=server.serve_forever, name='overlay-http')
+    thread.daemon = True
+    thread.start()
+    return server
@@ -0,0 +1,173 @@
+"""
+On-demand profiling of the bits events pipeline, instead of verbose = 1 when latency spikes.
+
+A ProfileSession runs cProfile around on_message, update_trending_games and apply_cheers
+(the functions decorated with profiled) for a number of seconds or events, then dumps
+its stats to a .prof file: python -m pstats profile.prof, or snakeviz...
+Only one event is profiled at a time, events handled by other threads meanwhile run as usual.
+
+A StageTracer appends how long each pipeline stage took (decode, parse, update,
+persist, write) to a compact trace file, one "<unix ms> <stage> <us>" line per timing,
+written by batches: cheap enough to leave on.
+"""
+import cProfile
+from contextlib import contextmanager
+import functools
+import logging
+import threading
+import time
+
+import metrics
+
+# The pipeline stages a StageTracer traces, and the histograms timing them
+STAGES = (('decode', metrics.FRAME_DECODE_SECONDS),
+          ('parse', metrics.PARSE_CHAT_MESSAGE_SECONDS),
+          ('update', metrics.UPDATE_TRENDING_GAMES_SECONDS),
+          ('persist', metrics.FLUSH_SECONDS),
+          ('write', metrics.WRITE_TRENDING_FILES_SECONDS))
+
+# The running ProfileSession, if any
+_session = None
+_session_lock = threading.Lock()
+
+
+class ProfileSession(object):
+
+    def __init__(self, filepath, seconds=0, events=0, log=None):
+        self.filepath = filepath
+        self.seconds = seconds
+        self.max_events = events
+        self.log = log or logging.getLogger('twitch_bits_info')
+        self.events = 0
+        self.done = False
+        self.started_at = time.time()
+        self._profiler = cProfile.Profile()
+        # cProfile is not thread safe: one profiled event at a time
+        self._lock = threading.Lock()
+        self._timer = None
+        if seconds:
+            # Stop on time, even if no event comes
+            self._timer = threading.Timer(seconds, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+
+    @contextmanager
+    def event(self):
+        if self.done or not self._lock.acquire(False):
+            # Another thread's event is being profiled, or a nested one: this one is part of it
+            yield
+            return
+
+        try:
+            self._profiler.enable()
+            try:
+                yield
+            finally:
+                self._profiler.disable()
+            self.events += 1
+            if self.max_events and self.events >= self.max_events:
+                self._finish()
+        finally:
+            self._lock.release()
+
+    def stop(self):
+        """
+        Dump the stats collected so far, and stop profiling.
+        """
+        with self._lock:
+            self._finish()
+
+    def _finish(self):
+        if self.done:
+            return
+        self.done = True
+        if self._timer is not None:
+            self._timer.cancel()
+        self._profiler.dump_stats(self.filepath)
+        self.log.info('Profiled {} events in {:.1f}s, stats written to {}'.format(
+            self.events, time.time() - self.started_at, self.filepath))
+
+
+def start_session(filepath, seconds=0, events=0, log=None):
+    """
+    Start profiling the next events, for seconds and/or events (whichever comes first).
+    A running session is stopped first. Returns the new ProfileSession.
+    """
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.stop()
+        _session = ProfileSession(filepath, seconds=seconds, events=events, log=log)
+        return _session
+
+
+def stop_session():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.stop()
+            _session = None
+
+
+def profiled(func):
+    """
+    Decorator profiling each call of the decorated function, while a session runs.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        session = _session
+        if session is None or session.done:
+            return func(*args, **kwargs)
+        with session.event():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class StageTracer(object):
+    """
+    Buffer the stage timings, and append them to filepath every flush_every timings,
+    or flush_interval seconds.
+    """
+
+    def __init__(self, filepath, flush_every=1000, flush_interval=1.0):
+        self.filepath = filepath
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._lines = []
+        self._lock = threading.Lock()
+        self._flushed_at = time.time()
+        self._file = open(filepath, 'a')
+
+    def attach(self):
+        """
+        Trace every stage histogram observation from now on.
+        """
+        for stage, histogram in STAGES:
+            histogram.trace = functools.partial(self.record, stage)
+
+    def record(self, stage, seconds):
+        now = time.time()
+        line = '{} {} {}\n'.format(int(now * 1000), stage, int(seconds * 1e6))
+        with self._lock:
+            self._lines.append(line)
+            if len(self._lines) >= self.flush_every or now - self._flushed_at >= self.flush_interval:
+                self._write()
+
+    def flush(self):
+        with self._lock:
+            self._write()
+
+    def _write(self):
+        lines, self._lines = self._lines, []
+        self._flushed_at = time.time()
+        if lines and self._file is not None:
+            self._file.write(''.join(lines))
+            self._file.flush()
+
+    def close(self):
+        for _, histogram in STAGES:
+            histogram.trace = None
+        self.flush()
+        with self._lock:
+            self._file.close()
+            self._file = None
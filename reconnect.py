@@ -0,0 +1,50 @@
+"""
+What both PubSub clients need to survive a dropped connection:
+jittered exponential backoff delays between reconnection attempts,
+and a filter of recently seen events, so the events delivered twice
+around a reconnection are only counted once.
+"""
+from collections import OrderedDict
+import random
+import threading
+
+
+def backoff_delay(attempt, base=1.0, cap=120.0):
+    """
+    Seconds to wait before reconnection attempt number attempt (0 for the first one):
+    uniformly drawn up to base * 2 ** attempt, capped to cap ("full jitter"),
+    so many clients dropped at once don't all come back at the same time.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class RecentEvents(object):
+    """
+    A bounded LRU of the last maxlen event ids.
+    """
+
+    def __init__(self, maxlen=1000):
+        self.maxlen = maxlen
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        # How many events were already seen
+        self.duplicates = 0
+
+    def seen(self, event_id):
+        """
+        Returns True if event_id was already seen, and remembers it either way.
+        """
+        with self._lock:
+            if event_id in self._ids:
+                # Still recent: move it to the end, so it is evicted last
+                self._ids[event_id] = self._ids.pop(event_id)
+                self.duplicates += 1
+                return True
+
+            self._ids[event_id] = True
+            if len(self._ids) > self.maxlen:
+                self._ids.popitem(last=False)
+            return False
+
+    def __len__(self):
+        return len(self._ids)
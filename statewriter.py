@@ -0,0 +1,210 @@
+"""
+State-writer process: ConsoleMini and its files, away from the websocket.
+
+With state_writer = process, TwitchBitsInfo only receives and decodes PubSub frames,
+and hands batches of cheers to a child process owning every ConsoleMini catalog
+and trending games text file, through a multiprocessing.Queue.
+A slow disk then only delays the trending files, never the frame reads and the PINGs,
+and both sides get their own core.
+"""
+import functools
+import logging
+import multiprocessing
+import os
+
+try:
+    from Queue import Empty
+except ImportError:
+    from queue import Empty
+
+from consolemini import Cheer, ConsoleMini
+from loghandlers import BatchedFileHandler, start_queue_logging
+from overlay import start_overlay_server
+from profiling import StageTracer
+
+# How many queued messages the state-writer coalesces before applying them
+MAX_COALESCED_MESSAGES = 100
+
+# The ConsoleMini bulk operations a StateWriterChannel can ask for
+BULK_OPERATIONS = ('reset_all', 'import_catalog', 'merge_catalog', 'remove_games')
+
+
+def run_state_writer(queue, cm_options, log_level=logging.INFO, log_filepath=None, overlay_address=None,
+                     trace_filepath=None):
+    """
+    State-writer process main loop, cm_options are the ConsoleMini kwargs shared by every channel.
+    Messages are ('channel', channel_id, db_filepath) to serve a new channel,
+    ('cheers', channel_id, [(user_name, chat_message, bits_used), ...]),
+    ('update', channel_id) to rewrite the trending files,
+    ('bulk', channel_id, operation, args) for one of BULK_OPERATIONS, and None to stop.
+    Logs go to stderr, and to log_filepath when set.
+    With an overlay_address (host, port), the overlay server is served from here.
+    With a trace_filepath, our stages are traced next to it, in <name>-state-writer<ext>.
+    """
+    log = logging.getLogger('twitch_bits_info')
+    # Forked processes inherit the handlers of our parent,
+    # but not the log listener thread serving them: use our own
+    for handler in list(log.handlers):
+        log.removeHandler(handler)
+    handlers = [logging.StreamHandler()]
+    if log_filepath:
+        handlers.append(BatchedFileHandler(filename=log_filepath))
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    log.setLevel(log_level)
+    log_listener = start_queue_logging(log, handlers)
+
+    tracer = None
+    if trace_filepath:
+        tracer = StageTracer('{}-state-writer{}'.format(*os.path.splitext(trace_filepath)))
+        tracer.attach()
+
+    overlay_server = None
+    if overlay_address is not None:
+        overlay_server = start_overlay_server(overlay_address[1], overlay_address[0], log=log)
+        log.info('Serving overlays on http://{}:{}/'.format(*overlay_address))
+
+    consoleminis = {}
+    try:
+        running = True
+        while running:
+            messages = [queue.get()]
+            # When we fall behind, apply everything already waiting at once
+            while len(messages) < MAX_COALESCED_MESSAGES:
+                try:
+                    messages.append(queue.get_nowait())
+                except Empty:
+                    break
+
+            cheers, updates = {}, set()
+            for message in messages:
+                if message is None:
+                    running = False
+                elif message[0] == 'channel':
+                    consoleminis[message[1]] = add_channel(message[1], message[2], cm_options, log, overlay_server)
+                elif message[0] == 'cheers':
+                    cheers.setdefault(message[1], []).extend(Cheer(*cheer) for cheer in message[2])
+                elif message[0] == 'update':
+                    updates.add(message[1])
+                elif message[0] == 'bulk':
+                    # Cheers queued before a bulk operation are applied before it
+                    apply_channel_cheers(consoleminis, cheers, updates, log)
+                    cheers = {}
+                    try:
+                        getattr(consoleminis[message[1]], message[2])(*message[3])
+                    except Exception:
+                        log.exception('Could not {} for channel {}'.format(message[2], message[1]))
+                    updates.discard(message[1])
+
+            apply_channel_cheers(consoleminis, cheers, updates, log)
+            for channel_id in updates:
+                consoleminis[channel_id].update_trending_games()
+    finally:
+        for cm in consoleminis.values():
+            cm.close()
+        if overlay_server is not None:
+            overlay_server.close()
+        if tracer is not None:
+            tracer.close()
+        if log_listener is not None:
+            log_listener.stop()
+
+
+def apply_channel_cheers(consoleminis, cheers, updates, log):
+    for channel_id, channel_cheers in cheers.items():
+        try:
+            if consoleminis[channel_id].apply_cheers(channel_cheers):
+                updates.discard(channel_id)
+        except Exception:
+            log.exception('Could not apply {} cheers for channel {}'.format(len(channel_cheers), channel_id))
+
+
+def add_channel(channel_id, db_filepath, cm_options, log, overlay_server=None):
+    if overlay_server is None:
+        return ConsoleMini(db_filepath=db_filepath, log=log, **cm_options)
+
+    cm = ConsoleMini(db_filepath=db_filepath, log=log,
+                     on_trending=functools.partial(overlay_server.publish, channel_id), **cm_options)
+    overlay_server.publish(channel_id, cm.get_trending_games())
+    return cm
+
+
+class StateWriter(object):
+    """
+    Start and feed the state-writer process.
+    """
+
+    def __init__(self, cm_options, log=None, log_filepath=None, overlay_address=None, trace_filepath=None):
+        self.log = log or logging.getLogger('twitch_bits_info')
+        self.queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=run_state_writer, name='state-writer',
+                                               args=(self.queue, cm_options, self.log.getEffectiveLevel(),
+                                                     log_filepath, overlay_address, trace_filepath))
+        self.process.daemon = True
+        self.process.start()
+
+    def add_channel(self, channel_id, db_filepath):
+        """
+        Let the state-writer serve a channel, returns its StateWriterChannel.
+        """
+        self.queue.put(('channel', channel_id, db_filepath))
+        return StateWriterChannel(self, channel_id)
+
+    def put_cheers(self, channel_id, cheers):
+        # Plain tuples are cheaper to pickle than namedtuples
+        self.queue.put(('cheers', channel_id, [tuple(cheer) for cheer in cheers]))
+
+    def put_update(self, channel_id):
+        self.queue.put(('update', channel_id))
+
+    def put_bulk(self, channel_id, operation, *args):
+        if operation not in BULK_OPERATIONS:
+            raise ValueError('Unknown ConsoleMini bulk operation: {}'.format(operation))
+        self.queue.put(('bulk', channel_id, operation, args))
+
+    def close(self):
+        """
+        Let the state-writer apply what is still queued, persist it, and stop.
+        """
+        self.queue.put(None)
+        self.process.join()
+
+
+class StateWriterChannel(object):
+    """
+    Stands for a channel's ConsoleMini in the ingest process:
+    cheers are queued for the state-writer instead of applied here.
+    """
+
+    def __init__(self, writer, channel_id):
+        self.writer = writer
+        self.channel_id = channel_id
+
+    def apply_cheers(self, cheers):
+        self.writer.put_cheers(self.channel_id, cheers)
+        return len(cheers)
+
+    def update_trending_games(self, chat_message=None, bits_used=None, user_name=None):
+        if chat_message and bits_used:
+            self.writer.put_cheers(self.channel_id, [Cheer(user_name, chat_message, bits_used)])
+        else:
+            self.writer.put_update(self.channel_id)
+        return True
+
+    # Bulk operations are applied by the state-writer, in order with the cheers queued before them
+    def reset_all(self):
+        self.writer.put_bulk(self.channel_id, 'reset_all')
+
+    def import_catalog(self, catalog):
+        self.writer.put_bulk(self.channel_id, 'import_catalog', catalog)
+
+    def merge_catalog(self, catalog):
+        self.writer.put_bulk(self.channel_id, 'merge_catalog', catalog)
+
+    def remove_games(self, game_ids):
+        self.writer.put_bulk(self.channel_id, 'remove_games', list(game_ids))
+
+    def close(self):
+        # The state-writer persists its own ConsoleMini when it stops
+        pass
@@ -0,0 +1,46 @@
+import logging
+import os
+import shutil
+import sys
+
+import pytest
+
+from consolemini import ConsoleMini
+
+BASE_DB_FILEPATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'consolemini.base.json')
+
+# async def is a SyntaxError before Python 3.5: these tests can't even be collected there
+collect_ignore = []
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_aiopubsub.py')
+
+
+@pytest.fixture
+def db_filepath(tmpdir):
+    """
+    A private copy of consolemini.base.json, in tmpdir.
+    """
+    db_filepath = str(tmpdir.join('consolemini.json'))
+    shutil.copyfile(src=BASE_DB_FILEPATH, dst=db_filepath)
+    return db_filepath
+
+
+@pytest.fixture
+def make_cm(db_filepath):
+    """
+    Build ConsoleMini instances working on db_filepath, without the background flusher
+    unless options ask for it. They are all closed after the test.
+    """
+    consoleminis = []
+
+    def make_cm(**options):
+        options.setdefault('log', logging.getLogger())
+        options.setdefault('flush_interval', 0)
+        options.setdefault('flush_every', 0)
+        cm = ConsoleMini(db_filepath=db_filepath, **options)
+        consoleminis.append(cm)
+        return cm
+
+    yield make_cm
+    for cm in consoleminis:
+        cm.close()
@@ -0,0 +1,62 @@
+import asyncio
+
+import pytest
+
+websockets = pytest.importorskip('websockets')
+
+from aiopubsub import AsyncPubSubClient, run_clients  # noqa: E402
+
+
+class FakeWebSocket(object):
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.sent = []
+
+    async def send(self, data):
+        self.sent.append(data)
+
+    async def recv(self):
+        if not self.messages:
+            raise websockets.ConnectionClosed(None, None)
+        return self.messages.pop(0)
+
+    async def close(self):
+        pass
+
+
+class TestAsyncPubSubClient:
+
+    def test_bad_message_does_not_stop_client(self):
+        handled = []
+
+        def on_message(client, message):
+            if message == 'bad':
+                raise KeyError('CMON')
+            handled.append(message)
+
+        client = AsyncPubSubClient('ws://unused', ['topic'], 'token', on_message, ping_interval=3600)
+        client.ws = FakeWebSocket(['first', 'bad', 'last'])
+        asyncio.new_event_loop().run_until_complete(client._serve())
+        assert handled == ['first', 'last']
+
+    def test_run_clients_failure_does_not_cancel_others(self):
+        class FailingClient(AsyncPubSubClient):
+            async def run(self):
+                raise RuntimeError('boom')
+
+        class SlowClient(AsyncPubSubClient):
+            done = False
+
+            async def run(self):
+                await asyncio.sleep(0.01)
+                self.done = True
+
+        slow_client = SlowClient('ws://unused', [], 'token', None)
+        loop = asyncio.new_event_loop()
+        try:
+            run_clients(loop, [FailingClient('ws://unused', [], 'token', None), slow_client])
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        assert slow_client.done
@@ -0,0 +1,91 @@
+import logging
+
+import pytest
+
+pytest.importorskip('tkinter')
+
+from app import TextHandler  # noqa: E402
+
+
+class FakeText(object):
+    """
+    The parts of a Tk Text widget TextHandler uses, without a display.
+    """
+
+    def __init__(self):
+        self.content = ''
+        self.state = None
+        self.inserts = 0
+        self.callbacks = []
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+
+    def configure(self, state=None):
+        self.state = state
+
+    def insert(self, index, text):
+        assert index == 'end'
+        self.content += text
+        self.inserts += 1
+
+    def index(self, index):
+        assert index == 'end-1c'
+        lines = self.content.split('\n')
+        return '{}.{}'.format(len(lines), len(lines[-1]))
+
+    def delete(self, start, end):
+        assert start == '1.0'
+        line = int(end.split('.')[0])
+        self.content = '\n'.join(self.content.split('\n')[line - 1:])
+
+    def yview(self, index):
+        pass
+
+    def lines(self):
+        return self.content.splitlines()
+
+
+def make_record(index):
+    return logging.LogRecord('twitch_bits_info', logging.INFO, __file__, 0, 'line %d', (index,), None)
+
+
+class TestTextHandler:
+
+    def test_records_are_coalesced(self):
+        text = FakeText()
+        handler = TextHandler(text, max_lines=10)
+        for index in range(3):
+            handler.emit(make_record(index))
+
+        handler.flush_pending()
+        assert text.lines() == ['line 0', 'line 1', 'line 2']
+        assert text.inserts == 1
+        assert (handler.dropped, handler.coalesced) == (0, 2)
+        assert text.state == 'disabled'
+        # It keeps flushing
+        assert text.callbacks == [handler.flush_pending] * 2
+
+    def test_buffer_drops_oldest(self):
+        text = FakeText()
+        handler = TextHandler(text, max_lines=5)
+        for index in range(8):
+            handler.emit(make_record(index))
+
+        handler.flush_pending()
+        assert text.lines() == ['line 3', 'line 4', 'line 5', 'line 6', 'line 7']
+        assert (handler.dropped, handler.coalesced) == (3, 4)
+
+    def test_widget_is_trimmed(self):
+        text = FakeText()
+        handler = TextHandler(text, max_lines=5)
+        for index in range(12):
+            handler.emit(make_record(index))
+            if index % 3 == 2:
+                handler.flush_pending()
+
+        assert text.lines() == ['line 7', 'line 8', 'line 9', 'line 10', 'line 11']
+        assert handler.dropped == 0
+        # Nothing pending: the widget is left alone
+        handler.flush_pending()
+        assert text.inserts == 4
@@ -0,0 +1,56 @@
+import threading
+import time
+
+from cheerbatcher import CheerBatcher
+
+
+class TestCheerBatcher:
+
+    def test_batch_window(self):
+        batches = []
+        sent = threading.Event()
+
+        def sink(batch):
+            batches.append((time.time(), batch))
+            sent.set()
+
+        batcher = CheerBatcher(sink, batch_window=0.1, batch_max_size=100)
+        start = time.time()
+        for cheer in range(10):
+            batcher.add(cheer)
+
+        assert sent.wait(2)
+        batcher.close()
+
+        assert [batch for _, batch in batches] == [list(range(10))]
+        assert batches[0][0] - start >= 0.1
+
+    def test_batch_max_size(self):
+        batches = []
+        batcher = CheerBatcher(batches.append, batch_window=10, batch_max_size=3)
+        for cheer in range(7):
+            batcher.add(cheer)
+
+        deadline = time.time() + 2
+        while len(batches) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        assert batches == [[0, 1, 2], [3, 4, 5]]
+
+        # Closing sends what is left, without waiting for the batch window
+        batcher.close()
+        assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+    def test_sink_errors_are_logged(self):
+        batches = []
+
+        def sink(batch):
+            batches.append(batch)
+            if len(batches) == 1:
+                raise ValueError('whoops')
+
+        batcher = CheerBatcher(sink, batch_window=10, batch_max_size=1)
+        batcher.add(1)
+        batcher.add(2)
+        batcher.close()
+
+        assert batches == [[1], [2]]
@@ -3,23 +3,33 @@ try:
 except NameError:
     basestring = str
 
+import json
 import logging
 import os
 import shutil
+import threading
+import time
 
 import pytest
 
-from consolemini import BadArgsException, ConsoleMini
+from cmstorage import atomic_write
+import consolemini
+from consolemini import BadArgsException, Cheer, ConsoleMini, GameRecord
+import metrics
+from trending import DecayedTrending, SlidingWindowTrending, TrendingIndex
 
 
-def restore_base_data():
+def restore_base_data(cm=None):
     """
-    Revert consolemini.test.json to its original content.
+    Revert consolemini.test.json to its original content,
+    and reload it in ConsoleMini memory.
     """
 
     db_dirname = os.path.dirname(os.path.realpath(__file__))
     shutil.copyfile(src=os.path.join(db_dirname, 'consolemini.base.json'),
                     dst=os.path.join(db_dirname, 'consolemini.test.json'))
+    if cm is not None:
+        cm.load_db()
 
 
 @pytest.fixture(scope="module")
@@ -33,6 +43,7 @@ def cm():
     except:
         print(cm.read_db())
 
+    cm.close()
     # Revert consolemini.test.json to its original content
     restore_base_data()
 
@@ -67,7 +78,7 @@ class TestConsoleMini:
         assert res[game_id]['priority'] == 8
 
         # Revert consolemini.test.json to its original content
-        restore_base_data()
+        restore_base_data(cm)
 
     def test_write_db_full_rewrite(self, cm):
         game_id = 'CM10'  # Maui Mallard
@@ -89,7 +100,7 @@ class TestConsoleMini:
         assert res[game_id]['priority'] == 11
 
         # Revert consolemini.test.json to its original content
-        restore_base_data()
+        restore_base_data(cm)
 
     def test_read_db(self, cm):
         game_id = 'CM22'  # Ball Jacks
@@ -348,3 +359,568 @@ class TestConsoleMini:
                     assert f.read() == 'Pete Sampras : 1400 bits'
                 if index == 2:
                     assert f.read() == 'Maui Mallard : 1400 bits'
+
+
+@pytest.fixture
+def cm_tmp(make_cm):
+    """
+    A ConsoleMini working on a private copy of consolemini.base.json,
+    without the background flusher.
+    """
+    return make_cm()
+
+
+class TestConsoleMiniWriteBehind:
+
+    def _read_file(self, cm, game_id):
+        with open(cm.db_filepath) as f:
+            return json.load(f)[game_id]
+
+    def test_update_does_not_write_db(self, cm_tmp):
+        assert cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100) is True
+
+        assert cm_tmp.read_db('CM4')['total_bits'] == 200
+        assert self._read_file(cm_tmp, 'CM4')['total_bits'] == 100
+        assert cm_tmp.dirty == 1
+
+    def test_close_flushes(self, cm_tmp):
+        cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        cm_tmp.close()
+
+        assert cm_tmp.dirty == 0
+        assert self._read_file(cm_tmp, 'CM4')['total_bits'] == 200
+
+    def test_flush_every(self, cm_tmp):
+        cm_tmp.flush_every = 2
+        cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        assert self._read_file(cm_tmp, 'CM4')['total_bits'] == 100
+
+        cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        assert self._read_file(cm_tmp, 'CM4')['total_bits'] == 300
+
+    def test_read_db_is_a_copy(self, cm_tmp):
+        cm_data = cm_tmp.read_db()
+        cm_data['CM4']['total_bits'] = 9000
+
+        assert cm_tmp.read_db('CM4')['total_bits'] == 100
+
+    def test_failed_flush_is_retried(self, cm_tmp, monkeypatch):
+        cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+
+        def write_snapshot(text):
+            raise IOError('No space left on device')
+        monkeypatch.setattr(cm_tmp.storage, 'write_snapshot', write_snapshot)
+        with pytest.raises(IOError):
+            cm_tmp.flush()
+        assert cm_tmp.dirty == 1
+
+        monkeypatch.undo()
+        cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        assert cm_tmp.flush() is True
+        assert self._read_file(cm_tmp, 'CM4')['total_bits'] == 300
+
+    def test_flusher_survives_errors(self, cm_tmp, monkeypatch):
+        failures = []
+        flushed = threading.Event()
+        write_snapshot = cm_tmp.storage.write_snapshot
+
+        def flaky_write_snapshot(text):
+            if not failures:
+                failures.append(text)
+                raise IOError('No space left on device')
+            write_snapshot(text)
+            flushed.set()
+        monkeypatch.setattr(cm_tmp.storage, 'write_snapshot', flaky_write_snapshot)
+
+        cm_tmp.flush_interval = 0.01
+        cm_tmp._flusher = threading.Thread(target=cm_tmp._flush_loop)
+        cm_tmp._flusher.start()
+        cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+
+        assert flushed.wait(5)
+        assert self._read_file(cm_tmp, 'CM4')['total_bits'] == 200
+
+    def test_no_deadlock_with_write_db(self, cm_tmp):
+        import sys
+        cm_tmp.flush_every = 1
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            def cheer():
+                for _ in range(2000):
+                    cm_tmp.update_trending_games(chat_message="cheer1 CM4", bits_used=1)
+
+            def write_db():
+                for _ in range(2000):
+                    cm_tmp.write_db(game_id='CM16', current_game=cm_tmp.read_db('CM16'))
+
+            threads = [threading.Thread(target=cheer), threading.Thread(target=write_db)]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                thread.join(30)
+                assert not thread.is_alive()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        assert self._read_file(cm_tmp, 'CM4')['total_bits'] == 2100
+
+
+@pytest.fixture
+def cm_journal(make_cm):
+    return make_cm(flush_every=1, db_storage='journal', snapshot_every=3)
+
+
+class TestConsoleMiniJournal:
+
+    def _reopen(self, cm):
+        return ConsoleMini(db_filepath=cm.db_filepath, log=cm.log, flush_interval=0, flush_every=1,
+                           db_storage='journal', snapshot_every=3)
+
+    def _journal_lines(self, cm):
+        with open(cm.storage.journal_filepath) as f:
+            return f.read().splitlines()
+
+    def test_cheers_are_appended(self, cm_journal):
+        cm_journal.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        cm_journal.update_trending_games(chat_message="cheer100 CM16", bits_used=100)
+
+        assert self._journal_lines(cm_journal)[1:] == ['["CM4",100,-1]', '["CM16",100,-1]']
+        # consolemini.json itself wasn't rewritten yet
+        with open(cm_journal.db_filepath) as f:
+            assert json.load(f)['CM4']['total_bits'] == 100
+
+    def test_recovery_replays_journal(self, cm_journal):
+        cm_journal.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        cm_journal.update_trending_games(chat_message="cheer100 CM16", bits_used=100)
+
+        recovered = self._reopen(cm_journal)
+        assert recovered.read_db() == cm_journal.read_db()
+        assert recovered.read_db('CM16') == {'game_name': 'Dick Tracy', 'total_bits': 300, 'priority': 9}
+
+    def test_snapshot_compaction(self, cm_journal):
+        for _ in range(3):
+            cm_journal.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+
+        assert len(self._journal_lines(cm_journal)) == 1
+        with open(cm_journal.db_filepath) as f:
+            assert json.load(f)['CM4']['total_bits'] == 400
+        assert self._reopen(cm_journal).read_db('CM4')['total_bits'] == 400
+
+    def test_edited_snapshot_discards_journal(self, cm_journal):
+        cm_journal.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+
+        cm_data = cm_journal.read_db()
+        cm_data['CM4']['total_bits'] = 5000
+        with open(cm_journal.db_filepath, 'w') as f:
+            json.dump(cm_data, f)
+
+        assert self._reopen(cm_journal).read_db('CM4')['total_bits'] == 5000
+
+    def test_torn_record_is_ignored(self, cm_journal):
+        cm_journal.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        with open(cm_journal.storage.journal_filepath, 'a') as f:
+            f.write('["CM4",10')
+
+        recovered = self._reopen(cm_journal)
+        assert recovered.read_db('CM4')['total_bits'] == 200
+        assert self._journal_lines(recovered)[1:] == ['["CM4",100,-1]']
+
+
+@pytest.fixture
+def cm_sqlite(make_cm):
+    return make_cm(flush_every=1, db_storage='sqlite')
+
+
+class TestConsoleMiniSqlite:
+
+    def _reopen(self, cm):
+        return ConsoleMini(db_filepath=cm.db_filepath, log=cm.log, flush_interval=0, flush_every=1,
+                           db_storage='sqlite')
+
+    def test_imported_from_json(self, cm_sqlite):
+        with open(cm_sqlite.db_filepath) as f:
+            assert cm_sqlite.read_db() == json.load(f)
+        assert os.path.exists(cm_sqlite.storage.sqlite_filepath)
+
+    def test_cheers_match_memory(self, cm_sqlite):
+        for chat_message in ("cheer100 CM4", "cheer200 CM16", "cheer100 CM4", "cheer100 CM10"):
+            cm_sqlite.update_trending_games(chat_message=chat_message, bits_used=100)
+
+        recovered = self._reopen(cm_sqlite)
+        assert recovered.read_db() == cm_sqlite.read_db()
+        assert cm_sqlite.storage.top(3) == cm_sqlite.get_trending_games()
+        recovered.close()
+
+    def test_write_db_replaces_games(self, cm_sqlite):
+        cm_data = cm_sqlite.read_db()
+        del cm_data['CM1']
+        cm_data['CM4']['total_bits'] = 5000
+        cm_sqlite.write_db(new_data=cm_data)
+
+        assert self._reopen(cm_sqlite).read_db() == cm_data
+
+    def test_export_on_close(self, cm_sqlite):
+        cm_sqlite.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        cm_sqlite.close()
+
+        with open(cm_sqlite.db_filepath) as f:
+            assert json.load(f)['CM4']['total_bits'] == 200
+
+
+class TestTrendingIndex:
+
+    def test_matches_full_sort(self):
+        import random
+        random.seed(42)
+        cm_data = dict(('CM{}'.format(i), {'game_name': str(i), 'total_bits': 0, 'priority': 10})
+                       for i in range(200))
+        index = TrendingIndex(cm_data)
+
+        for _ in range(2000):
+            game_id = 'CM{}'.format(random.randrange(200))
+            cm_data[game_id]['total_bits'] += random.choice([100, 200, 500])
+            cm_data[game_id]['priority'] = random.randrange(1, 11)
+            index.update(game_id, cm_data[game_id]['total_bits'], cm_data[game_id]['priority'])
+
+        expected = sorted(cm_data, key=lambda k: (-cm_data[k]['total_bits'], cm_data[k]['priority'], k))
+        assert index.top(10) == expected[:10]
+        assert len(index) == 200
+
+        for total_bits in set(game['total_bits'] for game in cm_data.values()):
+            assert index.games_with(total_bits) == set(
+                game_id for game_id in cm_data if cm_data[game_id]['total_bits'] == total_bits)
+        assert index.games_with(1) == set()
+
+    def test_reset_priority_uses_buckets(self, cm_tmp):
+        cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        assert cm_tmp.read_db('CM4')['priority'] == 9
+        assert cm_tmp._index.games_with(200) == set(['CM4', 'CM8', 'CM16', 'CM28'])
+
+        # CM2 joins Rocket Knight Adventures' 300 bits bucket: both get priority 10
+        cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        assert cm_tmp.read_db('CM4')['priority'] == 8
+        assert cm_tmp.read_db('CM2')['priority'] == 10
+        assert cm_tmp._index.games_with(300) == set(['CM2', 'CM4'])
+        assert cm_tmp._index.games_with(200) == set(['CM8', 'CM16', 'CM28'])
+
+    def test_trending_count(self, cm_tmp):
+        cm_tmp.trending_count = 5
+        cm_tmp.update_trending_games()
+
+        assert [game['game_name'] for game in cm_tmp.get_trending_games()] == [
+            'Kid Chameleon', 'Fatal Rewind', 'Maui Mallard', 'Rocket Knight Adventures', 'Dick Tracy']
+        assert os.path.exists(os.path.join(cm_tmp.db_dirname, 'consolemini.5.txt'))
+        assert [game['game_name'] for game in cm_tmp.get_trending_games(1)] == ['Kid Chameleon']
+
+
+class FakeClock(object):
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestSlidingWindowTrending:
+
+    def test_window_slides(self):
+        clock = FakeClock()
+        trending = SlidingWindowTrending(window=60, bucket_count=6, clock=clock)
+        trending.add('CM1', 100)
+        clock.now += 30
+        trending.add('CM2', 200)
+        trending.add('CM1', 10)
+        assert trending.scores() == {'CM1': 110, 'CM2': 200}
+
+        # The first cheer left the window
+        clock.now += 35
+        assert trending.scores() == {'CM1': 10, 'CM2': 200}
+
+        # Everything did, rings are freed
+        clock.now += 600
+        assert trending.scores() == {}
+        assert not trending._rings
+
+    def test_matches_brute_force(self):
+        import random
+        random.seed(42)
+        clock = FakeClock()
+        trending = SlidingWindowTrending(window=60, bucket_count=6, clock=clock)
+        cheers = []
+        for _ in range(2000):
+            clock.now += random.choice([0, 0.5, 3, 20])
+            game_id = 'CM{}'.format(random.randrange(5))
+            trending.add(game_id, 10)
+            cheers.append((clock.now, game_id))
+
+            # Buckets are 10 seconds wide: the window starts on the oldest bucket still in it
+            window_start = (clock.now // 10 - 5) * 10
+            expected = {}
+            for cheered_at, cheered_id in cheers:
+                if cheered_at >= window_start:
+                    expected[cheered_id] = expected.get(cheered_id, 0) + 10
+            assert trending.scores() == expected
+
+
+class TestDecayedTrending:
+
+    def test_half_life(self):
+        clock = FakeClock()
+        trending = DecayedTrending(half_life=60, clock=clock)
+        trending.add('CM1', 400)
+        clock.now += 60
+        trending.add('CM2', 100)
+        assert trending.scores() == {'CM1': 200, 'CM2': 100}
+
+        clock.now += 120
+        trending.add('CM2', 100)
+        assert trending.scores() == {'CM1': 50, 'CM2': 125}
+
+        # Games worth less than half a bit are forgotten
+        clock.now += 60 * 10
+        assert trending.scores() == {}
+
+
+class TestConsoleMiniTrendingModes:
+
+    def test_window_mode(self, cm_tmp):
+        cm_tmp.trending_mode = 'window'
+        cm_tmp._trending = cm_tmp._new_trending()
+
+        # Before any cheer, the all-time leaders fill every slot
+        assert [game['game_name'] for game in cm_tmp.get_trending_games()] == [
+            'Kid Chameleon', 'Fatal Rewind', 'Maui Mallard']
+
+        cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+        cm_tmp.update_trending_games(chat_message="cheer200 CM16", bits_used=200)
+        trending_games = cm_tmp.get_trending_games()
+        assert [(game['game_name'], game['trending_bits']) for game in trending_games] == [
+            ('Dick Tracy', 200), ('Ecco', 100), ('Kid Chameleon', 0)]
+
+        with open(os.path.join(cm_tmp.db_dirname, 'consolemini.1.txt')) as f:
+            assert f.read() == 'Dick Tracy : 200 bits'
+
+
+class TestConsoleMiniApplyCheers:
+
+    def test_apply_cheers(self, cm_tmp, monkeypatch):
+        writes = []
+        monkeypatch.setattr(cm_tmp, 'write_trending_files', writes.append)
+
+        applied = cm_tmp.apply_cheers([Cheer('a', 'cheer100 CM4', 100),
+                                       Cheer('b', 'GIT GUD KAPPA', 100),
+                                       Cheer('c', 'cheer100 CM99', 100),
+                                       Cheer('d', 'cheer2000 cm 4', 2000)])
+
+        assert applied == 2
+        assert cm_tmp.read_db('CM4') == {'game_name': 'Ecco', 'total_bits': 2200, 'priority': 8}
+        # Trending files are written once for the whole batch
+        assert len(writes) == 1
+        assert writes[0][0]['game_name'] == 'Ecco'
+
+    def test_apply_no_cheers(self, cm_tmp, monkeypatch):
+        writes = []
+        monkeypatch.setattr(cm_tmp, 'write_trending_files', writes.append)
+
+        assert cm_tmp.apply_cheers([Cheer('a', 'GIT GUD KAPPA', 100)]) == 0
+        assert writes == []
+
+    def test_unparseable_messages_counted_alike(self, cm_tmp):
+        chat_messages = ['GIT GUD KAPPA', 'cheer100 CM99', 'cheer100 CM4']
+
+        counted = metrics.UNPARSEABLE_MESSAGES.value
+        assert cm_tmp.apply_cheers([Cheer('a', chat_message, 100) for chat_message in chat_messages]) == 1
+        batched = metrics.UNPARSEABLE_MESSAGES.value - counted
+
+        counted = metrics.UNPARSEABLE_MESSAGES.value
+        assert [cm_tmp.update_trending_games(chat_message=chat_message, bits_used=100)
+                for chat_message in chat_messages] == [False, False, True]
+        assert metrics.UNPARSEABLE_MESSAGES.value - counted == batched == 2
+        assert cm_tmp.read_db('CM4')['total_bits'] == 300
+
+
+class TestConsoleMiniBulk:
+
+    def test_reset_all(self, cm_tmp, monkeypatch):
+        flushes = []
+        flush = cm_tmp.flush
+        monkeypatch.setattr(cm_tmp, 'flush', lambda: flushes.append(flush()))
+
+        assert cm_tmp.reset_all() == len(cm_tmp.cm_data)
+        assert flushes == [True]
+        assert all((game['total_bits'], game['priority']) == (0, 10) for game in cm_tmp.read_db().values())
+        with open(cm_tmp.db_filepath) as f:
+            assert json.load(f) == cm_tmp.read_db()
+
+    def test_import_merge_remove(self, cm_tmp):
+        assert cm_tmp.import_catalog({'CM1': {'game_name': 'Soleil'},
+                                      'CM2': {'game_name': 'Ecco', 'total_bits': 300, 'priority': 9}}) == 2
+        assert cm_tmp.read_db() == {'CM1': {'game_name': 'Soleil', 'total_bits': 0, 'priority': 10},
+                                    'CM2': {'game_name': 'Ecco', 'total_bits': 300, 'priority': 9}}
+
+        cm_tmp.merge_catalog({'CM2': {'game_name': 'Ecco the Dolphin'}, 'CM3': {'game_name': 'Dick Tracy'}})
+        assert cm_tmp.read_db('CM2') == {'game_name': 'Ecco the Dolphin', 'total_bits': 300, 'priority': 9}
+        assert cm_tmp.read_db('CM3') == {'game_name': 'Dick Tracy', 'total_bits': 0, 'priority': 10}
+
+        assert cm_tmp.remove_games(['CM2', 'CM99']) == 1
+        assert sorted(cm_tmp.read_db()) == ['CM1', 'CM3']
+        assert cm_tmp.get_trending_games(count=1)[0]['game_name'] == 'Soleil'
+        with open(cm_tmp.db_filepath) as f:
+            assert json.load(f) == cm_tmp.read_db()
+
+    def test_shrinking_catalog_clears_trending_files(self, cm_tmp):
+        cm_tmp.update_trending_games()
+        cm_tmp.import_catalog({'CM1': {'game_name': 'Soleil'}, 'CM2': {'game_name': 'Ecco'}})
+        assert cm_tmp.remove_games(['CM2', 'CM99']) == 1
+
+        texts = []
+        for index in range(1, 4):
+            with open(os.path.join(cm_tmp.db_dirname, 'consolemini.{}.txt'.format(index))) as f:
+                texts.append(f.read())
+        assert texts == ['Soleil : 0 bits', '', '']
+        assert cm_tmp.get_trending_games() == [{'game_name': 'Soleil', 'total_bits': 0, 'priority': 10}]
+
+    def test_invalid_import_changes_nothing(self, cm_tmp):
+        cm_data = cm_tmp.read_db()
+        with pytest.raises(ValueError):
+            cm_tmp.merge_catalog({'CM4': {'total_bits': 10}, 'CM99': {'total_bits': 10}})
+        assert cm_tmp.read_db() == cm_data
+
+    def test_invalid_update_changes_nothing(self, cm_tmp):
+        cm_data = cm_tmp.read_db()
+        for catalog in ({'CM4': {'game_name': 'Ecco the Dolphin'}, 'CM16': {'trending_bits': 10}},
+                        {'CM4': {'total_bits': 10}, 'CM16': {'priority': 'high'}},
+                        {'CM4': {'total_bits': 10}, 'CM16': {'game_name': ''}}):
+            with pytest.raises(ValueError):
+                cm_tmp.merge_catalog(catalog)
+        assert cm_tmp.read_db() == cm_data
+        assert cm_tmp.dirty == 0
+
+    def test_merge_string_numbers(self, cm_tmp):
+        # As csv.DictReader gives them
+        cm_tmp.merge_catalog({'CM4': {'total_bits': '2000', 'priority': '9'},
+                              'CM99': {'game_name': 'Soleil', 'total_bits': '50'}})
+        assert cm_tmp.read_db('CM4') == {'game_name': 'Ecco', 'total_bits': 2000, 'priority': 9}
+        assert cm_tmp.read_db('CM99') == {'game_name': 'Soleil', 'total_bits': 50, 'priority': 10}
+
+        assert cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100) is True
+        assert cm_tmp.get_trending_games(count=1)[0] == {'game_name': 'Ecco', 'total_bits': 2100, 'priority': 8}
+
+
+class TestGameRecord:
+
+    def test_reads_like_a_dict(self):
+        game = GameRecord.from_dict({'game_name': 'Ecco', 'total_bits': 100, 'priority': 10})
+        game['total_bits'] += 100
+        game.update({'priority': 9})
+
+        assert (game.total_bits, game['priority']) == (200, 9)
+        assert dict(game) == game.to_dict() == {'game_name': 'Ecco', 'total_bits': 200, 'priority': 9}
+        assert game == {'game_name': 'Ecco', 'total_bits': 200, 'priority': 9}
+        with pytest.raises(KeyError):
+            game['trending_bits']
+        with pytest.raises(AttributeError):
+            game.trending_bits = 0
+
+    def test_json_round_trip(self, cm_tmp):
+        with open(cm_tmp.db_filepath) as f:
+            cm_data = json.load(f)
+        assert all(isinstance(game, GameRecord) for game in cm_tmp.cm_data.values())
+
+        cm_tmp.write_db(new_data=cm_tmp.read_db())
+        with open(cm_tmp.db_filepath) as f:
+            assert json.load(f) == cm_data
+
+
+class TestTrendingFilesWriter:
+
+    trending_games = [{'total_bits': 300, 'game_name': 'Kid Chameleon', 'priority': 9},
+                      {'total_bits': 300, 'game_name': 'Rocket Knight Adventures', 'priority': 10},
+                      {'total_bits': 100, 'game_name': 'Ecco', 'priority': 10}]
+
+    def test_unchanged_files_are_skipped(self, cm_tmp):
+        cm_tmp.write_trending_files(self.trending_games)
+        assert (cm_tmp.trending_files_written, cm_tmp.trending_files_skipped) == (3, 0)
+
+        cm_tmp.write_trending_files(self.trending_games)
+        assert (cm_tmp.trending_files_written, cm_tmp.trending_files_skipped) == (3, 3)
+
+        trending_games = [dict(game) for game in self.trending_games]
+        trending_games[2]['total_bits'] = 200
+        cm_tmp.write_trending_files(trending_games)
+        assert (cm_tmp.trending_files_written, cm_tmp.trending_files_skipped) == (4, 5)
+
+        with open(os.path.join(cm_tmp.db_dirname, 'consolemini.3.txt')) as f:
+            assert f.read() == 'Ecco : 200 bits'
+
+    def test_no_temporary_file_left(self, cm_tmp):
+        cm_tmp.write_trending_files(self.trending_games)
+
+        assert sorted(name for name in os.listdir(cm_tmp.db_dirname) if name.endswith('.txt')) == [
+            'consolemini.1.txt', 'consolemini.2.txt', 'consolemini.3.txt']
+        assert not [name for name in os.listdir(cm_tmp.db_dirname) if name.endswith('.tmp')]
+
+    def test_concurrent_updates_write_one_at_a_time(self, cm_tmp, monkeypatch):
+        writing = []
+        overlaps = []
+
+        def slow_atomic_write(filepath, text, fsync=True):
+            overlaps.append(bool(writing))
+            writing.append(filepath)
+            time.sleep(0.001)
+            atomic_write(filepath, text, fsync=fsync)
+            writing.remove(filepath)
+        monkeypatch.setattr(consolemini, 'atomic_write', slow_atomic_write)
+
+        def cheer():
+            for _ in range(20):
+                cm_tmp.update_trending_games(chat_message="cheer100 CM4", bits_used=100)
+
+        # The cheers of one thread, a Tk bulk operation in another
+        threads = [threading.Thread(target=cheer), threading.Thread(target=cm_tmp.reset_all)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        cm_tmp.update_trending_games()
+
+        assert overlaps and not any(overlaps)
+        for index, game in enumerate(cm_tmp.get_trending_games()):
+            with open(os.path.join(cm_tmp.db_dirname, 'consolemini.{}.txt'.format(index + 1))) as f:
+                assert f.read() == '{} : {} bits'.format(game['game_name'], game['total_bits'])
+
+
+class TestStrictChatParser:
+
+    def test_parse_chat_message_ok(self, cm_tmp):
+        cm_tmp.chat_parser = 'strict'
+
+        assert cm_tmp.parse_chat_message("Omg that baneling bust was Kreygasm CM16 cheer10 cheer10 cheer100") == 'CM16'
+        assert cm_tmp.parse_chat_message("cheer500 Wow! What a Save! Siiick! CM 22") == 'CM22'
+        assert cm_tmp.parse_chat_message("cheer200 Sed ut error sit voluptatem cm10") == 'CM10'
+        assert cm_tmp.parse_chat_message("cheer100 (cm4)") == 'CM4'
+        assert cm_tmp.parse_chat_message("Welcome back! Cmon Cm 4 cheer100") == 'CM4'
+
+    def test_parse_chat_message_nope(self, cm_tmp):
+        cm_tmp.chat_parser = 'strict'
+
+        assert cm_tmp.parse_chat_message("GIT GUD KAPPA !!1!1") is None
+        assert cm_tmp.parse_chat_message("GIT GUD CM !!1!1") is None
+        # 'cm' inside words is not a CM token
+        assert cm_tmp.parse_chat_message("welcome 16 cmon 4 cheer100") is None
+        # Unknown game_ids are ignored, instead of raising KeyError later on
+        assert cm_tmp.parse_chat_message("cheer100 CM99") is None
+        assert cm_tmp.update_trending_games(chat_message="cheer100 CM99", bits_used=100) is False
+
+    def test_multi_cm_policy(self, cm_tmp):
+        cm_tmp.chat_parser = 'strict'
+        chat_message = "cheer100 cm99 cm16 cm 16 cm3"
+
+        assert cm_tmp.parse_chat_message(chat_message) == 'CM16'
+        cm_tmp.multi_cm = 'last'
+        assert cm_tmp.parse_chat_message(chat_message) == 'CM3'
+        cm_tmp.multi_cm = 'ignore'
+        assert cm_tmp.parse_chat_message(chat_message) is None
+        assert cm_tmp.parse_chat_message("cheer100 cm16 cm 16") == 'CM16'
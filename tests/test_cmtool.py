@@ -0,0 +1,117 @@
+import json
+
+import cmtool
+
+LOG = u"""2017-12-01 20:00:00,001 - INFO - Starting app!
+2017-12-01 20:01:00,001 - INFO - New cheer from floweb !
+2017-12-01 20:01:00,002 - INFO - Message: cheer100 CM4
+2017-12-01 20:01:00,003 - INFO - Bits cheered: 100
+2017-12-01 20:01:00,004 - INFO - Ecco has now 100 bits, and its priority is 9 !
+2017-12-01 20:02:00,001 - INFO - New cheer from dallasnchains !
+2017-12-01 20:03:00,001 - INFO - New cheer from dallasnchains !
+2017-12-01 20:03:00,002 - INFO - Message: cheer300 GIT GUD
+CM16 KAPPA
+2017-12-01 20:03:00,003 - INFO - Bits cheered: 300
+2017-12-01 20:04:00,001 - INFO - New cheer from floweb !
+2017-12-01 20:04:00,002 - INFO - Message: cheer50 CM99
+2017-12-01 20:04:00,003 - INFO - Bits cheered: 50
+"""
+
+
+def write_log(tmpdir, name='2017-12-01.log'):
+    filepath = str(tmpdir.join(name))
+    with open(filepath, 'w') as f:
+        f.write(LOG)
+    return filepath
+
+
+class TestCheerEvents:
+
+    def test_pipeline(self, tmpdir):
+        stats = {}
+        lines = cmtool.read_lines([write_log(tmpdir)])
+        cheers = list(cmtool.cheer_events(cmtool.log_messages(lines), stats))
+
+        assert cheers == [cmtool.Cheer('floweb', 'cheer100 CM4', 100),
+                          cmtool.Cheer('dallasnchains', 'cheer300 GIT GUD\nCM16 KAPPA', 300),
+                          cmtool.Cheer('floweb', 'cheer50 CM99', 50)]
+        # The first cheer from dallasnchains never got its message
+        assert stats == {'incomplete': 1, 'skipped': 0}
+
+
+class TestReplay:
+
+    def test_replay(self, db_filepath, tmpdir, capsys):
+        logs_dirname = tmpdir.mkdir('logs')
+        write_log(logs_dirname, '2017-12-01.log')
+        write_log(logs_dirname, '2017-12-02.log')
+
+        assert cmtool.main(['replay', '--db', db_filepath, str(logs_dirname)]) == 0
+
+        with open(db_filepath) as f:
+            cm_data = json.load(f)
+        assert sorted((game_id, game['total_bits']) for game_id, game in cm_data.items()
+                      if game['total_bits']) == [('CM16', 600), ('CM4', 200)]
+        with open(str(tmpdir.join('consolemini.1.txt'))) as f:
+            assert f.read() == 'Dick Tracy : 600 bits'
+        assert '6 cheers replayed (4 applied, 2 incomplete)' in capsys.readouterr().out
+
+
+class TestBulkCommands:
+
+    def test_import_csv_and_remove(self, tmpdir, capsys):
+        db_filepath = str(tmpdir.join('consolemini.json'))
+        with open(db_filepath, 'w') as f:
+            f.write('{}')
+        csv_filepath = str(tmpdir.join('games.csv'))
+        with open(csv_filepath, 'w') as f:
+            f.write('game_id,game_name,total_bits,priority\nCM1,Soleil,,\nCM2,"Ecco, the Dolphin",300,9\n')
+
+        assert cmtool.main(['import', '--db', db_filepath, csv_filepath]) == 0
+        assert cmtool.main(['remove', '--db', db_filepath, 'CM1']) == 0
+
+        with open(db_filepath) as f:
+            assert json.load(f) == {'CM2': {'game_name': 'Ecco, the Dolphin', 'total_bits': 300, 'priority': 9}}
+        assert capsys.readouterr().out == 'import: 2 games\nremove: 1 games\n'
+
+
+MULTI_CHANNEL_LOG = u"""2017-12-03 20:01:00,001 - INFO - New cheer from floweb in channel 1 !
+2017-12-03 20:01:00,002 - INFO - Message: cheer100 CM4
+2017-12-03 20:01:00,003 - INFO - Bits cheered: 100
+2017-12-03 20:02:00,001 - INFO - New cheer from dallasnchains in channel 2 !
+2017-12-03 20:02:00,002 - INFO - Message: cheer300 CM16
+2017-12-03 20:02:00,003 - INFO - Bits cheered: 300
+"""
+
+
+class TestReplayChannels:
+
+    def write_logs(self, tmpdir):
+        logs_dirname = tmpdir.mkdir('logs')
+        write_log(logs_dirname, '2017-12-01.log')
+        with open(str(logs_dirname.join('2017-12-03.log')), 'w') as f:
+            f.write(MULTI_CHANNEL_LOG)
+        return str(logs_dirname)
+
+    def read_bits(self, db_filepath):
+        with open(db_filepath) as f:
+            cm_data = json.load(f)
+        return sorted((game_id, game['total_bits']) for game_id, game in cm_data.items() if game['total_bits'])
+
+    def test_channel_filter(self, db_filepath, tmpdir, capsys):
+        logs_dirname = self.write_logs(tmpdir)
+
+        assert cmtool.main(['replay', '--db', db_filepath, '--channel', '2', logs_dirname]) == 0
+        # Older cheers, logged without their channel, are replayed too
+        assert self.read_bits(db_filepath) == [('CM16', 600), ('CM4', 100)]
+        assert '4 cheers replayed (3 applied, 1 incomplete, 1 of other channels)' in capsys.readouterr().out
+
+    def test_mixed_channels_are_refused(self, db_filepath, tmpdir, capsys):
+        logs_dirname = self.write_logs(tmpdir)
+        with open(db_filepath) as f:
+            cm_data = f.read()
+
+        assert cmtool.main(['replay', '--db', db_filepath, logs_dirname]) == 1
+        assert 'channels 1 and 2' in capsys.readouterr().err
+        with open(db_filepath) as f:
+            assert f.read() == cm_data
@@ -0,0 +1,65 @@
+import random
+
+from consolemini import Cheer
+from leaderboard import ExactLeaderboard, SpaceSavingLeaderboard
+
+
+class TestExactLeaderboard:
+
+    def test_top(self):
+        leaderboard = ExactLeaderboard()
+        leaderboard.add('floweb', 100)
+        leaderboard.add('dallasnchains', 300)
+        leaderboard.add('floweb', 300)
+        leaderboard.add('anonymous', 50)
+
+        assert leaderboard.top(2) == [('floweb', 400), ('dallasnchains', 300)]
+        assert len(leaderboard) == 3
+
+
+class TestSpaceSavingLeaderboard:
+
+    def test_capacity_bound(self):
+        leaderboard = SpaceSavingLeaderboard(capacity=10)
+        for index in range(1000):
+            leaderboard.add('user{}'.format(index), 1)
+
+        assert len(leaderboard) == 10
+        assert len(leaderboard.errors) <= 10
+
+    def test_heavy_hitters_are_kept(self):
+        rng = random.Random(42)
+        leaderboard = SpaceSavingLeaderboard(capacity=20)
+        exact = ExactLeaderboard()
+        for _ in range(5000):
+            # A few big cheerers among a crowd of one-off ones
+            if rng.random() < 0.3:
+                user_name = 'whale{}'.format(rng.randrange(3))
+            else:
+                user_name = 'user{}'.format(rng.randrange(100000))
+            bits = rng.randrange(1, 100)
+            leaderboard.add(user_name, bits)
+            exact.add(user_name, bits)
+
+        assert [name for name, _ in leaderboard.top(3)] == [name for name, _ in exact.top(3)]
+        for user_name, bits in leaderboard.top(3):
+            # Over-estimated by at most the bits inherited from evicted cheerers
+            assert exact.bits[user_name] <= bits <= exact.bits[user_name] + leaderboard.errors.get(user_name, 0)
+
+
+class TestConsoleMiniCheerers:
+
+    def test_cheerer_files(self, make_cm, tmpdir):
+        cm = make_cm(cheerers_count=2, cheerers_mode='exact')
+
+        cm.update_trending_games(chat_message="cheer100 CM4", bits_used=100, user_name='floweb')
+        # Cheers for no known game still count for their cheerer
+        cm.apply_cheers([Cheer('dallasnchains', 'GIT GUD KAPPA', 300),
+                         Cheer('floweb', 'cheer250 CM16', 250),
+                         Cheer('anonymous', 'cheer10 CM16', 10)])
+
+        with open(str(tmpdir.join('cheerers.1.txt'))) as f:
+            assert f.read() == 'floweb : 350 bits'
+        with open(str(tmpdir.join('cheerers.2.txt'))) as f:
+            assert f.read() == 'dallasnchains : 300 bits'
+        assert not tmpdir.join('cheerers.3.txt').exists()
@@ -0,0 +1,22 @@
+import logging
+
+from loghandlers import BatchedFileHandler, start_queue_logging
+
+
+def test_queue_logging(tmpdir):
+    log_filepath = str(tmpdir.join('test.log'))
+    log = logging.getLogger('test_queue_logging')
+    log.propagate = False
+    log.setLevel(logging.INFO)
+
+    file_handler = BatchedFileHandler(filename=log_filepath)
+    listener = start_queue_logging(log, [file_handler])
+    for index in range(100):
+        log.info('cheer %d', index)
+    if listener is not None:
+        # Everything queued is written and flushed once the listener stops
+        listener.stop()
+    file_handler.close()
+
+    with open(log_filepath) as f:
+        assert f.read().splitlines() == ['cheer {}'.format(index) for index in range(100)]
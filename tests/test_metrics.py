@@ -0,0 +1,56 @@
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
+import metrics
+
+
+class TestMetrics:
+
+    def test_counter(self):
+        registry = metrics.Registry()
+        counter = registry.counter('cheers_total', 'Cheers.')
+        counter.inc()
+        counter.inc(2)
+
+        assert registry.snapshot() == {'cheers_total': 3}
+        assert registry.render() == '# HELP cheers_total Cheers.\n# TYPE cheers_total counter\ncheers_total 3\n'
+
+    def test_histogram(self):
+        registry = metrics.Registry()
+        histogram = registry.histogram('duration_seconds', 'Duration.', buckets=(0.1, 1))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+
+        snapshot = registry.snapshot()['duration_seconds']
+        assert snapshot['count'] == 3
+        assert snapshot['sum'] == 5.55
+        lines = registry.render().splitlines()
+        assert 'duration_seconds_bucket{le="0.1"} 1' in lines
+        assert 'duration_seconds_bucket{le="1"} 2' in lines
+        assert 'duration_seconds_bucket{le="+Inf"} 3' in lines
+        assert 'duration_seconds_count 3' in lines
+
+    def test_timed(self):
+        histogram = metrics.Histogram('duration_seconds', 'Duration.')
+
+        @metrics.timed(histogram)
+        def double(value):
+            return value * 2
+
+        assert double(2) == 4
+        assert histogram.count == 1
+
+    def test_http_server(self):
+        server = metrics.start_http_server(0)
+        try:
+            response = urlopen('http://127.0.0.1:{}/metrics'.format(server.server_address[1]))
+            body = response.read().decode('utf-8')
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert '# TYPE consolemini_cheers_applied_total counter' in body
+        assert 'twitch_bits_info_frame_decode_seconds_count' in body
@@ -0,0 +1,75 @@
+import json
+
+try:
+    from urllib2 import urlopen
+except ImportError:
+    from urllib.request import urlopen
+
+import pytest
+
+from overlay import start_overlay_server, trending_diff
+
+
+@pytest.fixture
+def overlay_server():
+    server = start_overlay_server(0)
+    yield server
+    server.close()
+
+
+def read_event(response):
+    lines = []
+    while True:
+        line = response.readline().decode('utf-8').rstrip('\n')
+        if not line:
+            return lines[0][len('event: '):], json.loads(lines[1][len('data: '):])
+        lines.append(line)
+
+
+class TestTrendingDiff:
+
+    def test_changed_ranks(self):
+        old_games = [{'rank': 1, 'game_name': 'Ecco', 'bits': 300},
+                     {'rank': 2, 'game_name': 'Kid Chameleon', 'bits': 200}]
+        new_games = [{'rank': 1, 'game_name': 'Ecco', 'bits': 300},
+                     {'rank': 2, 'game_name': 'Dick Tracy', 'bits': 250},
+                     {'rank': 3, 'game_name': 'Kid Chameleon', 'bits': 200}]
+
+        assert trending_diff(old_games, new_games) == {'changed': new_games[1:], 'size': 3}
+        assert trending_diff(new_games, old_games[:1]) == {'changed': [], 'size': 1}
+        assert trending_diff(new_games, new_games) is None
+
+
+class TestOverlayServer:
+
+    def test_snapshot(self, overlay_server):
+        overlay_server.publish('1', [{'game_name': 'Ecco', 'total_bits': 300, 'priority': 1}])
+        url = 'http://127.0.0.1:{}/trending'.format(overlay_server.server_address[1])
+
+        snapshot = json.loads(urlopen(url).read().decode('utf-8'))
+        assert snapshot == {'version': 1, 'games': [{'rank': 1, 'game_name': 'Ecco', 'bits': 300,
+                                                     'total_bits': 300}]}
+        assert json.loads(urlopen(url + '/1').read().decode('utf-8')) == snapshot
+
+    def test_events(self, overlay_server, make_cm, tmpdir):
+        cm = make_cm(on_trending=lambda trending_games: overlay_server.publish('1', trending_games),
+                     trending_files=False)
+        overlay_server.publish('1', cm.get_trending_games())
+
+        response = urlopen('http://127.0.0.1:{}/events/1'.format(overlay_server.server_address[1]))
+        event, snapshot = read_event(response)
+        assert event == 'snapshot'
+        assert [game['game_name'] for game in snapshot['games']] == ['Kid Chameleon', 'Fatal Rewind',
+                                                                     'Maui Mallard']
+
+        # Ecco jumps to the first rank, everything else moves down
+        cm.update_trending_games(chat_message="cheer2000 CM4", bits_used=2000)
+        event, diff = read_event(response)
+        assert event == 'diff'
+        assert diff['version'] == snapshot['version'] + 1
+        assert [(game['rank'], game['game_name']) for game in diff['changed']] == [
+            (1, 'Ecco'), (2, 'Kid Chameleon'), (3, 'Fatal Rewind')]
+
+        # Only the overlay server got them
+        assert not tmpdir.join('consolemini.1.txt').exists()
+        response.close()
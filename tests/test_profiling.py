@@ -0,0 +1,51 @@
+import pstats
+
+import metrics
+import profiling
+
+
+@profiling.profiled
+def handle_event(value):
+    return value * 2
+
+
+class TestProfileSession:
+
+    def test_events_limit(self, tmpdir):
+        filepath = str(tmpdir.join('profile.prof'))
+        session = profiling.start_session(filepath, events=3)
+        try:
+            for value in range(5):
+                assert handle_event(value) == value * 2
+        finally:
+            profiling.stop_session()
+
+        assert session.done
+        assert session.events == 3
+        stats = pstats.Stats(filepath)
+        assert any(function[2] == 'handle_event' for function in stats.stats)
+
+    def test_no_session(self):
+        profiling.stop_session()
+        assert handle_event(2) == 4
+
+
+class TestStageTracer:
+
+    def test_trace_file(self, tmpdir):
+        filepath = str(tmpdir.join('trace.txt'))
+        tracer = profiling.StageTracer(filepath, flush_every=2)
+        tracer.attach()
+        try:
+            metrics.FRAME_DECODE_SECONDS.observe(0.000042)
+            metrics.FLUSH_SECONDS.observe(0.25)
+            metrics.WRITE_TRENDING_FILES_SECONDS.observe(0.001)
+        finally:
+            tracer.close()
+        # Detached once closed
+        metrics.FRAME_DECODE_SECONDS.observe(0.1)
+
+        with open(filepath) as f:
+            lines = [line.split() for line in f]
+        assert [(stage, microseconds) for _, stage, microseconds in lines] == [
+            ('decode', '42'), ('persist', '250000'), ('write', '1000')]
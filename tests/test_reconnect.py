@@ -0,0 +1,31 @@
+from reconnect import RecentEvents, backoff_delay
+
+
+class TestBackoffDelay:
+
+    def test_grows_up_to_cap(self):
+        for attempt in range(10):
+            delays = [backoff_delay(attempt, base=1, cap=30) for _ in range(100)]
+            assert all(0 <= delay <= min(30, 2 ** attempt) for delay in delays)
+
+
+class TestRecentEvents:
+
+    def test_duplicates(self):
+        recent_events = RecentEvents(maxlen=10)
+        assert not recent_events.seen('a')
+        assert not recent_events.seen('b')
+        assert recent_events.seen('a')
+        assert recent_events.duplicates == 1
+
+    def test_bounded_lru(self):
+        recent_events = RecentEvents(maxlen=3)
+        for event_id in 'abc':
+            recent_events.seen(event_id)
+        # 'a' is used again, so 'b' is now the least recently seen one
+        assert recent_events.seen('a')
+        assert not recent_events.seen('d')
+
+        assert len(recent_events) == 3
+        assert not recent_events.seen('b')
+        assert recent_events.seen('a')
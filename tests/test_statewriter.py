@@ -0,0 +1,20 @@
+import json
+
+from consolemini import Cheer
+from statewriter import StateWriter
+
+
+def test_state_writer_process(db_filepath, tmpdir):
+    writer = StateWriter({'flush_interval': 0, 'flush_every': 0})
+    cm = writer.add_channel('1', db_filepath)
+    cm.apply_cheers([Cheer('foo', 'cheer100 CM4', 100), Cheer('bar', 'cheer500 CM16', 500)])
+    cm.update_trending_games('cheer100 CM4', 100)
+    writer.close()
+
+    assert writer.process.exitcode == 0
+    with open(db_filepath) as f:
+        cm_data = json.load(f)
+    assert cm_data['CM4']['total_bits'] == 300
+    assert cm_data['CM16']['total_bits'] == 700
+    with open(str(tmpdir.join('consolemini.1.txt'))) as f:
+        assert f.read() == 'Kid Chameleon : 1600 bits'
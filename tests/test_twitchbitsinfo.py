@@ -0,0 +1,170 @@
+import json
+import shutil
+
+import pytest
+
+from twitchbitsinfo import BadConfigurationException, TwitchBitsInfo
+
+
+def bits_frame(channel_id, chat_message='cheer100 CM4', bits_used=100, **message):
+    message.update({'user_name': 'dallasnchains', 'user_id': '42', 'channel_id': channel_id,
+                    'time': '2015-12-19T16:39:57-08:00', 'chat_message': chat_message, 'bits_used': bits_used})
+    return json.dumps({'type': 'MESSAGE',
+                       'data': {'topic': 'channel-bitsevents.{}'.format(channel_id),
+                                'message': json.dumps(message)}})
+
+
+@pytest.fixture
+def make_bits(tmpdir, monkeypatch):
+    """
+    Build TwitchBitsInfo instances from config_dict, logging into tmpdir,
+    with their channels set up from the options (no Twitch login).
+    """
+    # The dated .log file is written in the current directory
+    monkeypatch.chdir(str(tmpdir))
+    instances = []
+
+    def make_bits(**options):
+        config_dict = {'twitch_client_id': 'test', 'channel_name': 'test', 'channel_id': '1',
+                       'db_filepath': str(tmpdir.join('consolemini.json')), 'token_cache_filepath': '',
+                       'flush_interval': '0', 'flush_every': '0'}
+        config_dict.update(options)
+        bits = TwitchBitsInfo(config_dict=config_dict)
+        instances.append(bits)
+        return bits
+
+    yield make_bits
+    for bits in instances:
+        for cm in getattr(bits, 'consoleminis', {}).values():
+            cm.close()
+        if bits.log_listener is not None:
+            bits.log_listener.stop()
+        for handler in list(bits.log.handlers):
+            bits.log.removeHandler(handler)
+
+
+@pytest.fixture
+def bits(make_bits, db_filepath):
+    bits = make_bits(db_filepath=db_filepath)
+    bits._setup_channels()
+    return bits
+
+
+class TestDuplicateEvents:
+
+    def test_same_message_id_is_ignored(self, bits):
+        frame = bits_frame('1', message_id='abc')
+        bits.on_message(None, frame)
+        bits.on_message(None, frame)
+
+        assert bits.consoleminis['1'].read_db('CM4')['total_bits'] == 200
+        assert bits.recent_events.duplicates == 1
+
+    def test_events_without_message_id_all_count(self, bits):
+        # Same user, same bits, same second: two cheers, not a duplicate
+        bits.on_message(None, bits_frame('1'))
+        bits.on_message(None, bits_frame('1'))
+
+        assert bits.consoleminis['1'].read_db('CM4')['total_bits'] == 300
+        assert bits.recent_events.duplicates == 0
+
+
+class FakeWebSocket(object):
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def multi_bits(make_bits, db_filepath, tmpdir):
+    """
+    A TwitchBitsInfo serving 5 channels, 2 topics per connection at most.
+    """
+    try:
+        import ConfigParser as configparser
+    except ImportError:
+        import configparser
+
+    config = configparser.ConfigParser()
+    for index in range(1, 6):
+        channel_name = 'channel{}'.format(index)
+        channel_db_filepath = str(tmpdir.mkdir(channel_name).join('consolemini.json'))
+        shutil.copyfile(src=db_filepath, dst=channel_db_filepath)
+        config.add_section(channel_name)
+        config.set(channel_name, 'channel_id', str(index))
+        config.set(channel_name, 'db_filepath', channel_db_filepath)
+
+    bits = make_bits(config=config, channels='channel1, channel2, channel3, channel4, channel5',
+                     topics_per_connection='2')
+    bits._setup_channels()
+    return bits
+
+
+class TestMultiChannel:
+
+    def test_topic_chunks(self, multi_bits):
+        assert multi_bits.get_topic_chunks() == [
+            ['channel-bitsevents.1', 'channel-bitsevents.2'],
+            ['channel-bitsevents.3', 'channel-bitsevents.4'],
+            ['channel-bitsevents.5']]
+
+    def test_missing_channel_section(self, make_bits, multi_bits):
+        bits = make_bits(config=multi_bits.config, channels='channel1, channel6')
+        with pytest.raises(BadConfigurationException):
+            bits._setup_channels()
+
+    def test_bits_event_routing(self, multi_bits, tmpdir):
+        multi_bits.on_message(None, bits_frame('3', chat_message='cheer500 CM4', bits_used=500))
+
+        totals = dict((channel_id, cm.read_db('CM4')['total_bits'])
+                      for channel_id, cm in multi_bits.consoleminis.items())
+        assert totals == {'1': 100, '2': 100, '3': 600, '4': 100, '5': 100}
+        # Each channel writes its trending games text files in its own directory
+        with open(str(tmpdir.join('channel3', 'consolemini.1.txt'))) as f:
+            assert f.read() == 'Kid Chameleon : 1600 bits'
+        assert not tmpdir.join('channel1', 'consolemini.1.txt').exists()
+
+    def test_unknown_channel_is_ignored(self, multi_bits):
+        multi_bits.on_message(None, bits_frame('6'))
+
+        assert all(cm.read_db('CM4')['total_bits'] == 100 for cm in multi_bits.consoleminis.values())
+
+
+class TestFrameDispatch:
+
+    def test_frame_types_reach_their_handler(self, bits, monkeypatch):
+        handled = []
+        for frame_type in ('MESSAGE', 'PONG', 'RESPONSE', 'RECONNECT'):
+            monkeypatch.setitem(bits.frame_handlers, frame_type,
+                                lambda ws, message_dict: handled.append(message_dict['type']))
+
+        for frame_type in ('PONG', 'RESPONSE', 'MESSAGE', 'RECONNECT', 'PONG'):
+            bits.on_message(None, json.dumps({'type': frame_type}))
+        assert handled == ['PONG', 'RESPONSE', 'MESSAGE', 'RECONNECT', 'PONG']
+
+    def test_unknown_frames_are_ignored(self, bits):
+        bits.on_message(None, json.dumps({'type': 'WHATEVER', 'data': {}}))
+        bits.on_message(None, json.dumps({'data': {}}))
+
+        assert bits.consoleminis['1'].read_db('CM4')['total_bits'] == 100
+
+    def test_pong_and_reconnect(self, bits):
+        ws = FakeWebSocket()
+        bits.ping_sent_at[ws] = 0
+        bits.on_message(ws, json.dumps({'type': 'PONG'}))
+        assert not bits.pong_pending(ws)
+
+        bits.on_message(ws, json.dumps({'type': 'RECONNECT'}))
+        assert ws.closed
+        assert ws in bits._reconnect_requested
+
+    def test_other_topics_are_not_decoded(self, bits):
+        # Not a bits topic: its nested message, not even JSON here, is left alone
+        bits.on_message(None, json.dumps({'type': 'MESSAGE',
+                                          'data': {'topic': 'whispers.1', 'message': '{not json'}}))
+        bits.on_message(None, bits_frame('1'))
+
+        assert bits.consoleminis['1'].read_db('CM4')['total_bits'] == 200
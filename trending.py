@@ -0,0 +1,183 @@
+import bisect
+import time
+
+
+class TrendingIndex(object):
+    """
+    Keep ConsoleMini game_ids ordered by total_bits DESC, then priority ASC
+    (and then game_id, so ties are always broken the same way).
+
+    Moving one game is a binary search plus a list insert/delete,
+    instead of sorting the whole catalog on every cheer.
+    Games are also bucketed by total_bits, to find ties without a catalog scan.
+    """
+
+    def __init__(self, cm_data=None):
+        self.rebuild(cm_data or {})
+
+    def rebuild(self, cm_data):
+        self._key_of = dict((game_id, self._key(game_id, game['total_bits'], game['priority']))
+                            for game_id, game in cm_data.items())
+        self._keys = sorted(self._key_of.values())
+        self._buckets = {}
+        for key in self._keys:
+            self._buckets.setdefault(-key[0], set()).add(key[2])
+
+    def update(self, game_id, total_bits, priority):
+        key = self._key(game_id, total_bits, priority)
+        old_key = self._key_of.get(game_id)
+        if old_key == key:
+            return
+
+        if old_key is not None:
+            del self._keys[bisect.bisect_left(self._keys, old_key)]
+        bisect.insort(self._keys, key)
+        self._key_of[game_id] = key
+
+        if old_key is None or old_key[0] != key[0]:
+            if old_key is not None:
+                self._discard_from_bucket(game_id, -old_key[0])
+            self._buckets.setdefault(total_bits, set()).add(game_id)
+
+    def remove(self, game_id):
+        old_key = self._key_of.pop(game_id, None)
+        if old_key is not None:
+            del self._keys[bisect.bisect_left(self._keys, old_key)]
+            self._discard_from_bucket(game_id, -old_key[0])
+
+    def games_with(self, total_bits):
+        """
+        Returns the game_ids which have exactly total_bits.
+        """
+        return frozenset(self._buckets.get(total_bits, ()))
+
+    def top(self, count):
+        """
+        Returns the game_ids of the count first trending games.
+        """
+        return [key[2] for key in self._keys[:count]]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _discard_from_bucket(self, game_id, total_bits):
+        bucket = self._buckets[total_bits]
+        bucket.discard(game_id)
+        if not bucket:
+            del self._buckets[total_bits]
+
+    @staticmethod
+    def _key(game_id, total_bits, priority):
+        return (-total_bits, priority, game_id)
+
+
+class SlidingWindowTrending(object):
+    """
+    Rank games by the bits they got in the last window seconds.
+
+    Each game cheered for has a ring of bucket_count time buckets, window / bucket_count
+    seconds wide: a cheer adds its bits to the current bucket, and buckets are cleared
+    as time moves past them. Memory doesn't grow with the number of cheers, each bucket
+    is cleared at most once per lap, and the window slides by one bucket width at a time.
+    """
+
+    def __init__(self, window=600, bucket_count=60, clock=time.time):
+        self.bucket_count = bucket_count
+        self.bucket_width = float(window) / bucket_count
+        self.clock = clock
+        self._rings = {}
+
+    def add(self, game_id, bits):
+        slot = self._slot()
+        ring = self._rings.get(game_id)
+        if ring is None:
+            ring = self._rings[game_id] = _Ring(self.bucket_count, slot)
+        ring.expire(slot)
+        ring.buckets[slot % self.bucket_count] += bits
+        ring.total += bits
+
+    def scores(self):
+        """
+        Returns the bits each game got in the window, for the games which got any.
+        """
+        slot = self._slot()
+        scores = {}
+        for game_id, ring in list(self._rings.items()):
+            ring.expire(slot)
+            if ring.total > 0:
+                scores[game_id] = ring.total
+            else:
+                # Nothing left in the window, free its ring
+                del self._rings[game_id]
+        return scores
+
+    def _slot(self):
+        return int(self.clock() // self.bucket_width)
+
+
+class _Ring(object):
+    __slots__ = ('buckets', 'slot', 'total')
+
+    def __init__(self, bucket_count, slot):
+        self.buckets = [0] * bucket_count
+        # The latest time slot we've seen, and the sum of every bucket
+        self.slot = slot
+        self.total = 0
+
+    def expire(self, slot):
+        """
+        Clear the buckets of the time slots which left the window since our latest one.
+        """
+        if slot <= self.slot:
+            return
+        bucket_count = len(self.buckets)
+        for old_slot in range(self.slot + 1, min(slot, self.slot + bucket_count) + 1):
+            index = old_slot % bucket_count
+            self.total -= self.buckets[index]
+            self.buckets[index] = 0
+        self.slot = slot
+
+
+class DecayedTrending(object):
+    """
+    Rank games by an exponentially decayed sum of their bits: a cheer counts
+    half as much after half_life seconds, a quarter after twice that, etc.
+
+    Decay is applied lazily, when a game gets bits or scores are read, so each game
+    only holds its score and when it was last decayed.
+    """
+
+    def __init__(self, half_life=300, clock=time.time):
+        self.half_life = float(half_life)
+        self.clock = clock
+        self._scores = {}
+
+    def add(self, game_id, bits):
+        now = self.clock()
+        self._scores[game_id] = (self._decayed(game_id, now) + bits, now)
+
+    def scores(self):
+        """
+        Returns the decayed score of each game, for the games still worth at least half a bit.
+        """
+        now = self.clock()
+        scores = {}
+        for game_id in list(self._scores):
+            score = self._decayed(game_id, now)
+            if score >= 0.5:
+                scores[game_id] = score
+            else:
+                del self._scores[game_id]
+        return scores
+
+    def _decayed(self, game_id, now):
+        score, updated_at = self._scores.get(game_id, (0.0, now))
+        return score * 0.5 ** ((now - updated_at) / self.half_life)
+
+
+def get_trending(trending_mode, **kwargs):
+    if trending_mode == 'window':
+        return SlidingWindowTrending(**kwargs)
+    if trending_mode == 'decay':
+        return DecayedTrending(**kwargs)
+    raise ValueError('Unknown trending mode: {}'.format(trending_mode))
@@ -7,16 +7,34 @@ except ImportError:
     import configparser
     import _thread as thread
 from datetime import datetime
+import functools
 import json
 import logging
 import os
+import threading
 import time
 import webbrowser
 
 import pytwitcherapi
 import websocket
 
-from consolemini import ConsoleMini
+# Decode PubSub frames with a faster JSON decoder when one is installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        json_loads = json.loads
+
+from cheerbatcher import CheerBatcher
+from cmstorage import atomic_write
+from consolemini import Cheer, ConsoleMini
+from loghandlers import BatchedFileHandler, start_queue_logging
+import metrics
+from overlay import start_overlay_server
+import profiling
+from reconnect import RecentEvents, backoff_delay
 
 
 class TwitchLoginException(Exception):
@@ -34,81 +52,389 @@ class BadConfigurationException(Exception):
         super(BadConfigurationException, self).__init__(message)
 
 
+BITS_TOPIC_PREFIX = 'channel-bitsevents.'
+
+
 class TwitchBitsInfo(object):
 
-    def __init__(self):
-        config_dict = self._get_config()
+    def __init__(self, config_dict=None):
+        if config_dict is None:
+            config_dict = self._get_config()
         # We need to get a dict from the 'config' section of the config file,
         # to properly setup this class attributes like logs, etc...
         self.__dict__.update(config_dict)
         self._setup()
 
+        # When we sent our last PING, on each connection
+        self.ping_sent_at = {}
+        self.metrics_server = None
+        self.overlay_server = None
+        self.tracer = None
+        self.writer = None
+        # Events delivered twice (replayed around a reconnection...) are only counted once
+        self.recent_events = RecentEvents(self.dedupe_size)
+        self._connections_lock = threading.Lock()
+        # Connections which were opened, and those PubSub asked us to reconnect
+        self._opened = set()
+        self._reconnect_requested = set()
+
+        # PubSub frames are routed by their type, other types are ignored
+        self.frame_handlers = {
+            'MESSAGE': self.on_pubsub_message,
+            'PONG': self.on_pong,
+            'RESPONSE': self.on_response,
+            'RECONNECT': self.on_reconnect,
+        }
+
     def start(self):
         # Standard REST API:
         # This is use to get channel_id from a channel_name,
         # and the OAuth token needed for Websocket requests
         self.twitch = pytwitcherapi.TwitchSession()
 
-        self.twitch_login()
+        # A still valid token from a previous run saves us the whole login flow
+        if not self.use_cached_token():
+            self.twitch_login()
+            self.save_token_cache()
         self.access_token = self.twitch.token['access_token']
-        try:
-            self.channel_id
-        except AttributeError:
-            self.channel_id = self.get_channel_id()
-            self._write_config('channel_id', self.channel_id)
 
-        if self.first_run:
-            # First run was a success, we don't need to wait 45 seconds for user login
-            # Set first_run param to 0 (== False)
-            self._write_config('first_run', '0')
+        self.connect()
 
+    def connect(self):
+        """
+        Once we have an access_token, serve our channels until shutdown.
+        """
         # Websocket / PubSub:
         # This is use to get Twitch's Bits information stream
         if self.verbose:
             websocket.enableTrace(True)
 
-        self.twitch.ws = websocket.WebSocketApp(
-            self.ws_host,
-            on_message=self.on_message,
-            on_error=self.on_error,
-            on_close=lambda _: self.log.info("Terminating...")
-        )
+        if self.metrics_port:
+            self.metrics_server = metrics.start_http_server(self.metrics_port, self.metrics_host)
+            self.log.info('Serving metrics on http://{}:{}/metrics'.format(self.metrics_host, self.metrics_port))
 
-        self.cm = ConsoleMini(db_filepath=self.db_filepath, log=self.log)
+        if self.trace_filepath:
+            self.tracer = profiling.StageTracer(self.trace_filepath)
+            self.tracer.attach()
+            self.log.info('Tracing the pipeline stages to {}'.format(self.trace_filepath))
+        if self.profile_on_start:
+            self.start_profiling()
 
-        self.twitch.ws.on_open = self.on_open
-        self.twitch.ws.run_forever()
+        # With a state-writer process, the overlay server lives there, next to the trending games
+        if self.overlay_port and self.state_writer != 'process':
+            self.overlay_server = start_overlay_server(self.overlay_port, self.overlay_host, log=self.log)
+            self.log.info('Serving overlays on http://{}:{}/'.format(self.overlay_host, self.overlay_port))
+
+        self._setup_channels()
+
+        self._closing = threading.Event()
+        if self.pubsub_client == 'asyncio':
+            self._run_asyncio()
+        else:
+            self._run_threads()
+
+    def _setup_channels(self):
+        """
+        Build one ConsoleMini (and its CheerBatcher) per channel, indexed by channel_id.
+        Without a channels option, we only serve the channel_name of the 'config' section.
+        """
+        self.consoleminis = {}
+        self.batchers = {}
+        if self.state_writer == 'process':
+            from statewriter import StateWriter
+            overlay_address = (self.overlay_host, self.overlay_port) if self.overlay_port else None
+            self.writer = StateWriter(self._consolemini_options(), log=self.log, log_filepath=self.log_filepath,
+                                      overlay_address=overlay_address, trace_filepath=self.trace_filepath)
+
+        if not self.channels:
+            try:
+                self.channel_id
+            except AttributeError:
+                self.channel_id = self.get_channel_id()
+                self._write_config('channel_id', self.channel_id)
+            self._add_channel(self.channel_id, self.db_filepath)
+            return
+
+        for channel_name in self.channels:
+            if not self.config.has_section(channel_name):
+                raise BadConfigurationException('[{}] section'.format(channel_name))
+            channel_config = dict(self.config.items(channel_name))
+            if 'db_filepath' not in channel_config:
+                raise BadConfigurationException('db_filepath in [{}]'.format(channel_name))
+
+            channel_id = channel_config.get('channel_id')
+            if not channel_id:
+                channel_id = self.get_channel_id(channel_name)
+                self._write_config('channel_id', channel_id, section=channel_name)
+            self._add_channel(channel_id, channel_config['db_filepath'])
+
+    def _consolemini_options(self):
+        return dict(flush_interval=self.flush_interval, flush_every=self.flush_every,
+                    db_storage=self.db_storage, snapshot_every=self.snapshot_every,
+                    trending_count=self.trending_count, trending_mode=self.trending_mode,
+                    trending_window=self.trending_window, trending_buckets=self.trending_buckets,
+                    trending_half_life=self.trending_half_life,
+                    cheerers_count=self.cheerers_count, cheerers_mode=self.cheerers_mode,
+                    cheerers_capacity=self.cheerers_capacity, trending_files=self.trending_files,
+                    chat_parser=self.chat_parser, multi_cm=self.multi_cm)
+
+    def _add_channel(self, channel_id, db_filepath):
+        # Each channel writes its trending games text files next to its own db_filepath
+        if self.state_writer == 'process':
+            cm = self.writer.add_channel(str(channel_id), db_filepath)
+        else:
+            cm_options = self._consolemini_options()
+            if self.overlay_server is not None:
+                cm_options['on_trending'] = functools.partial(self.overlay_server.publish, str(channel_id))
+            cm = ConsoleMini(db_filepath=db_filepath, log=self.log, **cm_options)
+            if self.overlay_server is not None:
+                # Overlays get the current trending games before any cheer
+                self.overlay_server.publish(str(channel_id), cm.get_trending_games())
+        self.consoleminis[str(channel_id)] = cm
+
+        # The state-writer process is always fed by batches, they are cheaper to send
+        if self.batch_window > 0 or self.state_writer == 'process':
+            # Cheers are applied by batches, to absorb hype trains and bits rains
+            self.batchers[str(channel_id)] = CheerBatcher(cm.apply_cheers, batch_window=self.batch_window,
+                                                          batch_max_size=self.batch_max_size, log=self.log)
+
+    def get_topic_chunks(self):
+        """
+        Pack our topics on as few PubSub connections as Twitch allows.
+        """
+        topics = self.get_topics()
+        return [topics[index:index + self.topics_per_connection]
+                for index in range(0, len(topics), self.topics_per_connection)]
+
+    def _run_threads(self):
+        """
+        Serve each topics chunk with its own WebSocketApp: the first one in this thread,
+        the others in their own threads.
+        """
+        chunks = self.get_topic_chunks()
+        self.connections = [None] * len(chunks)
+        self.topics_of = {}
+        for index, topics in enumerate(chunks[1:], 1):
+            thread.start_new_thread(self._serve_connection, (index, topics))
+        self._serve_connection(0, chunks[0])
+
+    def _serve_connection(self, index, topics):
+        """
+        Run a WebSocketApp for topics, and a new one each time the connection is lost,
+        after a backoff delay, until we shutdown.
+        """
+        attempt = 0
+        while True:
+            ws = websocket.WebSocketApp(
+                self.ws_host,
+                on_message=self.on_message,
+                on_error=self.on_error,
+                on_close=lambda _: self.log.info("Connection closed")
+            )
+            ws.on_open = self.on_open
+            with self._connections_lock:
+                if self._closing.is_set():
+                    break
+                self.connections[index] = ws
+                self.topics_of[ws] = topics
+            if index == 0:
+                self.twitch.ws = ws
+
+            ws.run_forever()
+            with self._connections_lock:
+                del self.topics_of[ws]
+            self.ping_sent_at.pop(ws, None)
+            if self._closing.is_set():
+                break
+
+            if ws in self._reconnect_requested:
+                # PubSub asked for it, we already know where to go
+                self._reconnect_requested.discard(ws)
+                attempt = 0
+                continue
+            if ws in self._opened:
+                # Only back off further while we can't connect at all
+                self._opened.discard(ws)
+                attempt = 0
+            delay = backoff_delay(attempt, self.reconnect_backoff, self.reconnect_backoff_max)
+            attempt += 1
+            self.log.warning('PubSub connection lost, reconnecting in {:.1f}s'.format(delay))
+            if self._closing.wait(delay):
+                break
+        self.log.info('Terminating...')
+
+    def _run_asyncio(self):
+        """
+        Run our PubSub connection as tasks of an asyncio event loop,
+        instead of WebSocketApp.run_forever and its threads.
+        """
+        import asyncio
+        from aiopubsub import AsyncPubSubClient, run_clients
+
+        self.loop = asyncio.new_event_loop()
+        self.clients = [AsyncPubSubClient(self.ws_host, topics, self.access_token, self.on_message,
+                                          ping_interval=self.ping_interval, log=self.log, on_ping=self.on_ping,
+                                          pong_pending=self.pong_pending, pong_timeout=self.pong_timeout,
+                                          backoff=self.reconnect_backoff, backoff_max=self.reconnect_backoff_max)
+                        for topics in self.get_topic_chunks()]
+        try:
+            run_clients(self.loop, self.clients)
+        finally:
+            self.loop.close()
 
     def shutdown(self):
         self.log.critical('Waiting for threads to go away...')
-        self.twitch.ws.close()
+        self._closing.set()
+        if self.pubsub_client == 'asyncio':
+            for client in self.clients:
+                self.loop.call_soon_threadsafe(client.close)
+        else:
+            with self._connections_lock:
+                for ws in self.connections:
+                    if ws is not None:
+                        ws.close()
+        for batcher in self.batchers.values():
+            batcher.close()
+        # Persist whatever ConsoleMini still holds in memory
+        for cm in self.consoleminis.values():
+            cm.close()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.flush_log()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
+        if self.overlay_server is not None:
+            self.overlay_server.close()
+            self.overlay_server = None
+        profiling.stop_session()
+        if self.tracer is not None:
+            self.tracer.close()
+            self.tracer = None
+
+    def start_profiling(self):
+        """
+        Profile the next profile_events events, or profile_seconds seconds (whichever comes first),
+        then write their stats to a dated .prof file in profile_dir.
+        With a state-writer process, only this process is profiled.
+        """
+        filepath = os.path.join(self.profile_dir, 'profile-{}.prof'.format(
+            datetime.now().strftime('%Y-%m-%d-%H%M%S')))
+        self.log.info('Profiling for {}s or {} events, stats will be written to {}'.format(
+            self.profile_seconds or 'unlimited', self.profile_events or 'unlimited', filepath))
+        return profiling.start_session(filepath, seconds=self.profile_seconds, events=self.profile_events,
+                                       log=self.log)
+
+    def flush_log(self):
+        """
+        Write every queued log record, then keep serving the next ones.
+        """
+        if self.log_listener is not None:
+            # stop() handles every record already queued, and flushes the handlers
+            self.log_listener.stop()
+            self.log_listener.start()
+
+    def get_channel_id(self, channel_name=None):
+        channel_name = channel_name or self.channel_name
+        channel_ids = self.token_cache.setdefault('channel_ids', {})
+        if channel_name in channel_ids:
+            return channel_ids[channel_name]
 
-    def get_channel_id(self):
         try:
-            return self.twitch.get_channel(self.channel_name).__dict__['twitchid']
+            channel_id = self.twitch.get_channel(channel_name).__dict__['twitchid']
         except:
             raise TwitchGetDataException
+        channel_ids[channel_name] = channel_id
+        self.save_token_cache()
+        return channel_id
 
     def twitch_login(self):
         self.twitch.start_login_server()
         url = self.twitch.get_auth_url()
         webbrowser.open(url)
 
-        if self.first_run:
-            time.sleep(45)
-        else:
-            time.sleep(5)
+        # The login server sets our token as soon as Twitch redirects the browser to it
+        deadline = time.time() + self.login_timeout
+        while not self.twitch.authorized and time.time() < deadline:
+            time.sleep(0.1)
 
         self.twitch.shutdown_login_server()
+        if not self.twitch.authorized:
+            raise TwitchLoginException('No Twitch login after {} seconds'.format(self.login_timeout))
 
         self.log.info('Logged in as: {}'.format(self.twitch.current_user))
         self.log.debug('Using auth token: {}'.format(self.twitch.token['access_token']))
         return self.twitch.authorized
 
+    def use_cached_token(self):
+        """
+        Log in with the cached token, unless it's missing, (about to be) expired, or refused.
+        """
+        token = self.token_cache.get('token')
+        if not token or time.time() >= self.token_cache.get('expires_at', 0) - 60:
+            return False
+
+        try:
+            # pytwitcherapi fetches the current user with it, which fails with a revoked token
+            self.twitch.token = token
+        except Exception as e:
+            self.log.warning('Cached Twitch token was refused, logging in again: {}'.format(e))
+            self.twitch.token = None
+            return False
+
+        self.log.info('Logged in as: {} (cached token)'.format(self.twitch.current_user))
+        return self.twitch.authorized
+
+    def save_token_cache(self):
+        """
+        Cache our token, when it expires, and the channel_ids we looked up.
+        """
+        if not self.token_cache_filepath:
+            return
+
+        token = getattr(self, 'twitch', None) and self.twitch.token
+        if token and token != self.token_cache.get('token'):
+            self.token_cache['token'] = token
+            # Twitch tells us how long the token lasts, when it doesn't: token_max_age
+            self.token_cache['expires_at'] = time.time() + float(token.get('expires_in') or self.token_max_age)
+
+        atomic_write(self.token_cache_filepath, json.dumps(self.token_cache, indent=2, sort_keys=True))
+        try:
+            # It's a secret: only readable by us
+            os.chmod(self.token_cache_filepath, 0o600)
+        except OSError:
+            pass
+
+    def _load_token_cache(self):
+        if not self.token_cache_filepath:
+            return {}
+        try:
+            with open(self.token_cache_filepath, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
     def on_error(self, ws, error):
         self.log.critical(error)
 
+    @profiling.profiled
     def on_message(self, ws, message):
+        """
+        Decode a PubSub frame, and hand it to its frame_handlers.
+        Debug logs use lazy formatting: nothing is formatted unless DEBUG is on.
+        """
+        metrics.FRAMES_RECEIVED.inc()
+        with metrics.FRAME_DECODE_SECONDS.time():
+            message_dict = json_loads(message)
+        self.log.debug('message_dict: %s', message_dict)
+
+        handler = self.frame_handlers.get(message_dict.get('type'))
+        if handler is not None:
+            handler(ws, message_dict)
+
+    def on_pubsub_message(self, ws, message_dict):
         """
         This is a Bits event message example.
 
@@ -130,29 +456,89 @@ class TwitchBitsInfo(object):
             }
         }
         """
-        message_dict = json.loads(message)
-        self.log.debug('message_dict: {}'.format(str(message_dict)))
-
-        if (message_dict['type'] == 'MESSAGE' and
-           'channel-bitsevents' in message_dict['data']['topic']):
-
-            message_data = json.loads(message_dict['data']['message'])
-            self.log.debug('message_data: {}'.format(str(message_data)))
+        topic = message_dict['data']['topic']
+        if not topic.startswith(BITS_TOPIC_PREFIX):
+            return
+
+        # Topics are channel-bitsevents.<channel_id>, that's how we find the channel's ConsoleMini
+        channel_id = topic[len(BITS_TOPIC_PREFIX):]
+        cm = self.consoleminis.get(channel_id)
+        if cm is None:
+            self.log.warning('Got a message for an unknown channel: {}'.format(channel_id))
+            return
+
+        # The nested message is only decoded for the topics we serve
+        message_data = json_loads(message_dict['data']['message'])
+        self.log.debug('message_data: %s', message_data)
+
+        event_id = self.get_event_id(message_data)
+        if event_id is not None and self.recent_events.seen(event_id):
+            self.log.info('Ignoring a bits event we already got: {}'.format(event_id))
+            return
+
+        # We got a new bits message... let's deal with it !
+        # Do useful stuff, like update trending games for ConsoleMini
+        # The channel lets cmtool.py replay rebuild each channel's catalog from the same logs
+        self.log.info('New cheer from {} in channel {} !'.format(message_data['user_name'], channel_id))
+        self.log.info('Message: {}'.format(message_data['chat_message']))
+        self.log.info('Bits cheered: {}'.format(message_data['bits_used']))
+        if channel_id in self.batchers:
+            self.batchers[channel_id].add(Cheer(message_data['user_name'], message_data['chat_message'],
+                                                int(message_data['bits_used'])))
+        else:
+            cm.update_trending_games(message_data['chat_message'], int(message_data['bits_used']),
+                                     message_data['user_name'])
 
-            # We got a new bits message... let's deal with it !
-            # Do useful stuff, like update trending games for ConsoleMini
-            self.log.info('New cheer from {} !'.format(message_data['user_name']))
-            self.log.info('Message: {}'.format(message_data['chat_message']))
-            self.log.info('Bits cheered: {}'.format(message_data['bits_used']))
-            self.cm.update_trending_games(message_data['chat_message'], int(message_data['bits_used']))
+    def get_event_id(self, message_data):
+        """
+        What identifies a bits event: its PubSub message_id.
+        Events without one are never ignored: the same user may cheer the same bits
+        twice within a second, and its time is only precise to the second.
+        """
+        return message_data.get('message_id') or None
+
+    def on_ping(self, ws):
+        self.ping_sent_at[ws] = metrics.timer()
+
+    def pong_pending(self, ws):
+        return ws in self.ping_sent_at
+
+    def on_pong(self, ws, message_dict):
+        sent_at = self.ping_sent_at.pop(ws, None)
+        if sent_at is not None:
+            metrics.PING_RTT_SECONDS.observe(metrics.timer() - sent_at)
+        self.log.debug('PONG')
+
+    def on_response(self, ws, message_dict):
+        # Twitch answers every LISTEN, with an empty error when it went well
+        if message_dict.get('error'):
+            self.log.critical('Twitch PubSub refused our subscription: {}'.format(message_dict['error']))
+            if message_dict['error'] == 'ERR_BADAUTH' and self.token_cache.pop('token', None):
+                # Next start logs in again
+                self.save_token_cache()
+
+    def on_reconnect(self, ws, message_dict):
+        self.log.warning('Twitch PubSub asked us to reconnect')
+        # Dropping the connection is enough, we reconnect (and LISTEN again) when it's lost
+        if self.pubsub_client == 'asyncio':
+            ws.reconnect()
+        else:
+            self._reconnect_requested.add(ws)
+            ws.close()
 
     def on_open(self, ws):
+        if self._closing.is_set():
+            # We were shutdown while connecting
+            ws.close()
+            return
+        self._opened.add(ws)
+
         def run(*args):
             """
             send the sub message,
             and keep alive our connection to Twitch pubsub service
             """
-            self.sub_to_bitsevents()
+            self.sub_to_bitsevents(ws)
             self.keep_alive(ws)
 
         thread.start_new_thread(run, ())
@@ -161,33 +547,44 @@ class TwitchBitsInfo(object):
         def alive(*args):
             """
             send the ping message,
-            then wait 30 seconds and ping again...
-            so thread doesn't exit and socket isn't closed
+            then wait ping_interval seconds and ping again...
+            so thread doesn't exit and socket isn't closed,
+            until we shutdown
             """
-            while True:
-                self.ping()
-                time.sleep(30)
+            while not self._closing.is_set() and ws in self.topics_of:
+                self.ping(ws)
+                if self._closing.wait(self.pong_timeout):
+                    break
+                if self.pong_pending(ws):
+                    self.log.warning('No PONG from PubSub after {}s, reconnecting'.format(self.pong_timeout))
+                    ws.close()
+                    break
+                self._closing.wait(max(0, self.ping_interval - self.pong_timeout))
 
         thread.start_new_thread(alive, ())
 
-    def send_data(self, data):
+    def send_data(self, data, ws=None):
         """
         ws.send wants a json object, and not a Python obj, we take care of that.
         """
-        self.twitch.ws.send(json.dumps(data))
+        (ws or self.twitch.ws).send(json.dumps(data))
+
+    def get_topics(self):
+        return ["channel-bitsevents.{}".format(channel_id) for channel_id in sorted(self.consoleminis)]
 
-    def sub_to_bitsevents(self):
+    def sub_to_bitsevents(self, ws=None):
         data = {
             "type": "LISTEN",
             "data": {
-                "topics": ["channel-bitsevents.{}".format(self.channel_id)],
+                "topics": self.topics_of[ws or self.twitch.ws],
                 "auth_token": self.access_token,
             }
         }
-        self.send_data(data)
+        self.send_data(data, ws)
 
-    def ping(self):
-        self.send_data({"type": "PING"})
+    def ping(self, ws=None):
+        self.on_ping(ws or self.twitch.ws)
+        self.send_data({"type": "PING"}, ws)
 
     def _setup(self):
         try:
@@ -198,15 +595,29 @@ class TwitchBitsInfo(object):
         # pytwitcherapi.TwitchSession() fetch the Client ID from an envvar
         os.environ["PYTWITCHER_CLIENT_ID"] = self.twitch_client_id
 
+        try:
+            self.channels = [channel_name.strip()
+                             for channel_name in self.channels.split(',') if channel_name.strip()]
+        except AttributeError:
+            self.channels = []
+
         try:
             self.channel_name
         except AttributeError:
-            BadConfigurationException('channel_name')
+            if not self.channels:
+                BadConfigurationException('channel_name')
 
         try:
             self.db_filepath
         except AttributeError:
-            BadConfigurationException('db_filepath')
+            if not self.channels:
+                BadConfigurationException('db_filepath')
+
+        try:
+            # Twitch PubSub accepts up to 50 topics per connection
+            self.topics_per_connection = int(self.topics_per_connection)
+        except AttributeError:
+            self.topics_per_connection = 50
 
         try:
             self.ws_host
@@ -214,9 +625,196 @@ class TwitchBitsInfo(object):
             self.ws_host = "wss://pubsub-edge.twitch.tv"
 
         try:
-            self.first_run = bool(int(self.first_run))
+            self.flush_interval = float(self.flush_interval)
+        except AttributeError:
+            self.flush_interval = 5
+
+        try:
+            self.flush_every = int(self.flush_every)
+        except AttributeError:
+            self.flush_every = 100
+
+        try:
+            self.db_storage
+        except AttributeError:
+            self.db_storage = 'json'
+
+        try:
+            self.snapshot_every = int(self.snapshot_every)
+        except AttributeError:
+            self.snapshot_every = 1000
+
+        try:
+            self.trending_count = int(self.trending_count)
+        except AttributeError:
+            self.trending_count = 3
+
+        try:
+            self.trending_mode
+        except AttributeError:
+            self.trending_mode = 'total'
+
+        try:
+            self.trending_window = float(self.trending_window)
+        except AttributeError:
+            self.trending_window = 600
+
+        try:
+            self.trending_buckets = int(self.trending_buckets)
+        except AttributeError:
+            self.trending_buckets = 60
+
+        try:
+            self.trending_half_life = float(self.trending_half_life)
+        except AttributeError:
+            self.trending_half_life = 300
+
+        try:
+            self.cheerers_count = int(self.cheerers_count)
+        except AttributeError:
+            self.cheerers_count = 0
+
+        try:
+            self.cheerers_mode
+        except AttributeError:
+            self.cheerers_mode = 'approximate'
+
+        try:
+            self.cheerers_capacity = int(self.cheerers_capacity)
+        except AttributeError:
+            self.cheerers_capacity = 1000
+
+        try:
+            self.chat_parser
+        except AttributeError:
+            self.chat_parser = 'legacy'
+
+        try:
+            self.multi_cm
+        except AttributeError:
+            self.multi_cm = 'first'
+
+        try:
+            self.batch_window = float(self.batch_window)
+        except AttributeError:
+            self.batch_window = 0
+
+        try:
+            self.batch_max_size = int(self.batch_max_size)
+        except AttributeError:
+            self.batch_max_size = 50
+
+        try:
+            self.pubsub_client
+        except AttributeError:
+            self.pubsub_client = 'thread'
+
+        try:
+            self.ping_interval = float(self.ping_interval)
+        except AttributeError:
+            self.ping_interval = 30
+
+        try:
+            # Reconnection delays grow from reconnect_backoff up to reconnect_backoff_max seconds
+            self.reconnect_backoff = float(self.reconnect_backoff)
+        except AttributeError:
+            self.reconnect_backoff = 1.0
+
+        try:
+            self.reconnect_backoff_max = float(self.reconnect_backoff_max)
+        except AttributeError:
+            self.reconnect_backoff_max = 120.0
+
+        try:
+            # Twitch asks us to reconnect when a PONG takes more than 10 seconds
+            self.pong_timeout = float(self.pong_timeout)
+        except AttributeError:
+            self.pong_timeout = 10
+
+        try:
+            # How many recent bits event ids we remember, to ignore duplicates
+            self.dedupe_size = int(self.dedupe_size)
+        except AttributeError:
+            self.dedupe_size = 1000
+
+        try:
+            # 'inline' applies cheers in this process,
+            # 'process' hands them to a state-writer process owning ConsoleMini
+            self.state_writer
+        except AttributeError:
+            self.state_writer = 'inline'
+
+        try:
+            self.metrics_port = int(self.metrics_port)
+        except AttributeError:
+            self.metrics_port = 0
+
+        try:
+            self.metrics_host
+        except AttributeError:
+            self.metrics_host = '127.0.0.1'
+
+        try:
+            self.overlay_port = int(self.overlay_port)
+        except AttributeError:
+            self.overlay_port = 0
+
+        try:
+            self.overlay_host
+        except AttributeError:
+            self.overlay_host = '127.0.0.1'
+
+        try:
+            # Overlays may get the trending games from the overlay server only
+            self.trending_files = bool(int(self.trending_files))
+        except AttributeError:
+            self.trending_files = True
+
+        try:
+            # Where the OAuth token and channel_ids are cached between runs (empty disables the cache)
+            self.token_cache_filepath
+        except AttributeError:
+            self.token_cache_filepath = 'twitch_token.json'
+
+        try:
+            # How long a token lasts, when Twitch doesn't tell us
+            self.token_max_age = float(self.token_max_age)
+        except AttributeError:
+            self.token_max_age = 7 * 24 * 3600
+
+        try:
+            # How long we wait for the user to log in
+            self.login_timeout = float(self.login_timeout)
+        except AttributeError:
+            self.login_timeout = 120
+
+        try:
+            # Profile sessions: started from the Tk app, or on start with profile_on_start,
+            # they last profile_seconds or profile_events (0 is unlimited, both 0 is until shutdown)
+            self.profile_on_start = bool(int(self.profile_on_start))
+        except AttributeError:
+            self.profile_on_start = False
+
+        try:
+            self.profile_seconds = float(self.profile_seconds)
+        except AttributeError:
+            self.profile_seconds = 30
+
+        try:
+            self.profile_events = int(self.profile_events)
+        except AttributeError:
+            self.profile_events = 0
+
+        try:
+            self.profile_dir
+        except AttributeError:
+            self.profile_dir = '.'
+
+        try:
+            # Where the per stage timings are traced (empty disables it)
+            self.trace_filepath
         except AttributeError:
-            self.first_run = True
+            self.trace_filepath = ''
 
         try:
             self.verbose = bool(int(self.verbose))
@@ -224,6 +822,7 @@ class TwitchBitsInfo(object):
             self.verbose = False
 
         self._setup_log(self.verbose)
+        self.token_cache = self._load_token_cache()
 
     def _setup_log(self, verbose):
         self.log = logging.getLogger('twitch_bits_info')
@@ -233,7 +832,8 @@ class TwitchBitsInfo(object):
         steam_handler.setFormatter(formatter)
 
         date_now = datetime.now().strftime("%Y-%m-%d")
-        file_handler = logging.FileHandler(filename='{}.log'.format(date_now))
+        self.log_filepath = os.path.abspath('{}.log'.format(date_now))
+        file_handler = BatchedFileHandler(filename=self.log_filepath)
         file_handler.setFormatter(formatter)
 
         if verbose:
@@ -245,8 +845,8 @@ class TwitchBitsInfo(object):
             steam_handler.setLevel(logging.INFO)
             file_handler.setLevel(logging.INFO)
 
-        self.log.addHandler(steam_handler)
-        self.log.addHandler(file_handler)
+        # Handlers do their I/O in a listener thread, logging only costs us an enqueue
+        self.log_listener = start_queue_logging(self.log, [steam_handler, file_handler])
 
         self.log.info('Starting app!')
         return self.log
@@ -257,7 +857,7 @@ class TwitchBitsInfo(object):
 
         return dict(self.config.items('config'))
 
-    def _write_config(self, option, value):
-        self.config.set('config', option, str(value))
+    def _write_config(self, option, value, section='config'):
+        self.config.set(section, option, str(value))
         with open('config.ini', 'r+') as f:
             self.config.write(f)